@@ -0,0 +1,59 @@
+# benchmarks/bench_fetch_modes.py
+# Compara o modo de leitura por dicionário com o modo colunar de DBHandler.execute_query.
+# Uso (a partir da raiz do projeto): python benchmarks/bench_fetch_modes.py [filial] [repeticoes]
+import configparser
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from db_handler import DBHandler, PRODUCT_DTYPES, CLIENT_DTYPES
+
+
+def _measure(func, repeats):
+    """Executa func repetidas vezes e retorna (mediana em segundos, último resultado)."""
+    timings = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def _report(name, db_handler, query, dtypes, repeats):
+    dict_time, dict_df = _measure(lambda: db_handler.execute_query(query), repeats)
+    col_time, col_df = _measure(lambda: db_handler.execute_query(query, columnar=True, dtypes=dtypes), repeats)
+
+    dict_mem = dict_df.memory_usage(deep=True).sum() / 1024
+    col_mem = col_df.memory_usage(deep=True).sum() / 1024
+    gain = (dict_time - col_time) / dict_time * 100 if dict_time else 0.0
+
+    print(f"\n{name} ({len(col_df)} linhas, mediana de {repeats} execuções)")
+    print(f"  dicionário: {dict_time * 1000:8.1f} ms  {dict_mem:10.1f} KiB")
+    print(f"  colunar   : {col_time * 1000:8.1f} ms  {col_mem:10.1f} KiB")
+    print(f"  ganho     : {gain:7.1f} %")
+
+
+def main():
+    filial = sys.argv[1] if len(sys.argv) > 1 else 1
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    config = configparser.ConfigParser()
+    config.read('config/config.ini')
+    db_handler = DBHandler(config['Database'])
+
+    try:
+        products_query = db_handler._available_products_query(filial)
+        _report("Produtos disponíveis", db_handler, products_query, PRODUCT_DTYPES, repeats)
+
+        clients_query = db_handler._clientes_query()
+        _report("Clientes", db_handler, clients_query, CLIENT_DTYPES, repeats)
+    finally:
+        db_handler.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# benchmarks/smoke_simulator.py
+# Execução de fumaça dos fluxos de teste (DAV e Montagem de Carga) no simulador do
+# Guardian, com um banco em memória e a política de seleção aleatória: não precisa
+# de Windows, do Guardian nem do MySQL. Cada execução precisa terminar com sucesso,
+# sem teclas desviadas por diálogos e com os valores digitados gravados no documento.
+# Uso (a partir da raiz do projeto): python benchmarks/smoke_simulator.py [execucoes] [chance_de_dialogo]
+import configparser
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from db_handler import ChunkBuffer, ProductAttributes
+import selection_policy
+import spans
+import ui_driver
+import wait_engine
+from tests import test_dav_creation
+from tests import test_load_assembly
+
+
+class SmokeDB:
+    """Respostas fixas para as consultas feitas pelos fluxos (mesma interface do DBHandler)."""
+    PRODUCTS = pd.DataFrame({
+        'codigo_produto': ['1001', '1002', '1003', '1004', '1005', '1006'],
+        'nome_produto': ['Cimento', 'Areia', 'Tijolo', 'Telha', 'Cal', 'Brita'],
+        'estoquedisponivel': [50.0, 8.0, 300.0, 0.0, 12.0, 25.0],
+    })
+    UNITS = {'1001': 1, '1002': 2, '1003': 1, '1004': 1, '1005': 3, '1006': 1}
+    FRACTIONS = {'1003': 10.0, '1006': 2.5}
+
+    def __init__(self, parameters):
+        self.parameters = parameters
+
+    def prefetch(self, **calls):
+        futures = {}
+        for name, call in calls.items():
+            futures[name] = Future()
+            futures[name].set_result(call())
+        return futures
+
+    def prefetch_chunks(self, factory, keep_columns=None):
+        buffer = ChunkBuffer(keep_columns)
+        for chunk in factory():
+            buffer.put(chunk)
+        buffer.finish()
+        return buffer
+
+    def iter_available_products(self, filcodigo, chunk_size=2):
+        for start in range(0, len(self.PRODUCTS), chunk_size):
+            yield self.PRODUCTS.iloc[start:start + chunk_size].reset_index(drop=True)
+
+    def get_active_filiais_count(self):
+        return 1
+
+    def get_naturezas_operacao(self):
+        return pd.DataFrame({'codigo_natureza': ['5102', '5405'], 'descricao': ['Venda', 'Venda ST']})
+
+    def get_clientes(self):
+        return pd.DataFrame({'codigo_cliente': ['201', '202', '203'], 'nome_cliente': ['Ana', 'Bruno', 'Carla']})
+
+    def get_vendedores(self):
+        return pd.DataFrame({'codigo_colaborador': ['31', '32'], 'nome_vendedor': ['Davi', 'Eva']})
+
+    def get_all_formas_pagamento(self):
+        return pd.DataFrame({'codigo_forma': ['1', '2', '3'], 'descricao': ['Dinheiro', 'Cartão', 'Boleto']})
+
+    def get_formas_pagamento(self, cliente_code):
+        return pd.DataFrame()
+
+    def get_condicoes_pagamento(self, cliente_code, forma_code):
+        return pd.DataFrame()
+
+    def get_all_condicoes_pagamento(self, forma_code):
+        return pd.DataFrame({'codigo_condicao': ['10', '30'], 'descricao': ['À vista', '30 dias']})
+
+    def load_parameter_snapshot(self, filial_code=None, natureza_code=None):
+        pass
+
+    def get_field_values(self, table, fields, condition_field=None, condition_value=None, filial_code=None):
+        return {field: self.parameters.get(field, 0) for field in fields}
+
+    def check_field_value(self, table, field, condition_field=None, condition_value=None, filial_code=None):
+        return self.parameters.get(field, 0)
+
+    def get_product_attributes(self, product_codes, catalog_df=None):
+        stock = dict(zip(catalog_df['codigo_produto'], catalog_df['estoquedisponivel']))
+        return {
+            code: ProductAttributes(code, self.UNITS[code], self.FRACTIONS.get(code, 0.0), stock[code])
+            for code in product_codes
+        }
+
+    def get_sales_orders_for_today(self):
+        return pd.DataFrame({'ped_numero': ['7001', '7002', '7003'], 'ped_spvcodigo': ['1', '1', '2']})
+
+
+# Parâmetros do Guardian que levam pelos ramos com mais diálogos e esperas
+PARAMETERS = {
+    'Nat_cfgvendedor': 3, 'Nat_DatEmisPed': 1, 'nat_vultpreco': 1, 'Nat_LcLtPeds': 1,
+    'pa2_vultpreco': 1, 'pa2_infacreped': 1, 'pa2_infdescped': 1,
+    'pa4_tipoentit': 0, 'pa5_digcomisDav': 1,
+}
+
+
+def _dav_values(choices):
+    """Valores que o fluxo de DAV digita e grava, na ordem, a partir das escolhas da política."""
+    values = [choices['Seleção de Natureza'], choices['Seleção de Cliente'], choices['Seleção de Vendedor'],
+              choices['Seleção de Forma de Pagamento'], choices['Seleção de Condição de Pagamento']]
+    for code in choices['Seleção de Produtos para Lançamento']:
+        values.append(code)
+        quantity = choices[f"Quantidade do produto {code}"]
+        if code in SmokeDB.FRACTIONS:
+            quantity = quantity * SmokeDB.FRACTIONS[code]
+        values.append(str(quantity).replace('.', ','))
+    return values
+
+
+def _load_values(choices):
+    return [str(code) for code in choices['Seleção de Pedidos para Carga'][:1]]
+
+
+FLOWS = (
+    ('dav_creation', test_dav_creation.run, 'dav_inclusion_window', _dav_values),
+    ('load_assembly', test_load_assembly.run, 'logistics_window', _load_values),
+)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    probability = sys.argv[2] if len(sys.argv) > 2 else '0.2'
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(message)s')
+
+    config = configparser.ConfigParser()
+    config.read('config/config.ini')
+    with open('config/selectors.json', 'r', encoding='utf-8') as f:
+        selectors = json.load(f)
+    config['Selection']['policy'] = 'random'
+    config['Selection']['scenario_dir'] = ''
+    config['Spans']['enabled'] = 'false'
+    config['UI']['driver'] = 'simulator'
+    config['UI']['simulator_dialog_probability'] = probability
+    config['UI']['simulator_authorization_probability'] = probability
+
+    wait_engine.configure(config['Waits'])
+    spans.configure(config['Spans'])
+    failures = 0
+    try:
+        for name, run, screen, expected_values in FLOWS:
+            for seed in range(1, runs + 1):
+                config['UI']['simulator_seed'] = str(seed)
+                config['Selection']['seed'] = str(seed)
+                ui_driver.configure(config, selectors)
+                policy = selection_policy.configure(config['Selection'])
+                simulator = ui_driver.get_driver().driver.simulator
+
+                start = time.perf_counter()
+                succeeded = run(SmokeDB(PARAMETERS), selectors, config)
+                elapsed = time.perf_counter() - start
+                problems = [] if succeeded else ['o fluxo não terminou com sucesso']
+                if succeeded:
+                    try:
+                        simulator.assert_document(screen, expected_values(policy.choices))
+                    except AssertionError as e:
+                        problems.append(str(e))
+                stats = simulator.summary()
+                failures += bool(problems)
+                print(
+                    f"{name} semente {seed}: {'OK' if not problems else 'FALHOU'} em {elapsed:.2f}s, "
+                    f"{stats['keys']} teclas, {stats['dialogs_opened']} diálogo(s), "
+                    f"{stats['authorizations']} autorização(ões), {stats['misrouted_keys']} desviada(s)"
+                )
+                for problem in problems:
+                    print(f"    {problem}")
+                ui_driver.close()
+    finally:
+        ui_driver.close()
+    print(f"{failures} falha(s).")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,441 @@
 import mysql.connector
 from mysql.connector import pooling
+import numpy as np
 import pandas as pd
 import logging
+import threading
 import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import spans
+from db_metrics import DBMetrics, estimate_bytes, fingerprint
+from query_recorder import QueryRecorder, QueryReplayer
+from reference_cache import ReferenceDataCache
+from statement_cache import PreparedStatementCache
+
+# Tabelas de parâmetros carregadas no snapshot de cada execução
+SNAPSHOT_PARAMETER_TABLES = ('parametro2', 'parametro4', 'parametro5')
+
+# Tipos das colunas numéricas usados no modo colunar (evita colunas 'object' com Decimal)
+PRODUCT_DTYPES = {
+    'pfi_estpenconfi': 'float64',
+    'pfi_estpenentre': 'float64',
+    'pfi_estpenentra': 'float64',
+    'unp_fatestoque': 'float64',
+    'unp_quantidade': 'float64',
+    'EstoqFiscal': 'float64',
+    'EstoqueDisponivel': 'float64',
+    'estpenconfiloc': 'float64',
+    'estpenentreloc': 'float64',
+    'estpenentraloc': 'float64',
+}
+CLIENT_DTYPES = {'Credito': 'float64'}
+FRAC_MINIMA_DTYPES = {'frac_minima': 'float64'}
+PRODUCT_ATTRIBUTE_DTYPES = {'total_unidades_ativas': 'float64', 'frac_minima': 'float64'}
+
+# Quantidade máxima de códigos por cláusula IN (...) no carregamento em lote
+PRODUCT_ATTRIBUTES_CHUNK_SIZE = 1000
+
+# Atributos de um produto selecionado, indexados pelo código normalizado
+ProductAttributes = namedtuple('ProductAttributes', ['codigo', 'unidades_ativas', 'frac_minima', 'estoque_disponivel'])
+
+# Sentinela para diferenciar "não está no snapshot" de um valor NULL do banco
+_SNAPSHOT_MISS = object()
+
+def _column_array(values, dtype=None):
+    """Converte os valores de uma coluna, aplicando o dtype quando informado."""
+    if dtype is None:
+        return values
+    if np.dtype(dtype).kind == 'f':
+        # NULL vira NaN; Decimal e int são convertidos direto para float
+        return np.fromiter((np.nan if v is None else v for v in values), dtype=dtype, count=len(values))
+    return pd.array(values, dtype=dtype)
+
+def _rows_to_frame(description, rows, dtypes=None):
+    """Monta um DataFrame coluna a coluna a partir das tuplas e do cursor.description."""
+    columns = [column[0] for column in description]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    dtypes = dtypes or {}
+    data = {
+        name: _column_array(values, dtypes.get(name))
+        for name, values in zip(columns, zip(*rows))
+    }
+    return pd.DataFrame(data, columns=columns)
+
+class ChunkBuffer:
+    """
+    Recebe em segundo plano os blocos de uma consulta em streaming.
+    Pode ser iterado (por um único consumidor) enquanto os blocos ainda chegam
+    (ex.: para alimentar um diálogo de seleção); cada bloco é descartado depois
+    de entregue. Se keep_columns for informado, só essas colunas ficam guardadas
+    até o fim, e to_frame() espera o fim e as devolve em um único DataFrame.
+    """
+    def __init__(self, keep_columns=None):
+        self.keep_columns = {column.lower() for column in keep_columns or ()}
+        self._pending = deque()
+        self._kept = []
+        self._done = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    def put(self, chunk):
+        kept = None
+        if self.keep_columns:
+            kept = chunk[[column for column in chunk.columns if str(column).lower() in self.keep_columns]]
+        with self._condition:
+            self._pending.append(chunk)
+            if kept is not None:
+                self._kept.append(kept)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        with self._condition:
+            self._done = True
+            self._error = error
+            self._condition.notify_all()
+
+    def __iter__(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._done)
+                if not self._pending:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                chunk = self._pending.popleft()
+            yield chunk
+
+    def to_frame(self):
+        """
+        Espera o fim da consulta e devolve as colunas guardadas (keep_columns) de
+        todos os blocos em um único DataFrame. Os blocos ainda não percorridos são descartados.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._done)
+            if self._error is not None:
+                raise self._error
+            self._pending.clear()
+            chunks = list(self._kept)
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks, ignore_index=True)
 
 class DBHandler:
-    def __init__(self, config):
-        # Dentro da função __init__ em db_handler.py
-        try:
-            # Usamos config.get('port', 3306) para usar a porta do arquivo .ini
-            # ou a porta 3306 como padrão se não for encontrada.
-            db_port = int(config.get('port', 3306))
-
-            self.pool = pooling.MySQLConnectionPool(
-                pool_name=config['pool_name'],
-                pool_size=int(config['pool_size']),
-                host=config['host'],
-                user=config['user'],
-                password=config['password'],
-                database=config['database'],
-                port=db_port,
-                auth_plugin='mysql_native_password',  
-                ssl_disabled=True                     
+    def __init__(self, config, cache_config=None):
+        # Modo de operação: 'live' (padrão), 'record' (grava as queries em fixture)
+        # ou 'replay' (responde a partir da fixture, sem acessar o MySQL)
+        self.mode = config.get('mode', 'live').strip().lower()
+        fixture_path = config.get('fixture_path', 'fixtures/db_session.pkl.gz')
+        self.recorder = QueryRecorder(fixture_path) if self.mode == 'record' else None
+        self.replayer = QueryReplayer(fixture_path) if self.mode == 'replay' else None
+
+        # Snapshot de parâmetros da execução atual (ver load_parameter_snapshot)
+        self._param_snapshot = None
+        self.metrics = DBMetrics()
+
+        # Cache de prepared statements (0 desativa). O reset de sessão descarta os
+        # statements, então eles vivem num pool separado, sem reset, usado só pelas
+        # consultas preparadas: conexões em autocommit e com a sessão READ ONLY, para
+        # que nenhuma transação ou alteração de sessão passe de um uso para o outro.
+        # O pool principal (e a pré-busca) continua resetando a sessão.
+        cache_size = int(config.get('prepared_cache_size', 32))
+        self.statement_cache = PreparedStatementCache(cache_size) if cache_size > 0 else None
+        self._readonly_sessions = set()
+
+        pool_size = int(config['pool_size'])
+        # Tempo máximo esperando uma conexão livre quando o pool está todo em uso
+        self.pool_timeout = float(config.get('pool_timeout', 10))
+        # Executor da pré-busca: deixa uma conexão livre para a thread principal
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=max(1, pool_size - 1), thread_name_prefix='db_prefetch'
+        )
+
+        self.pool = None
+        self.lookup_pool = None
+        if self.replayer is None:
+            # Dentro da função __init__ em db_handler.py
+            try:
+                # Usamos config.get('port', 3306) para usar a porta do arquivo .ini
+                # ou a porta 3306 como padrão se não for encontrada.
+                db_port = int(config.get('port', 3306))
+
+                connection_args = dict(
+                    host=config['host'],
+                    user=config['user'],
+                    password=config['password'],
+                    database=config['database'],
+                    port=db_port,
+                    auth_plugin='mysql_native_password',  
+                    ssl_disabled=True                     
+                )
+                self.pool = pooling.MySQLConnectionPool(
+                    pool_name=config['pool_name'],
+                    pool_size=pool_size,
+                    pool_reset_session=True,
+                    **connection_args
+                )
+                if self.statement_cache is not None:
+                    self.lookup_pool = pooling.MySQLConnectionPool(
+                        pool_name=f"{config['pool_name']}_lookup",
+                        pool_size=int(config.get('lookup_pool_size', 2)),
+                        pool_reset_session=False,
+                        autocommit=True,
+                        **connection_args
+                    )
+                logging.info(f"Pool de conexões com MySQL para {config['host']}:{db_port} criado com sucesso.")
+            except mysql.connector.Error as err:
+                logging.error(f"Erro ao criar o pool de conexões com o MySQL: {err}")
+                raise
+
+        # Cache persistente de dados de referência (seção [Cache] do config.ini).
+        # Fica desligado ao gravar/reproduzir fixtures para que elas contenham todas as queries.
+        self.reference_cache = None
+        self._cache_version_checked_at = None
+        self._version_check_interval = 300
+        if self.mode != 'live':
+            logging.info(f"Modo '{self.mode}' ativo: cache de dados de referência desativado.")
+        elif cache_config is not None and cache_config.getboolean('enabled', fallback=False):
+            self.reference_cache = ReferenceDataCache(
+                cache_dir=cache_config.get('directory', 'cache'),
+                ttl_seconds=float(cache_config.get('ttl_seconds', 86400)),
+                max_size_mb=float(cache_config.get('max_size_mb', 256)),
+                environment=f"{config['host']}:{int(config.get('port', 3306))}/{config['database']}"
             )
-            logging.info(f"Pool de conexões com MySQL para {config['host']}:{db_port} criado com sucesso.")
-            # ...
+            self._version_check_interval = float(cache_config.get('version_check_interval', 300))
+            logging.info(f"Cache de dados de referência ativo em '{self.reference_cache.path}'.")
+
+    def _get_connection(self, pool=None):
+        """
+        Obtém uma conexão do pool (o principal, se pool não for informado). O pool do
+        mysql-connector falha na hora quando está esgotado; aqui esperamos até
+        pool_timeout por uma conexão livre.
+        """
+        pool = pool or self.pool
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.pool_timeout
+        exhausted = False
+        while True:
+            try:
+                conn = pool.get_connection()
+                self.metrics.record_checkout(time.perf_counter() - start, exhausted)
+                return conn
+            except mysql.connector.errors.PoolError:
+                if not exhausted:
+                    exhausted = True
+                    logging.info("Pool de conexões esgotado; aguardando uma conexão livre...")
+                if time.monotonic() >= deadline:
+                    self.metrics.record_checkout(time.perf_counter() - start, exhausted)
+                    raise
+                time.sleep(0.01)
+
+    def prefetch(self, **calls):
+        """
+        Dispara em paralelo consultas independentes, ex.:
+        prefetch(naturezas=self.get_naturezas_operacao, clientes=self.get_clientes).
+        Retorna um dicionário {nome: Future}.
+        """
+        futures = {}
+        for name, call in calls.items():
+            futures[name] = self._prefetch_executor.submit(call)
+        logging.info(f"Pré-busca iniciada: {', '.join(calls)}.")
+        return futures
+
+    def prefetch_chunks(self, factory, keep_columns=None):
+        """
+        Consome em segundo plano o gerador devolvido por factory() (ex.:
+        lambda: self.iter_available_products(filial)) e retorna um ChunkBuffer
+        que já pode ser percorrido enquanto os blocos chegam. keep_columns: colunas
+        guardadas para to_frame() (ver ChunkBuffer).
+        """
+        buffer = ChunkBuffer(keep_columns)
+
+        def consume():
+            try:
+                for chunk in factory():
+                    buffer.put(chunk)
+            except Exception as e:
+                buffer.finish(error=e)
+                return
+            buffer.finish()
+
+        self._prefetch_executor.submit(consume)
+        return buffer
+
+    def execute_query(self, query, params=None, columnar=False, dtypes=None, prepared=False):
+        """
+        Executa uma query SELECT e retorna um DataFrame do Pandas.
+        Com columnar=True as linhas são lidas como tuplas e o DataFrame é montado
+        por coluna, aplicando o mapa opcional de dtypes.
+        Com prepared=True (e parâmetros informados) a query usa um prepared
+        statement do cache da conexão.
+        """
+        if self.replayer is not None:
+            return self.replayer.replay(query, params)
+
+        span_start = time.perf_counter()
+        start = None
+        # Prepared statements sempre devolvem tuplas, então seguem o caminho colunar
+        use_prepared = bool(prepared and params and self.statement_cache is not None)
+        try:
+            with self._get_connection(self.lookup_pool if use_prepared else None) as conn:
+                start = time.perf_counter()
+                if use_prepared:
+                    description, result = self._execute_prepared(conn, query, params)
+                else:
+                    with conn.cursor(dictionary=not columnar) as cursor:
+                        logging.info(f"Executando query: {query.strip().splitlines()[0]}...")
+                        cursor.execute(query, params)
+                        result = cursor.fetchall()
+                        description = cursor.description
+                elapsed = time.perf_counter() - start
+            self.metrics.record_query(query, elapsed, len(result), estimate_bytes(result))
+
+            if columnar or use_prepared:
+                df = _rows_to_frame(description, result, dtypes)
+            else:
+                df = pd.DataFrame(result) if result else pd.DataFrame()
         except mysql.connector.Error as err:
-            logging.error(f"Erro ao criar o pool de conexões com o MySQL: {err}")
-            raise
+            if start is not None:
+                self.metrics.record_query(query, time.perf_counter() - start, error=True)
+            logging.error(f"Erro ao executar query: {err}\nQuery: {query}")
+            df = pd.DataFrame()
+        spans.record(fingerprint(query)[:80], spans.DB, span_start, rows=len(df))
+
+        if self.recorder is not None:
+            self.recorder.record(query, params, df)
+        return df
+
+    def _execute_prepared(self, conn, query, params):
+        """
+        Executa a query com um statement do cache, preparando de novo uma vez em caso de erro.
+        Retorna (cursor.description, linhas).
+        """
+        # O pool entrega um wrapper; o cache é mantido por conexão física
+        cnx = getattr(conn, '_cnx', conn)
+        session = (id(cnx), cnx.connection_id)
+        if session not in self._readonly_sessions:
+            # O pool de consultas não reseta a sessão: ela fica só de leitura
+            with cnx.cursor() as cursor:
+                cursor.execute("SET SESSION TRANSACTION READ ONLY")
+            self._readonly_sessions.add(session)
+        logging.info(f"Executando query (preparada): {query.strip().splitlines()[0]}...")
+        for attempt in range(2):
+            cursor, sql = self.statement_cache.acquire(cnx, query)
+            try:
+                cursor.execute(sql, params)
+                result = cursor.fetchall()
+                return cursor.description, result
+            except mysql.connector.Error:
+                self.statement_cache.discard(cnx, query)
+                if attempt == 1:
+                    raise
+                logging.info("Falha no statement preparado em cache; preparando novamente...")
+
+    def get_statement_cache_stats(self):
+        """Retorna os contadores de hit/miss do cache de prepared statements."""
+        if self.statement_cache is None:
+            return {}
+        return self.statement_cache.stats()
+
+    def execute_query_chunks(self, query, params=None, chunk_size=2000, dtypes=None):
+        """
+        Executa uma query SELECT com cursor não bufferizado (server-side) e gera
+        DataFrames de até chunk_size linhas. A conexão fica reservada até o gerador
+        ser consumido por completo ou fechado.
+        """
+        if self.replayer is not None:
+            df = self.replayer.replay(query, params)
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size]
+            return
 
-    def execute_query(self, query, params=None):
-        """Executa uma query SELECT e retorna um DataFrame do Pandas."""
+        recorded_chunks = [] if self.recorder is not None else None
+        start_time = time.perf_counter()
+        first_row_time = None
+        total_rows = 0
+        total_bytes = 0
+        peak_chunk_bytes = 0
+        finished = False
+        error = False
         try:
-            with self.pool.get_connection() as conn:
-                with conn.cursor(dictionary=True) as cursor:
-                    logging.info(f"Executando query: {query.strip().splitlines()[0]}...")
+            with self._get_connection() as conn:
+                with conn.cursor(buffered=False) as cursor:
+                    logging.info(f"Executando query (streaming): {query.strip().splitlines()[0]}...")
                     cursor.execute(query, params)
-                    result = cursor.fetchall()
-                    return pd.DataFrame(result) if result else pd.DataFrame()
+                    try:
+                        while True:
+                            rows = cursor.fetchmany(chunk_size)
+                            if not rows:
+                                break
+                            if first_row_time is None:
+                                first_row_time = time.perf_counter() - start_time
+                            total_rows += len(rows)
+                            total_bytes += estimate_bytes(rows)
+                            chunk = _rows_to_frame(cursor.description, rows, dtypes)
+                            peak_chunk_bytes = max(peak_chunk_bytes, int(chunk.memory_usage(deep=True).sum()))
+                            if recorded_chunks is not None:
+                                recorded_chunks.append(chunk)
+                            yield chunk
+                        finished = True
+                    finally:
+                        if not finished:
+                            # O consumidor parou antes do fim: o protocolo exige ler o restante
+                            # antes de devolver a conexão ao pool.
+                            while cursor.fetchmany(chunk_size):
+                                pass
         except mysql.connector.Error as err:
-            logging.error(f"Erro ao executar query: {err}\nQuery: {query}")
-            return pd.DataFrame()
+            error = True
+            logging.error(f"Erro ao executar query em streaming: {err}\nQuery: {query}")
+            return
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.metrics.record_query(query, elapsed, total_rows, total_bytes, error=error)
+            spans.record(fingerprint(query)[:80], spans.DB, start_time, rows=total_rows, streaming=True)
+            if recorded_chunks is not None and finished:
+                # Só grava resultados completos; o replay reparte em blocos de novo
+                recorded = pd.concat(recorded_chunks, ignore_index=True) if recorded_chunks else pd.DataFrame()
+                self.recorder.record(query, params, recorded)
+            first_row_info = f"{first_row_time:.3f}s" if first_row_time is not None else "n/d"
+            logging.info(
+                f"Streaming finalizado: {total_rows} linhas em {elapsed:.3f}s "
+                f"(primeira linha em {first_row_info}, pico de memória por bloco: {peak_chunk_bytes / 1024:.1f} KiB)."
+            )
+
+    def _execute_cached(self, query, params=None, **kwargs):
+        """
+        Executa a query passando pelo cache persistente de dados de referência.
+        Resultados vazios não são gravados, pois também indicam erro na consulta.
+        """
+        if self.reference_cache is None:
+            return self.execute_query(query, params, **kwargs)
+
+        self._check_cache_version()
+        key = ReferenceDataCache.make_key(query, params)
+        df = self.reference_cache.get(key)
+        if df is not None:
+            logging.info(f"Cache de referência: {query.strip().splitlines()[0]}... ({len(df)} linhas)")
+            return df
+
+        df = self.execute_query(query, params, **kwargs)
+        if not df.empty:
+            self.reference_cache.put(key, df)
+        return df
+
+    def _check_cache_version(self):
+        """Confere a versão do banco no máximo uma vez por intervalo configurado."""
+        now = time.monotonic()
+        if self._cache_version_checked_at is not None and now - self._cache_version_checked_at < self._version_check_interval:
+            return
+        version_df = self.get_db_version()
+        if version_df.empty:
+            # Sem versão não há como validar o cache: melhor descartá-lo
+            logging.warning("Não foi possível obter a versão do banco. Limpando cache de referência.")
+            self.reference_cache.clear()
+            return
+        self.reference_cache.ensure_version(version_df.iloc[0, 0])
+        self._cache_version_checked_at = now
 
     def get_db_version(self):
         query = "SELECT NOV_VERSAO FROM novidade ORDER BY nov_codigo DESC LIMIT 1;"
@@ -55,7 +450,7 @@ class DBHandler:
         AND n.Nat_MDFCODIGO = 55 AND n.NAT_VENDAFUTURA = 0 AND n.NAT_CODIGO <> 'ORC'
         ORDER BY n.Nat_Desc;
         """
-        return self.execute_query(query)
+        return self._execute_cached(query)
 
     def check_field_value(self, table, field, condition_field, condition_value):
         if condition_field is not None and "parametro" not in field :
@@ -69,14 +464,16 @@ class DBHandler:
         return None
 
     def get_clientes(self):
-        query = """
+        return self._execute_cached(self._clientes_query(), columnar=True, dtypes=CLIENT_DTYPES)
+
+    def _clientes_query(self):
+        return """
         SELECT p.PES_CODIGO AS codigo_cliente, p.pes_razao AS nome_cliente, c.cli_limitecre AS Credito
         FROM cliente c JOIN pessoa p ON c.CLI_PESCODIGO = p.PES_CODIGO
         WHERE c.cli_limitecre > 0 AND p.PES_ATIVO = 1 AND c.cli_bloqfin = 0
         AND c.CLI_SITUAC1 = '' AND c.CLI_SITUAC2 = '' AND c.CLI_SITUAC3 = '' AND c.CLI_SITUAC4 = ''
         ORDER BY p.pes_razao;
         """
-        return self.execute_query(query)
 
     def get_vendedores(self):
         query = """
@@ -85,7 +482,7 @@ class DBHandler:
         JOIN cargo cg ON c.CLB_CRGCODIGO = cg.CRG_CODIGO
         WHERE c.CLB_ATIVO = 1 ORDER BY c.CLB_RAZAO;
         """
-        return self.execute_query(query)
+        return self._execute_cached(query)
 
     def get_formas_pagamento(self, cliente_codigo):
         query = """
@@ -118,14 +515,14 @@ class DBHandler:
         ORDER BY
             descricao;
         """
-        return self.execute_query(query, (cliente_codigo,cliente_codigo))
+        return self.execute_query(query, (cliente_codigo,cliente_codigo), prepared=True)
 
     def get_all_formas_pagamento(self):
         query = """
         SELECT FPG_CODIGO AS codigo_forma, FPG_DESC AS descricao FROM formapagto
         WHERE FPG_ATIVO = 1 AND fpg_habvenda = 1 AND fpg_receber = 1 ORDER BY FPG_DESC;
         """
-        return self.execute_query(query)
+        return self._execute_cached(query)
         
     def get_condicoes_pagamento(self, cliente_codigo, forma_pagamento_codigo):
         query = """
@@ -169,7 +566,7 @@ WHERE
 ORDER BY
     descricao;
         """
-        return self.execute_query(query, (cliente_codigo, forma_pagamento_codigo,forma_pagamento_codigo,cliente_codigo))
+        return self.execute_query(query, (cliente_codigo, forma_pagamento_codigo,forma_pagamento_codigo,cliente_codigo), prepared=True)
 
     def get_all_condicoes_pagamento(self, forma_pagamento_codigo):
         query = """
@@ -181,10 +578,22 @@ ORDER BY
         )
         ORDER BY cp.CPG_DESC;
         """
-        return self.execute_query(query, (forma_pagamento_codigo,))
+        return self.execute_query(query, (forma_pagamento_codigo,), prepared=True)
     
     def get_available_products(self,filcodigo):
-        query = f"""
+        return self.execute_query(self._available_products_query(filcodigo), columnar=True, dtypes=PRODUCT_DTYPES)
+
+    def iter_available_products(self, filcodigo, chunk_size=2000):
+        """
+        Versão em streaming de get_available_products: devolve DataFrames de até
+        chunk_size linhas conforme chegam do servidor, sem carregar o resultado inteiro.
+        """
+        return self.execute_query_chunks(
+            self._available_products_query(filcodigo), chunk_size=chunk_size, dtypes=PRODUCT_DTYPES
+        )
+
+    def _available_products_query(self, filcodigo):
+        return f"""
 SELECT pro_desc AS nome_produto,
        pro_descdet,
        pro_referencia,
@@ -306,7 +715,6 @@ ORDER BY nome_produto,
          lcf_intext,
          lcf_permiteven;   
         """
-        return self.execute_query(query)
     
     def get_product_unit_counts(self, product_codes):
         if not product_codes:
@@ -342,8 +750,62 @@ ORDER BY nome_produto,
         FROM unidadepro
         WHERE unp_padestoque = 1 AND unp_procodigo IN ({format_strings});
         """
-        return self.execute_query(query, tuple(product_codes))
+        return self.execute_query(query, tuple(product_codes), columnar=True, dtypes=FRAC_MINIMA_DTYPES)
     
+    def get_product_attributes(self, product_codes, catalog_df=None, chunk_size=PRODUCT_ATTRIBUTES_CHUNK_SIZE):
+        """
+        Carrega em uma única consulta por bloco a quantidade de unidades ativas e a
+        fração mínima dos produtos. Listas grandes são divididas em blocos de
+        chunk_size códigos. Se catalog_df (resultado de get_available_products) for
+        informado, o estoque disponível também é preenchido.
+        Retorna {codigo_normalizado: ProductAttributes}.
+        """
+        codes = list(dict.fromkeys(str(code).strip() for code in product_codes))
+        if not codes:
+            return {}
+
+        stock_by_code = {}
+        if catalog_df is not None and not catalog_df.empty:
+            columns = {str(column).lower(): column for column in catalog_df.columns}
+            stock_by_code = dict(zip(
+                catalog_df[columns['codigo_produto']].astype(str).str.strip(),
+                catalog_df[columns['estoquedisponivel']]
+            ))
+
+        loaded = {}
+        for start in range(0, len(codes), chunk_size):
+            chunk = codes[start:start + chunk_size]
+            format_strings = ','.join(['%s'] * len(chunk))
+            query = f"""
+            SELECT
+                up.unp_procodigo AS codigo_produto,
+                SUM(CASE WHEN up.unp_ativo = 1 AND p.pro_ativo = 1 AND up.unp_unidade IS NOT NULL
+                         THEN 1 ELSE 0 END) AS total_unidades_ativas,
+                MAX(CASE WHEN up.unp_padestoque = 1 THEN up.unp_fracminima END) AS frac_minima
+            FROM unidadepro up
+            LEFT JOIN produto p ON p.pro_codigo = up.unp_procodigo
+            WHERE up.unp_procodigo IN ({format_strings})
+            GROUP BY up.unp_procodigo;
+            """
+            df = self.execute_query(query, tuple(chunk), columnar=True, dtypes=PRODUCT_ATTRIBUTE_DTYPES)
+            if df.empty:
+                continue
+            for code, units, frac in zip(df['codigo_produto'], df['total_unidades_ativas'], df['frac_minima']):
+                loaded[str(code).strip()] = (units, frac)
+
+        attributes = {}
+        for code in codes:
+            units, frac = loaded.get(code, (0, float('nan')))
+            stock = stock_by_code.get(code)
+            attributes[code] = ProductAttributes(
+                codigo=code,
+                unidades_ativas=0 if pd.isna(units) else int(units),
+                frac_minima=0.0 if pd.isna(frac) else float(frac),
+                estoque_disponivel=None if stock is None or pd.isna(stock) else float(stock),
+            )
+        logging.info(f"Atributos carregados para {len(attributes)} produto(s) em {-(-len(codes) // chunk_size)} consulta(s).")
+        return attributes
+
     def get_sales_orders_for_today(self):
         """Busca os pedidos de venda emitidos na data atual."""
         # Obtém a data atual no formato YYYYMMDD
@@ -372,7 +834,7 @@ ORDER BY nome_produto,
     def get_active_filiais_count(self):
         """Retorna a contagem de filiais ativas."""
         query = "SELECT COUNT(*) AS total_de_filiais_ativas FROM filial WHERE FIL_ATIVO = 1;"
-        df = self.execute_query(query)
+        df = self._execute_cached(query)
         if not df.empty:
             return df.iloc[0]['total_de_filiais_ativas']
         return 0
@@ -380,14 +842,77 @@ ORDER BY nome_produto,
     def get_active_filiais(self):
         """Retorna uma lista de filiais ativas."""
         query = "SELECT FIL_CODIGO as codigo_filial, FIL_RAZAO as nome_filial FROM filial WHERE FIL_ATIVO = 1 ORDER BY FIL_RAZAO;"
-        return self.execute_query(query)
+        return self._execute_cached(query)
 
-    # --- FUNÇÃO CHECK_FIELD_VALUE APRIMORADA ---
-    def check_field_value(self, table, field, condition_field=None, condition_value=None, filial_code=None):
+    # --- SNAPSHOT DE PARÂMETROS POR EXECUÇÃO ---
+    def load_parameter_snapshot(self, filial_code=None, natureza_code=None):
         """
-        Busca o valor de um campo específico em uma tabela.
-        Inclui lógica para filtrar por filial em tabelas de parâmetros.
+        Carrega uma única vez as linhas de parametro2/4/5 da filial e a linha da
+        natureza de operação selecionada. Enquanto o snapshot estiver carregado,
+        check_field_value responde essas consultas a partir da memória.
         """
+        tables = {}
+        for table in SNAPSHOT_PARAMETER_TABLES:
+            tables[table] = self._fetch_snapshot_row(table, filial_code=filial_code)
+        if natureza_code is not None:
+            tables['natoper'] = self._fetch_snapshot_row('natoper', 'Nat_Codigo', natureza_code)
+
+        self._param_snapshot = {
+            'filial_code': filial_code,
+            'natureza_code': natureza_code,
+            'tables': tables,
+        }
+        logging.info(f"Snapshot de parâmetros carregado (filial: {filial_code}, natureza: {natureza_code}).")
+
+    def refresh_parameter_snapshot(self):
+        """Recarrega o snapshot atual do banco, mantendo a mesma filial e natureza."""
+        if self._param_snapshot is None:
+            logging.warning("Nenhum snapshot de parâmetros carregado para atualizar.")
+            return
+        self.load_parameter_snapshot(self._param_snapshot['filial_code'], self._param_snapshot['natureza_code'])
+
+    def clear_parameter_snapshot(self):
+        """Descarta o snapshot; as próximas consultas voltam a ir ao banco."""
+        self._param_snapshot = None
+
+    def _fetch_snapshot_row(self, table, condition_field=None, condition_value=None, filial_code=None):
+        """Busca a linha completa usada pelo snapshot, com as colunas em minúsculas."""
+        where_clauses, params = self._build_where(table, condition_field, condition_value, filial_code)
+        query = f"SELECT * FROM {table}"
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+        query += " LIMIT 1"
+
+        df = self.execute_query(query, tuple(params) if params else None, prepared=True)
+        if df.empty:
+            return {}
+        return {str(column).lower(): value for column, value in df.iloc[0].to_dict().items()}
+
+    def _snapshot_lookup(self, table, field, condition_field=None, condition_value=None, filial_code=None):
+        """Retorna o valor do snapshot ou _SNAPSHOT_MISS se a consulta não for coberta por ele."""
+        snapshot = self._param_snapshot
+        if snapshot is None or table not in snapshot['tables']:
+            return _SNAPSHOT_MISS
+
+        if table == 'natoper':
+            if condition_field is None or condition_field.lower() != 'nat_codigo':
+                return _SNAPSHOT_MISS
+            if str(condition_value) != str(snapshot['natureza_code']):
+                return _SNAPSHOT_MISS
+        else:
+            if condition_field is not None:
+                return _SNAPSHOT_MISS
+            if str(filial_code) != str(snapshot['filial_code']):
+                return _SNAPSHOT_MISS
+
+        row = snapshot['tables'][table]
+        if not row:
+            # A consulta original também não encontraria nada
+            return None
+        return row.get(field.lower(), _SNAPSHOT_MISS)
+
+    def _build_where(self, table, condition_field=None, condition_value=None, filial_code=None):
+        """Monta as cláusulas WHERE (e seus parâmetros) usadas nas consultas de campo."""
         params = []
         where_clauses = []
 
@@ -405,6 +930,21 @@ ORDER BY nome_produto,
                 where_clauses.append(f"{filial_column} = %s")
                 params.append(filial_code)
 
+        return where_clauses, params
+
+    # --- FUNÇÃO CHECK_FIELD_VALUE APRIMORADA ---
+    def check_field_value(self, table, field, condition_field=None, condition_value=None, filial_code=None):
+        """
+        Busca o valor de um campo específico em uma tabela.
+        Inclui lógica para filtrar por filial em tabelas de parâmetros.
+        Se houver um snapshot de parâmetros carregado, a consulta é atendida da memória.
+        """
+        cached_value = self._snapshot_lookup(table, field, condition_field, condition_value, filial_code)
+        if cached_value is not _SNAPSHOT_MISS:
+            return cached_value
+
+        where_clauses, params = self._build_where(table, condition_field, condition_value, filial_code)
+
         query = f"SELECT {field} FROM {table}"
         if where_clauses:
             query += " WHERE " + " AND ".join(where_clauses)
@@ -413,15 +953,56 @@ ORDER BY nome_produto,
         if table.startswith('parametro') and not where_clauses:
             query += " LIMIT 1"
 
-        df = self.execute_query(query, tuple(params) if params else None)
+        df = self.execute_query(query, tuple(params) if params else None, prepared=True)
         
         if not df.empty:
             return df.iloc[0][field]
         # Retorna None se a query não encontrar nada, para evitar erros
         return None
+
+    def get_field_values(self, table, fields, condition_field=None, condition_value=None, filial_code=None):
+        """
+        Busca vários campos da mesma tabela em uma única consulta.
+        Usa as mesmas regras de condição e filtro de filial de check_field_value
+        e retorna um dicionário {campo: valor} (None para campos não encontrados).
+        """
+        values = {}
+        for field in fields:
+            values[field] = self._snapshot_lookup(table, field, condition_field, condition_value, filial_code)
+        if all(value is not _SNAPSHOT_MISS for value in values.values()):
+            return values
+
+        where_clauses, params = self._build_where(table, condition_field, condition_value, filial_code)
+
+        query = f"SELECT {', '.join(fields)} FROM {table}"
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+
+        if table.startswith('parametro') and not where_clauses:
+            query += " LIMIT 1"
+
+        df = self.execute_query(query, tuple(params) if params else None, prepared=True)
+
+        if df.empty:
+            return {field: None for field in fields}
+        # O MySQL não diferencia maiúsculas nos nomes de coluna; o Pandas sim
+        row = {str(column).lower(): value for column, value in df.iloc[0].to_dict().items()}
+        return {field: row.get(field.lower()) for field in fields}
     
     def close_pool(self):
         """Fecha todas as conexões no pool."""
         # Esta função é chamada implicitamente quando o programa termina, mas é uma boa prática.
         logging.info("Fechando pool de conexões com o MySQL.")
+        self.metrics.log_summary()
+        if self.recorder is not None:
+            self.recorder.save()
+        self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        if self.reference_cache is not None:
+            self.reference_cache.close()
+        if self.statement_cache is not None:
+            stats = self.statement_cache.stats()
+            logging.info(
+                f"Cache de prepared statements: {stats['hits']} hit(s), {stats['misses']} miss(es) "
+                f"({stats['hit_rate']:.0%}), {stats['evictions']} despejo(s), {stats['reprepares']} repreparo(s)."
+            )
 
@@ -0,0 +1,127 @@
+# src/db_metrics.py
+import logging
+import re
+import threading
+
+# Limites superiores (em ms) das faixas dos histogramas
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+# Quantas linhas são medidas para estimar o volume de bytes de um resultado
+BYTES_SAMPLE_ROWS = 100
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*(?:(?:%s|\?)\s*,\s*)*(?:%s|\?)\s*\)', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def fingerprint(query):
+    """
+    Normaliza a query para agrupar execuções equivalentes: remove comentários,
+    troca literais por '?', colapsa listas IN (...) e espaços.
+    """
+    text = _COMMENT_RE.sub(' ', query)
+    text = _STRING_RE.sub('?', text)
+    text = _NUMBER_RE.sub('?', text)
+    text = _IN_LIST_RE.sub('IN (...)', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+def estimate_bytes(rows):
+    """
+    Estima o volume de dados de um resultado a partir de uma amostra das linhas
+    (tamanho de strings/bytes; 8 bytes para os demais tipos).
+    """
+    if not rows:
+        return 0
+    sample = rows[:BYTES_SAMPLE_ROWS]
+    sample_bytes = 0
+    for row in sample:
+        values = row.values() if isinstance(row, dict) else row
+        for value in values:
+            if isinstance(value, (str, bytes, bytearray)):
+                sample_bytes += len(value)
+            elif value is not None:
+                sample_bytes += 8
+    return int(sample_bytes * len(rows) / len(sample))
+
+class Histogram:
+    """Histograma de durações em faixas fixas, com contagem, soma, mínimo e máximo."""
+    def __init__(self):
+        self.buckets = [0] * len(HISTOGRAM_BOUNDS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = 0.0
+
+    def add(self, value_ms):
+        for index, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if value_ms <= bound:
+                self.buckets[index] += 1
+                break
+        self.count += 1
+        self.total_ms += value_ms
+        self.min_ms = value_ms if self.min_ms is None else min(self.min_ms, value_ms)
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, fraction):
+        """Percentil aproximado: limite superior da faixa que contém o percentil."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        accumulated = 0
+        for bound, bucket_count in zip(HISTOGRAM_BOUNDS_MS, self.buckets):
+            accumulated += bucket_count
+            if accumulated >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def describe(self):
+        if not self.count:
+            return "sem amostras"
+        return (f"n={self.count} total={self.total_ms:.1f}ms média={self.total_ms / self.count:.1f}ms "
+                f"p50<={self.percentile(0.5):.0f}ms p95<={self.percentile(0.95):.0f}ms máx={self.max_ms:.1f}ms")
+
+class QueryStats:
+    """Estatísticas acumuladas de um fingerprint de query."""
+    def __init__(self):
+        self.timings = Histogram()
+        self.rows = 0
+        self.bytes = 0
+        self.errors = 0
+
+class DBMetrics:
+    """Coleta tempos de checkout do pool e de execução das queries, agrupados por fingerprint."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkout = Histogram()
+        self.pool_exhaustions = 0
+        self.queries = {}
+
+    def record_checkout(self, wait_seconds, exhausted=False):
+        with self._lock:
+            self.checkout.add(wait_seconds * 1000)
+            if exhausted:
+                self.pool_exhaustions += 1
+
+    def record_query(self, query, elapsed_seconds, rows=0, nbytes=0, error=False):
+        key = fingerprint(query)
+        with self._lock:
+            stats = self.queries.get(key)
+            if stats is None:
+                stats = self.queries[key] = QueryStats()
+            stats.timings.add(elapsed_seconds * 1000)
+            stats.rows += rows
+            stats.bytes += nbytes
+            if error:
+                stats.errors += 1
+
+    def log_summary(self):
+        """Registra no log o resumo do pool e das queries, ordenadas pelo tempo total."""
+        with self._lock:
+            logging.info("=== Resumo de uso do banco de dados ===")
+            logging.info(f"Checkout do pool: {self.checkout.describe()} | pool esgotado {self.pool_exhaustions}x")
+            ranked = sorted(self.queries.items(), key=lambda item: item[1].timings.total_ms, reverse=True)
+            for key, stats in ranked:
+                logging.info(
+                    f"{stats.timings.describe()} linhas={stats.rows} ~bytes={stats.bytes} erros={stats.errors} | {key[:120]}"
+                )
@@ -0,0 +1,279 @@
+# src/dialog_watcher.py
+# Vigia de diálogos opcionais do Guardian (Confirmação, Advertência, Atenção,
+# Último preço praticado...). Uma thread em segundo plano procura as janelas
+# '#32770' descritas no selectors.json e as dispensa com a tecla configurada
+# assim que aparecem, para que o fluxo principal não precise esperar por
+# diálogos que na maioria das vezes não aparecem.
+# Diálogos sem tecla padrão (ex.: Confirmação, cuja resposta muda o documento)
+# só são respondidos com a tecla que o fluxo espera naquele ponto (handle());
+# fora disso ficam abertos e a próxima tecla do fluxo falha (UnexpectedDialogError).
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+
+import ui_driver
+
+DIALOG_CLASS = '#32770'
+
+class UnexpectedDialogError(Exception):
+    """Um diálogo sem tecla padrão apareceu fora de um ponto do fluxo que o espera."""
+
+def _selector_key(selector):
+    return selector.get('title') or selector.get('title_re')
+
+class DialogWatcher:
+    """
+    Thread que consulta os diálogos visíveis a cada poll_interval segundos.
+    keystrokes: {nome_do_seletor: tecla padrão}; só esses seletores são vigiados.
+    Tecla padrão vazia: o diálogo só é dispensado dentro de handle(), com a tecla do fluxo.
+    """
+    def __init__(self, selectors, keystrokes, poll_interval=0.1, process=None):
+        self.poll_interval = poll_interval
+        self.process = process
+        self.rules = {}
+        for name, keystroke in keystrokes.items():
+            selector = selectors.get(name)
+            if selector is None or selector.get('class_name') != DIALOG_CLASS:
+                logging.warning(f"Vigia de diálogos: seletor '{name}' não existe ou não é um diálogo {DIALOG_CLASS}.")
+                continue
+            self.rules[_selector_key(selector)] = {'name': name, 'selector': selector, 'keystroke': keystroke}
+
+        self.current_step = None
+        self.dismissals = []
+        # Diálogos que o vigia não tratou como o fluxo esperava (ver _fallback)
+        self.fallbacks = []
+        # Travado enquanto o vigia ou o fluxo enviam teclas, para não misturar as sequências
+        self.input_lock = threading.RLock()
+        self._overrides = {}
+        self._last_dismissed = {}
+        self._reported = set()
+        self._state_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='dialog-watcher', daemon=True)
+        self._thread.start()
+        logging.info(f"Vigia de diálogos iniciado: {', '.join(rule['name'] for rule in self.rules.values())}.")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._thread = None
+        logging.info(f"Vigia de diálogos finalizado ({len(self.dismissals)} diálogo(s) dispensado(s)).")
+
+    def step(self, name):
+        """Informa o passo atual do fluxo (anotado em cada diálogo dispensado)."""
+        with self._state_lock:
+            self.current_step = name
+
+    def watches(self, selector):
+        return _selector_key(selector) in self.rules
+
+    def handle(self, selector, keystroke, timeout, settled=None):
+        """
+        Trata o diálogo que as últimas teclas do fluxo podem ter provocado: keystroke
+        vale só durante esta chamada. Espera até timeout segundos o diálogo aparecer e
+        ser dispensado, ou até settled() (ex.: wait_engine.focus_moved) indicar que o
+        Guardian seguiu sem ele. Se keystroke é a tecla padrão do diálogo, não espera:
+        o vigia o dispensa em segundo plano. Retorna True se o diálogo foi dispensado.
+        """
+        key = _selector_key(selector)
+        if keystroke == self.rules[key]['keystroke']:
+            return self.dismiss_now(selector)
+        if ui_driver.get_driver().synchronous:
+            # Simulador: o diálogo abre junto com as teclas; se não está aberto agora, não vai abrir
+            timeout = 0
+        mark = len(self.dismissals)
+        with self._state_lock:
+            self._overrides[key] = keystroke
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                if self.dismiss_now(selector):
+                    return True
+                if any(dismissal['key'] == key for dismissal in self.dismissals[mark:]):
+                    return True
+                if settled is not None and _settled(settled):
+                    # Última olhada: o foco também muda quando o diálogo abre
+                    return self.dismiss_now(selector)
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(min(self.poll_interval, 0.05))
+        finally:
+            with self._state_lock:
+                self._overrides.pop(key, None)
+
+    def dismiss_open(self, timeout=2.0):
+        """
+        Dispensa os diálogos vigiados que estiverem abertos e espera eles fecharem
+        (até timeout segundos). Chamado com input_lock antes de enviar as teclas do
+        fluxo, para elas não irem para um diálogo que acabou de aparecer.
+        Levanta UnexpectedDialogError se um diálogo sem tecla padrão estiver aberto.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            open_dialogs = [
+                (handle, title) for handle, title in self._visible_dialogs()
+                if any(self._matches(rule['selector'], title) for rule in self.rules.values())
+            ]
+            if not open_dialogs:
+                return True
+            for handle, title in open_dialogs:
+                if not self._keystroke_for(self._rule(title)):
+                    self._report_unexpected(handle, title)
+                    raise UnexpectedDialogError(f"Diálogo '{title}' aberto sem uma tecla esperada pelo fluxo.")
+            if time.monotonic() >= deadline:
+                self._fallback(f"diálogo(s) ainda aberto(s) antes do envio das teclas: {[title for _, title in open_dialogs]}")
+                return False
+            for handle, title in open_dialogs:
+                self._dismiss(handle, title)
+            time.sleep(min(self.poll_interval, 0.05))
+
+    def dismiss_now(self, selector):
+        """Dispensa o diálogo imediatamente se ele já estiver aberto. Não espera ele aparecer."""
+        for handle, title in self._visible_dialogs():
+            if self._matches(selector, title):
+                return self._dismiss(handle, title)
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                for handle, title in self._visible_dialogs():
+                    if not any(self._matches(rule['selector'], title) for rule in self.rules.values()):
+                        continue
+                    if self._keystroke_for(self._rule(title)):
+                        self._dismiss(handle, title)
+                    else:
+                        # Fica aberto: a próxima tecla do fluxo falha (dismiss_open)
+                        self._report_unexpected(handle, title)
+            except Exception as e:
+                # Janelas somem entre a listagem e o envio das teclas; tenta de novo na próxima volta
+                logging.debug(f"Vigia de diálogos: {e}")
+
+    def _visible_dialogs(self):
+        return ui_driver.get_driver().visible_dialogs(DIALOG_CLASS, self.process)
+
+    @staticmethod
+    def _matches(selector, title):
+        if 'title' in selector:
+            return title == selector['title']
+        if 'title_re' in selector:
+            return re.match(selector['title_re'], title or '') is not None
+        return False
+
+    def _rule(self, title):
+        return next(rule for rule in self.rules.values() if self._matches(rule['selector'], title))
+
+    def _keystroke_for(self, rule):
+        """Tecla esperada pelo fluxo (handle em andamento) ou, se não houver, a padrão ('' se nenhuma)."""
+        with self._state_lock:
+            return self._overrides.get(_selector_key(rule['selector'])) or rule['keystroke']
+
+    def _report_unexpected(self, handle, title):
+        if handle not in self._reported:
+            self._reported.add(handle)
+            self._fallback(f"diálogo '{title}' apareceu sem uma tecla esperada pelo fluxo e não foi respondido.")
+
+    def _dismiss(self, handle, title):
+        """Envia a tecla ao diálogo. Retorna False se não há tecla para ele (fica aberto)."""
+        rule = self._rule(title)
+        key = _selector_key(rule['selector'])
+        with self._state_lock:
+            # O mesmo diálogo ainda visível logo após as teclas: dá tempo para ele fechar
+            last = self._last_dismissed.get(handle)
+            if last is not None and time.monotonic() - last < 1.0:
+                return True
+            keystroke = self._overrides.pop(key, None) or rule['keystroke']
+            if not keystroke:
+                return False
+            self._last_dismissed[handle] = time.monotonic()
+            step = self.current_step
+
+        with self.input_lock:
+            ui_driver.get_driver().dialog_keys(handle, keystroke)
+
+        timestamp = datetime.now().isoformat(timespec='milliseconds')
+        self.dismissals.append({
+            'timestamp': timestamp, 'dialog': rule['name'], 'key': key, 'title': title, 'keystroke': keystroke, 'step': step,
+        })
+        logging.info(f"[{timestamp}] Diálogo '{title}' dispensado com '{keystroke}' (passo: {step or 'n/d'}).")
+        return True
+
+    def _fallback(self, message):
+        # Registrado também na gravação da sessão, que deixa de ser uma referência confiável
+        import session_trace
+        logging.warning(f"Vigia de diálogos: {message}")
+        self.fallbacks.append(message)
+        session_trace.record('dialog_fallback', message=message, step=self.current_step)
+
+# =============================================================================
+# INSTÂNCIA DA SESSÃO
+# =============================================================================
+_watcher = None
+
+def start(selectors, config, process=None):
+    """
+    Inicia o vigia conforme a seção [DialogWatcher] do config.ini. Retorna o vigia,
+    ou None se ele estiver desativado.
+    """
+    global _watcher
+    stop()
+    if not config.has_section('DialogWatcher') or not config['DialogWatcher'].getboolean('enabled', False):
+        return None
+    section = config['DialogWatcher']
+    keystrokes = {
+        name[len('keys.'):]: value
+        for name, value in section.items()
+        if name.startswith('keys.')
+    }
+    _watcher = DialogWatcher(selectors, keystrokes, section.getfloat('poll_interval', 0.1), process)
+    _watcher.start()
+    return _watcher
+
+def stop():
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
+
+def get_watcher():
+    return _watcher
+
+def step(name):
+    """Atualiza o passo atual do vigia, se ele estiver ativo."""
+    if _watcher is not None:
+        _watcher.step(name)
+
+def dismiss_pending():
+    """Dispensa os diálogos vigiados já abertos (ver DialogWatcher.dismiss_open), se o vigia estiver ativo."""
+    if _watcher is None:
+        return True
+    try:
+        return _watcher.dismiss_open()
+    except UnexpectedDialogError:
+        raise
+    except Exception as e:
+        logging.debug(f"Vigia de diálogos: {e}")
+        return False
+
+def input_lock():
+    """Trava de entrada do vigia (ou uma trava local, se ele não estiver ativo)."""
+    if _watcher is not None:
+        return _watcher.input_lock
+    return _NO_WATCHER_LOCK
+
+_NO_WATCHER_LOCK = threading.RLock()
+
+def _settled(condition):
+    try:
+        return bool(condition())
+    except Exception:
+        return False
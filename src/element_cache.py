@@ -0,0 +1,191 @@
+# src/element_cache.py
+# Cache de elementos resolvidos do pywinauto.
+# Um WindowSpecification (main_window.child_window(...)) refaz a busca na árvore
+# de janelas a cada type_keys/wait/invoke. Aqui cada seletor é resolvido uma vez
+# e o wrapper é reaproveitado enquanto o elemento existir; quando a janela fecha
+# (ou uma ação falha com ElementNotFoundError) a entrada é descartada e o seletor
+# é resolvido de novo na próxima chamada.
+# A chave inclui o pai (backend e critérios): o mesmo seletor em outra janela ou
+# em outro backend é outra entrada.
+import itertools
+import logging
+import time
+
+from pywinauto import Desktop
+from pywinauto.findwindows import ElementAmbiguousError, ElementNotFoundError
+
+# Limite de candidatos examinados quando um seletor é ambíguo
+MAX_AMBIGUOUS_CANDIDATES = 20
+
+class ElementStats:
+    """Custo de resolução e aproveitamento do cache de um seletor."""
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.resolve_time = 0.0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class ElementCache:
+    def __init__(self):
+        self._entries = {}
+        self.stats = {}
+        self._ambiguous_logged = set()
+
+    def resolve(self, parent, name, selectors, timeout=None, criteria=None, wait_for='exists visible'):
+        """
+        Retorna o wrapper do elemento selectors[name] (ou dos critérios informados)
+        dentro de parent (um WindowSpecification ou um Desktop).
+        timeout: tempo máximo esperando o estado wait_for (ex.: 'ready' para botões)
+        quando o elemento não está no cache.
+        Levanta ElementNotFoundError / TimeoutError como o pywinauto.
+        """
+        criteria = dict(criteria if criteria is not None else selectors[name])
+        key = (name, _parent_key(parent), tuple(sorted(criteria.items())))
+        stats = self.stats.setdefault(name, ElementStats())
+
+        wrapper = self._entries.get(key)
+        if wrapper is not None:
+            if _is_alive(wrapper):
+                stats.hits += 1
+                return wrapper
+            # A janela foi fechada (ou recriada): o handle antigo não vale mais
+            self._drop(key, stats)
+
+        stats.misses += 1
+        start = time.perf_counter()
+        try:
+            wrapper = self._find(parent, name, criteria, timeout, wait_for)
+        finally:
+            stats.resolve_time += time.perf_counter() - start
+        self._entries[key] = wrapper
+        return wrapper
+
+    def call(self, parent, name, selectors, action, timeout=None, criteria=None, wait_for='exists visible'):
+        """
+        Executa action(wrapper). Se o elemento sumiu entre a resolução e a ação,
+        descarta a entrada e tenta uma vez com o elemento resolvido de novo.
+        """
+        wrapper = self.resolve(parent, name, selectors, timeout, criteria, wait_for)
+        try:
+            return action(wrapper)
+        except ElementNotFoundError:
+            self.invalidate(name)
+            return action(self.resolve(parent, name, selectors, timeout, criteria, wait_for))
+
+    def invalidate(self, name=None):
+        """Descarta as entradas de um seletor (ou todas, sem name)."""
+        for key in [key for key in self._entries if name is None or key[0] == name]:
+            self._drop(key, self.stats.setdefault(key[0], ElementStats()))
+
+    def reset_stats(self):
+        """Zera as estatísticas (as entradas continuam no cache): o resumo passa a ser da execução."""
+        self.stats = {}
+
+    def log_summary(self):
+        if not self.stats:
+            return
+        logging.info("Cache de elementos (seletor | acertos | resoluções | taxa | custo total | descartes):")
+        for name, stats in sorted(self.stats.items(), key=lambda item: item[1].resolve_time, reverse=True):
+            logging.info(
+                f"  {name} | {stats.hits} | {stats.misses} | {stats.hit_rate:.0%} | "
+                f"{stats.resolve_time:.3f}s | {stats.invalidations}"
+            )
+
+    def _drop(self, key, stats):
+        if self._entries.pop(key, None) is not None:
+            stats.invalidations += 1
+
+    def _find(self, parent, name, criteria, timeout, wait_for):
+        spec = _spec(parent, criteria)
+        try:
+            if timeout is not None:
+                spec.wait(wait_for, timeout=timeout)
+            return spec.wrapper_object()
+        except ElementAmbiguousError:
+            return self._pin_ambiguous(parent, name, criteria, timeout, wait_for)
+
+    def _pin_ambiguous(self, parent, name, criteria, timeout, wait_for):
+        """
+        Mais de um elemento atende aos critérios: escolhe sempre o mesmo, pela ordem
+        estável de _stable_order (id do controle, depois posição na tela), e não pela
+        ordem de enumeração do pywinauto, que segue o z-order.
+        """
+        if timeout is not None:
+            _spec(parent, dict(criteria, found_index=0)).wait(wait_for, timeout=timeout)
+        candidates = []
+        for index in itertools.count():
+            if index >= MAX_AMBIGUOUS_CANDIDATES:
+                break
+            try:
+                candidates.append(_spec(parent, dict(criteria, found_index=index)).wrapper_object())
+            except ElementNotFoundError:
+                break
+        if not candidates:
+            raise ElementNotFoundError(criteria)
+        chosen = min(candidates, key=_stable_order)
+        control_id, top, left = _stable_order(chosen)[:3]
+        message = (
+            f"Seletor '{name}' é ambíguo ({criteria}, {len(candidates)} elementos); "
+            f"usando o de id {control_id} em ({left}, {top})."
+        )
+        if name not in self._ambiguous_logged:
+            self._ambiguous_logged.add(name)
+            logging.warning(message)
+        else:
+            logging.info(message)
+        return chosen
+
+def _spec(parent, criteria):
+    if isinstance(parent, Desktop):
+        return parent.window(**criteria)
+    return parent.child_window(**criteria)
+
+def _parent_key(parent):
+    # Sem resolver o pai (o que refaria a busca): backend e critérios da especificação
+    backend = getattr(getattr(parent, 'backend', None), 'name', None)
+    if isinstance(parent, Desktop):
+        return (backend, 'desktop')
+    return (backend, repr(getattr(parent, 'criteria', parent)))
+
+def _stable_order(wrapper):
+    """Ordem de escolha entre elementos ambíguos: id do controle, topo, esquerda."""
+    try:
+        control_id = wrapper.element_info.control_id or 0
+    except Exception:
+        control_id = 0
+    try:
+        rect = wrapper.rectangle()
+        return (control_id, rect.top, rect.left, rect.bottom, rect.right)
+    except Exception:
+        return (control_id, 0, 0, 0, 0)
+
+def _is_alive(wrapper):
+    # Elementos de janelas fechadas levantam erro (UIA) ou deixam de ser visíveis (win32)
+    try:
+        return wrapper.is_visible()
+    except Exception:
+        return False
+
+# =============================================================================
+# INSTÂNCIA DA SESSÃO
+# =============================================================================
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ElementCache()
+    return _cache
+
+def resolve(parent, name, selectors, timeout=None, criteria=None, wait_for='exists visible'):
+    """Atalho para get_cache().resolve(...)."""
+    return get_cache().resolve(parent, name, selectors, timeout, criteria, wait_for)
+
+def call(parent, name, selectors, action, timeout=None, criteria=None, wait_for='exists visible'):
+    """Atalho para get_cache().call(...)."""
+    return get_cache().call(parent, name, selectors, action, timeout, criteria, wait_for)
@@ -0,0 +1,455 @@
+# src/guardian_simulator.py
+# Simulador em memória das telas do Guardian usadas pelos testes (DAV e Logística),
+# com os diálogos opcionais (#32770) e a janela de autorização.
+# Permite rodar os fluxos sem Windows e sem o Guardian, para testes de regressão e
+# medições de desempenho. As teclas são processadas na hora (driver síncrono): as
+# pausas fixas (wait_engine.pause) são dispensadas e as esperas têm prazo curto ([UI] simulator_wait_timeout),
+# pois só o vigia de diálogos muda as telas em segundo plano.
+#
+# Modelo:
+#   - ALT+V / ALT+L seguidos de ENTER na janela principal abrem a tela de DAV / Logística;
+#   - F2 na tela inicia um documento; o texto digitado vai para o campo atual,
+#     ^a{DELETE} limpa o campo e ENTER grava o valor no documento e passa ao próximo campo;
+#   - diálogos são abertos pelo roteiro (tecla específica ou sorteio após gravar um valor);
+#     enquanto um diálogo modal está aberto, as teclas enviadas a outra janela vão para ele
+#     (como no Windows) e são contadas como "teclas desviadas"; as teclas que sobram depois
+#     de um diálogo fechar vão para a tela de baixo;
+#   - a autorização é sorteada quando o fluxo a procura depois de um ENTER na tela de DAV
+#     (saída dos campos de quantidade e de preço, onde o Guardian a pede);
+#   - problems() lista o que o fluxo não percebeu (teclas desviadas, autorização esquecida)
+#     e assert_document() confere os valores gravados em um documento.
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+
+from ui_driver import ElementNotFound, UIDriver, WaitTimeout
+
+DIALOG_CLASS = '#32770'
+PROCESS_ID = 4242
+
+# Teclas que fecham cada tipo de diálogo
+DIALOG_DISMISS_KEYS = ('{ENTER}', '{ESC}', '%n', '%s')
+
+DEFAULT_SCRIPT = {
+    'seed': 0,
+    # Telas em que os diálogos opcionais aparecem (o fluxo de carga não trata diálogos)
+    'dialog_screens': ('dav_inclusion_window',),
+    # Diálogos abertos por uma tecla na tela do documento: {tecla: (diálogo, probabilidade)}
+    'key_dialogs': {'{F2}': ('confirmation_dialog', 0.5)},
+    # Chance de abrir um dos diálogos abaixo após cada ENTER que grava um valor
+    'value_dialog_probability': 0.05,
+    'value_dialogs': ('warning_dialog', 'atention_dialog', 'last_price_pratice'),
+    # Chance de pedir autorização quando o fluxo a procura depois de um ENTER na tela de DAV
+    'authorization_probability': 0.05,
+}
+
+_handles = itertools.count(0x1000)
+
+class SimulationError(AssertionError):
+    """A execução no simulador não deixou as telas no estado esperado."""
+
+def parse_keys(keys, with_spaces=False):
+    """
+    Converte a sintaxe de teclas do pywinauto em uma lista de teclas:
+    '{ENTER 3}' -> ['{ENTER}'] * 3, '^a' -> ['^a'], '%(s)' -> ['%s'], 'ab' -> ['a', 'b'].
+    """
+    tokens = []
+    modifiers = ''
+    i = 0
+    while i < len(keys):
+        char = keys[i]
+        if char in '^%+':
+            modifiers += char
+            i += 1
+            continue
+        if char == '{':
+            # O nome tem ao menos um caractere: '{}}' é a própria chave
+            end = keys.index('}', i + 2)
+            name, _, count = keys[i + 1:end].partition(' ')
+            token = modifiers + '{' + name.upper() + '}'
+            tokens.extend([token] * (int(count) if count.isdigit() else 1))
+            i = end + 1
+        elif char == '(' and modifiers:
+            end = keys.index(')', i)
+            tokens.extend(modifiers + group_char.lower() for group_char in keys[i + 1:end])
+            i = end + 1
+        elif char == '~':
+            tokens.append(modifiers + '{ENTER}')
+            i += 1
+        elif char == ' ' and not with_spaces:
+            i += 1
+            continue
+        else:
+            tokens.append(modifiers + (char.lower() if modifiers else char))
+            i += 1
+        modifiers = ''
+    return tokens
+
+def _title_from(selector, default):
+    if 'title' in selector:
+        return selector['title']
+    if 'title_re' in selector:
+        # Um título que atende à expressão: 'Space Guardian.*' -> 'Space Guardian'
+        return re.sub(r'\.\*|\\|\$|\^', '', selector['title_re']).strip()
+    return default
+
+def _matches(criteria, window):
+    if 'title' in criteria and criteria['title'] != window.title:
+        return False
+    if 'title_re' in criteria and re.match(criteria['title_re'], window.title) is None:
+        return False
+    if 'class_name' in criteria and window.class_name and criteria['class_name'] != window.class_name:
+        return False
+    return 'title' in criteria or 'title_re' in criteria
+
+class SimWindow:
+    def __init__(self, name, title, class_name=None, modal=False):
+        self.name = name
+        self.title = title
+        self.class_name = class_name
+        self.modal = modal
+        self.handle = next(_handles)
+        self.visible = False
+        self.field = ''
+        # Posição do campo com foco: muda a cada ENTER/TAB (ver focused_control)
+        self.position = 0
+        self.select_all = False
+        self.pending_menu = None
+        self.document = None
+        self.pressed = set()
+
+class SimButton:
+    def __init__(self, name, window):
+        self.name = name
+        self.window = window
+
+class GuardianSimulator:
+    """Estado das telas simuladas. Thread-safe: o vigia de diálogos age em outra thread."""
+    def __init__(self, selectors, script=None):
+        self.script = dict(DEFAULT_SCRIPT, **(script or {}))
+        self.rng = random.Random(self.script['seed'])
+        self.lock = threading.RLock()
+        self.windows = {}
+        self.documents = []
+        self.screen = 'main_window'
+        self._authorization_armed = False
+        self.stats = {
+            'keys': 0, 'misrouted_keys': 0, 'ignored_keys': 0,
+            'dialogs_opened': 0, 'dialogs_dismissed': 0, 'authorizations': 0,
+        }
+        self.started_at = time.perf_counter()
+
+        self._add('main_window', selectors.get('main_window', {}), 'Space Guardian')
+        self._add('dav_inclusion_window', selectors.get('dav_inclusion_window', {}), 'Documento Auxiliar de Venda')
+        self._add('logistics_window', selectors.get('logistics_window', {}), 'Logística')
+        self._add('adress_dialog', selectors.get('adress_dialog', {}), 'Endereços', modal=True)
+        self._add('authorization_dialog', selectors.get('authorization_dialog', {}), 'Solicitação de Autorização', modal=True)
+        for name, selector in selectors.items():
+            if selector.get('class_name') == DIALOG_CLASS and name not in self.windows:
+                self._add(name, selector, name, modal=True)
+        self.windows['main_window'].visible = True
+
+    def _add(self, name, selector, default_title, modal=False):
+        self.windows[name] = SimWindow(name, _title_from(selector, default_title), selector.get('class_name'), modal)
+
+    # -------------------------------------------------------------------------
+    # Consultas
+    # -------------------------------------------------------------------------
+    def open_modal(self):
+        return next((window for window in self.windows.values() if window.modal and window.visible), None)
+
+    def find(self, name, criteria=None):
+        with self.lock:
+            window = self.windows.get(name)
+            if window is None and criteria:
+                window = next((w for w in self.windows.values() if _matches(criteria, w)), None)
+            return window if window is not None and window.visible else None
+
+    def find_by_criteria(self, criteria):
+        with self.lock:
+            return next((w for w in self.windows.values() if w.visible and _matches(criteria, w)), None)
+
+    def window_by_handle(self, handle):
+        return next((w for w in self.windows.values() if w.handle == handle), None)
+
+    # -------------------------------------------------------------------------
+    # Teclado e botões
+    # -------------------------------------------------------------------------
+    def send(self, window, keys, with_spaces=False):
+        with self.lock:
+            for token in parse_keys(keys, with_spaces):
+                self.stats['keys'] += 1
+                if window.modal and not window.visible:
+                    # O diálogo fechou no meio da sequência: o resto vai para a tela de baixo
+                    window = self.windows[self.screen]
+                modal = self.open_modal()
+                target = window
+                if modal is not None and modal is not window:
+                    # Janela bloqueada pelo diálogo modal: a tecla vai para o diálogo
+                    self.stats['misrouted_keys'] += 1
+                    target = modal
+                self._press(target, token)
+
+    def _press(self, window, token):
+        if window.modal:
+            if window.name == 'authorization_dialog':
+                self.stats['ignored_keys'] += 1
+            elif token in DIALOG_DISMISS_KEYS:
+                self._close(window)
+            else:
+                self.stats['ignored_keys'] += 1
+            return
+        if window.name == 'main_window':
+            self._press_main(window, token)
+        else:
+            self._press_document(window, token)
+
+    def _press_main(self, window, token):
+        if token == '%v':
+            window.pending_menu = 'dav_inclusion_window'
+        elif token == '%l':
+            window.pending_menu = 'logistics_window'
+        elif token == '{ENTER}' and window.pending_menu:
+            self.windows[window.pending_menu].visible = True
+            self.screen = window.pending_menu
+            window.pending_menu = None
+        else:
+            self.stats['ignored_keys'] += 1
+
+    def _press_document(self, window, token):
+        if token in ('{ENTER}', '{TAB}', '{F1}', '{F2}'):
+            # O foco passa ao próximo campo (F1 abre a lista de consulta, F2 vai ao primeiro campo)
+            window.position += 1
+        if token == '{F2}':
+            window.document = {'screen': window.name, 'values': []}
+            self.documents.append(window.document)
+            window.field = ''
+        elif token == '^a':
+            window.select_all = True
+        elif token in ('{DELETE}', '{BACKSPACE}'):
+            window.field = '' if window.select_all else window.field[:-1]
+            window.select_all = False
+        elif token == '{ENTER}':
+            self._commit(window)
+            if window.name == 'dav_inclusion_window' and window.document is not None:
+                self._authorization_armed = True
+        elif token.startswith('{') or token[:1] in '^%+' and len(token) > 1:
+            # Teclas de navegação (TAB, F1...) não alteram o campo
+            pass
+        else:
+            window.field = token if window.select_all else window.field + token
+            window.select_all = False
+
+        rule = self.script['key_dialogs'].get(token)
+        if rule is not None and window.name in self.script['dialog_screens'] and self.rng.random() < rule[1]:
+            self._open(rule[0])
+
+    def _commit(self, window):
+        value = window.field
+        window.field = ''
+        window.select_all = False
+        if not value or window.document is None:
+            return
+        window.document['values'].append(value)
+        if window.name in self.script['dialog_screens'] and self.rng.random() < self.script['value_dialog_probability']:
+            self._open(self.rng.choice(self.script['value_dialogs']))
+
+    def check_authorization(self):
+        """
+        O fluxo procura a janela de autorização: sorteia se o último ENTER na tela de
+        DAV a pediu (um sorteio por ENTER, mesmo que o fluxo procure mais de uma vez).
+        """
+        with self.lock:
+            if not self._authorization_armed:
+                return
+            self._authorization_armed = False
+            if self.rng.random() < self.script['authorization_probability']:
+                self._open('authorization_dialog')
+
+    def invoke(self, button):
+        with self.lock:
+            window = button.window
+            if not window.visible:
+                raise ElementNotFound(f"Botão '{button.name}' não está visível.")
+            if button.name == 'authorization_authorize_button':
+                window.pressed.add('authorize')
+            elif button.name == 'authorization_confirm_button' and 'authorize' in window.pressed:
+                self.stats['authorizations'] += 1
+                self._close(window)
+
+    def _open(self, name):
+        window = self.windows.get(name)
+        if window is None or self.open_modal() is not None:
+            return
+        # Como no Windows, cada diálogo aberto é uma janela nova, com outro handle
+        window.handle = next(_handles)
+        window.visible = True
+        window.pressed = set()
+        self.stats['dialogs_opened'] += 1
+
+    def _close(self, window):
+        if not window.visible:
+            return
+        window.visible = False
+        self.stats['dialogs_dismissed'] += 1
+
+    # -------------------------------------------------------------------------
+    # Verificações
+    # -------------------------------------------------------------------------
+    def problems(self):
+        """O que o fluxo não percebeu durante a execução (lista vazia se nada)."""
+        with self.lock:
+            problems = []
+            if self.stats['misrouted_keys']:
+                problems.append(f"{self.stats['misrouted_keys']} tecla(s) enviada(s) com um diálogo aberto foram para o diálogo.")
+            if self.windows['authorization_dialog'].visible:
+                problems.append("A janela de autorização ficou aberta.")
+            return problems
+
+    def assert_document(self, screen, expected):
+        """
+        Levanta SimulationError se nenhum documento da tela gravou os valores
+        esperados nessa ordem (podem ter outros valores entre eles).
+        """
+        expected = [str(value) for value in expected]
+        with self.lock:
+            documents = [document for document in self.documents if document['screen'] == screen]
+        for document in documents:
+            values = iter(document['values'])
+            if all(any(value == wanted for value in values) for wanted in expected):
+                return document
+        raise SimulationError(
+            f"Nenhum documento de '{screen}' gravou {expected}; gravados: {[document['values'] for document in documents]}"
+        )
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+            self.documents = []
+            self.started_at = time.perf_counter()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started_at
+        with self.lock:
+            stats = dict(self.stats)
+        stats['documents'] = len(self.documents)
+        stats['keys_per_second'] = stats['keys'] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+class SimulatedDriver(UIDriver):
+    """Driver que conversa com o GuardianSimulator em vez do Windows."""
+    name = 'simulator'
+    synchronous = True
+
+    def __init__(self, selectors, script=None, max_wait=0.5):
+        super().__init__(selectors)
+        self.simulator = GuardianSimulator(selectors, script)
+        self.max_wait = max_wait
+
+    @classmethod
+    def from_config(cls, selectors, ui_config=None):
+        script = {}
+        max_wait = 0.5
+        if ui_config is not None:
+            max_wait = ui_config.getfloat('simulator_wait_timeout', max_wait)
+            script = {
+                'seed': ui_config.getint('simulator_seed', DEFAULT_SCRIPT['seed']),
+                'value_dialog_probability': ui_config.getfloat(
+                    'simulator_dialog_probability', DEFAULT_SCRIPT['value_dialog_probability']),
+                'authorization_probability': ui_config.getfloat(
+                    'simulator_authorization_probability', DEFAULT_SCRIPT['authorization_probability']),
+            }
+        return cls(selectors, script, max_wait)
+
+    def main_window(self, backend='win32', timeout=None):
+        return self.simulator.windows['main_window']
+
+    def find(self, parent, name, timeout=None, criteria=None, wait_for='exists visible'):
+        # Nada aparece "depois" no simulador: se não está visível agora, não vai aparecer
+        if name.startswith('authorization_dialog'):
+            self.simulator.check_authorization()
+        if name.startswith('authorization_') and name.endswith('_button'):
+            dialog = self.simulator.find('authorization_dialog')
+            if dialog is None:
+                raise WaitTimeout(f"'{name}' não apareceu.")
+            return SimButton(name, dialog)
+        window = self.simulator.find(name, criteria)
+        if window is None:
+            raise WaitTimeout(f"'{name}' não apareceu.")
+        return window
+
+    def find_window(self, criteria, timeout=None):
+        if _matches(criteria, self.simulator.windows['authorization_dialog']):
+            self.simulator.check_authorization()
+        window = self.simulator.find_by_criteria(criteria)
+        if window is None:
+            raise WaitTimeout(f"Janela {criteria} não apareceu.")
+        return window
+
+    def exists(self, parent, name, criteria=None):
+        return self.simulator.find(name, criteria) is not None
+
+    def type_keys(self, element, keys, with_spaces=False, pause=None):
+        self.simulator.send(element, keys, with_spaces)
+
+    def set_focus(self, element):
+        pass
+
+    def invoke(self, parent, name, timeout=None):
+        self.simulator.invoke(self.find(parent, name, timeout))
+
+    def window_text(self, element):
+        return element.title
+
+    def process_id(self, element):
+        return PROCESS_ID
+
+    def begin_run(self, test_name):
+        self.simulator.reset_stats()
+
+    def run_problems(self):
+        return self.simulator.problems()
+
+    def is_active(self, element):
+        modal = self.simulator.open_modal()
+        return modal is None or modal is element
+
+    def has_focus(self, element):
+        return self.is_active(element)
+
+    def focused_control(self, element):
+        # Com um diálogo aberto, o foco está nele
+        with self.simulator.lock:
+            modal = self.simulator.open_modal()
+            if modal is not None:
+                return ('dialog', modal.handle)
+            return (element.handle, element.position)
+
+    def focused_text(self, element):
+        return element.field
+
+    def visible_dialogs(self, class_name, process=None):
+        with self.simulator.lock:
+            return [
+                (window.handle, window.title)
+                for window in self.simulator.windows.values()
+                if window.visible and window.class_name == class_name
+            ]
+
+    def dialog_keys(self, handle, keys):
+        window = self.simulator.window_by_handle(handle)
+        if window is None or not window.visible:
+            raise ElementNotFound(f"Diálogo {handle} não está aberto.")
+        self.simulator.send(window, keys)
+
+    def log_summary(self):
+        stats = self.simulator.summary()
+        logging.info(
+            f"Simulador: {stats['keys']} teclas ({stats['keys_per_second']:.0f}/s), "
+            f"{stats['documents']} documento(s), {stats['dialogs_opened']} diálogo(s) aberto(s), "
+            f"{stats['dialogs_dismissed']} dispensado(s), {stats['authorizations']} autorização(ões), "
+            f"{stats['misrouted_keys']} tecla(s) desviada(s) por diálogo aberto."
+        )
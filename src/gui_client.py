@@ -0,0 +1,369 @@
+# src/gui_client.py
+# Cliente dos diálogos de seleção usados pelos testes.
+# Os diálogos são atendidos por um servidor persistente (selection_gui_server.py),
+# iniciado uma vez por sessão do runner. Se ele não estiver disponível, cada
+# diálogo é aberto em um processo avulso, como antes.
+import json
+import logging
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import pandas as pd
+
+import gui_transport
+import spans
+
+SERVER_SCRIPT = 'src/selection_gui_server.py'
+ONE_SHOT_SCRIPTS = {
+    'single': 'src/selection_gui.py',
+    'multi': 'src/multi_selection_gui.py',
+}
+
+# Itens por página no carregamento progressivo dos diálogos
+PAGE_SIZE = 500
+
+class SelectionGuiServer:
+    """Processo Python + Qt que permanece aberto e atende pedidos de diálogo via stdin/stdout."""
+    def __init__(self, script=SERVER_SCRIPT):
+        self.script = script
+        self.process = None
+        self.startup_time = None
+        self.started_at = None
+        self.ready_at = None
+        self._ready = False
+        self._next_id = 1
+        self._messages = None
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Inicia o processo sem esperar o Qt carregar."""
+        if self.is_running():
+            return
+        self.started_at = time.perf_counter()
+        self.ready_at = None
+        self.process = subprocess.Popen(
+            [sys.executable, self.script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        self._ready = False
+        # As respostas são lidas em segundo plano para que o envio de páginas
+        # perceba quando o usuário confirmou o diálogo antes do fim da carga.
+        self._messages = queue.Queue()
+        threading.Thread(target=self._read_loop, args=(self.process, self._messages), daemon=True).start()
+        logging.info("Servidor de diálogos de seleção iniciado.")
+
+    def request(self, kind, title, items, headers=None, total=None):
+        """
+        Envia um pedido de diálogo e bloqueia até o usuário confirmar ou fechar a janela.
+        items pode ser uma lista ou um iterável de páginas (listas); no segundo caso
+        o diálogo abre com a primeira página e as demais chegam com ele aberto.
+        """
+        self.start()
+        self._wait_ready()
+
+        request_id = self._next_id
+        self._next_id += 1
+        blocks = []
+        try:
+            if isinstance(items, list):
+                payload = {'title': title, 'items': items, 'headers': headers or []}
+                self._send(request_id, payload, blocks, kind=kind)
+            else:
+                pages = iter(items)
+                first_page = next(pages, [])
+                payload = {'title': title, 'items': first_page, 'headers': headers or []}
+                self._send(request_id, payload, blocks, kind=kind, streaming=True, total=total)
+                for page in pages:
+                    response = self._poll_response(request_id)
+                    if response is not None:
+                        # Usuário confirmou antes do fim: as páginas restantes não são enviadas
+                        return self._result(response)
+                    self._send(request_id, {'items': page}, blocks, append=True)
+                self.process.stdin.write(json.dumps({'id': request_id, 'end': True}) + '\n')
+                self.process.stdin.flush()
+
+            while True:
+                response = self._read_message()
+                if response.get('id') != request_id:
+                    continue
+                if response.get('event') == 'loaded':
+                    # O diálogo tem todas as páginas: a cópia para um eventual reenvio não é mais necessária
+                    if isinstance(items, _CachedPages):
+                        items.release()
+                    continue
+                return self._result(response)
+        finally:
+            for block in blocks:
+                gui_transport.release(block)
+
+    def shutdown(self):
+        if not self.is_running():
+            return
+        try:
+            self.process.stdin.write(json.dumps({'cmd': 'shutdown'}) + '\n')
+            self.process.stdin.flush()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+        logging.info("Servidor de diálogos de seleção finalizado.")
+
+    def _wait_ready(self):
+        if self._ready:
+            return
+        message = self._read_message()
+        if message.get('event') != 'ready':
+            raise RuntimeError(f"Resposta inesperada do servidor de seleção: {message}")
+        self.startup_time = message.get('startup')
+        self._ready = True
+        logging.info(f"Servidor de diálogos pronto (inicialização do Qt: {self.startup_time:.2f}s).")
+
+    def _send(self, request_id, payload, blocks, **envelope):
+        line, block = gui_transport.encode_payload(payload, id=request_id, **envelope)
+        if block is not None:
+            blocks.append(block)
+        self.process.stdin.write(line + '\n')
+        self.process.stdin.flush()
+
+    def _poll_response(self, request_id):
+        """Retorna a resposta do pedido se ela já chegou, sem bloquear."""
+        while True:
+            try:
+                message = self._messages.get_nowait()
+            except queue.Empty:
+                return None
+            if message is None:
+                raise RuntimeError("O servidor de seleção foi encerrado inesperadamente.")
+            if message.get('id') == request_id:
+                return message
+
+    @staticmethod
+    def _result(response):
+        if 'error' in response:
+            raise RuntimeError(f"Erro no servidor de seleção: {response['error']}")
+        return response.get('result')
+
+    def _read_message(self):
+        message = self._messages.get()
+        if message is None:
+            raise RuntimeError("O servidor de seleção foi encerrado inesperadamente.")
+        return message
+
+    def _read_loop(self, process, messages):
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            message = json.loads(line)
+            if message.get('event') == 'ready' and process is self.process:
+                # Momento em que o Qt ficou pronto, para medir a sobreposição com as consultas
+                self.ready_at = time.perf_counter()
+            messages.put(message)
+        messages.put(None)
+
+class GuiWarmup:
+    """
+    Processo de GUI iniciado antes de os dados do diálogo estarem prontos.
+    Registra quando a GUI ficou pronta e quando os dados chegaram, para
+    calcular quanto da inicialização do Qt ficou escondido atrás da consulta.
+    """
+    def __init__(self, kind, server=None, process=None):
+        self.kind = kind
+        self.server = server
+        self.process = process
+        self.started_at = server.started_at if server is not None else time.perf_counter()
+        self.ready_at = None
+        self.data_started_at = None
+        self.data_ready_at = None
+
+    def data_started(self):
+        self.data_started_at = time.perf_counter()
+
+    def data_ready(self):
+        self.data_ready_at = time.perf_counter()
+
+    def gui_ready_at(self):
+        if self.server is not None:
+            return self.server.ready_at
+        return self.ready_at
+
+    def cancel(self):
+        """Descarta o processo avulso pré-iniciado quando não há o que exibir."""
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def report(self, title):
+        """Registra no log o tempo economizado ao sobrepor a inicialização da GUI e a consulta."""
+        gui_ready = self.gui_ready_at()
+        if gui_ready is None or self.data_started_at is None or self.data_ready_at is None:
+            return 0.0
+        overlap_start = max(self.started_at, self.data_started_at)
+        overlap_end = min(gui_ready, self.data_ready_at)
+        saved = max(0.0, overlap_end - overlap_start)
+        logging.info(
+            f"Diálogo '{title}': dados em {self.data_ready_at - self.data_started_at:.3f}s, "
+            f"GUI pronta {max(0.0, gui_ready - self.started_at):.3f}s após o início; "
+            f"{saved:.3f}s economizados com a sobreposição."
+        )
+        return saved
+
+class _CachedPages:
+    """
+    Iterável de páginas que guarda o que já foi lido, para o diálogo poder ser
+    reaberto em um processo avulso se o servidor falhar no meio da carga.
+    release() descarta as páginas guardadas quando o servidor já recebeu todas;
+    depois disso não é possível percorrer as páginas de novo.
+    """
+    def __init__(self, pages):
+        self._source = iter(pages)
+        self._cache = []
+        self._released = False
+
+    def release(self):
+        self._cache = []
+        self._released = True
+
+    def __iter__(self):
+        if self._released:
+            raise RuntimeError("As páginas do diálogo já foram descartadas e não podem ser reenviadas.")
+        index = 0
+        while True:
+            if index < len(self._cache):
+                yield self._cache[index]
+                index += 1
+                continue
+            page = next(self._source, None)
+            if page is None:
+                return
+            if not self._released:
+                self._cache.append(page)
+            index += 1
+            yield page
+
+def paginate(frames, to_items, page_size=PAGE_SIZE):
+    """
+    Converte um DataFrame (ou um iterável de DataFrames, como os blocos de uma
+    consulta em streaming) em páginas de itens para a GUI, sob demanda.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    for frame in frames:
+        for start in range(0, len(frame), page_size):
+            yield to_items(frame.iloc[start:start + page_size])
+
+_server = None
+
+def start_gui_server():
+    """Inicia (se necessário) o servidor de diálogos da sessão e o retorna."""
+    global _server
+    if _server is None:
+        _server = SelectionGuiServer()
+    _server.start()
+    return _server
+
+def shutdown_gui_server():
+    """Encerra o servidor de diálogos, se estiver em execução."""
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server = None
+
+def prewarm(kind):
+    """
+    Garante que a GUI do próximo diálogo esteja subindo enquanto a consulta roda.
+    Usa o servidor da sessão; se ele não puder ser iniciado, pré-inicia um processo
+    avulso, que fica esperando os dados no stdin. Retorna um GuiWarmup.
+    """
+    try:
+        return GuiWarmup(kind, server=start_gui_server())
+    except Exception as e:
+        logging.warning(f"Servidor de seleção indisponível ({e}). Pré-iniciando processo avulso.")
+        shutdown_gui_server()
+        return GuiWarmup(kind, process=_spawn_one_shot(kind))
+
+def show_selection_dialog(kind, title, items, headers=None, total=None, warmup=None):
+    """
+    Exibe um diálogo de seleção ('single' ou 'multi') e retorna o código escolhido
+    (ou a lista de códigos, no modo 'multi'). items pode ser uma lista ou um
+    iterável de páginas (ver paginate); total é o número esperado de itens, se conhecido.
+    warmup é o GuiWarmup devolvido por prewarm(), quando a GUI foi iniciada antes dos dados.
+    """
+    span_start = time.perf_counter()
+    try:
+        if warmup is not None and warmup.process is not None:
+            return _run_one_shot(kind, title, _materialize(items), headers, warmup)
+        if not isinstance(items, list):
+            # Guardadas só até o servidor receber todas (ver _CachedPages.release)
+            items = _CachedPages(items)
+        try:
+            return start_gui_server().request(kind, title, items, headers, total)
+        except Exception as e:
+            logging.warning(f"Servidor de seleção indisponível ({e}). Abrindo o diálogo em processo avulso.")
+            shutdown_gui_server()
+            return _run_one_shot(kind, title, _materialize(items), headers)
+    finally:
+        # Inclui o tempo do usuário escolhendo: o ranking mostra quanto da execução foi interação
+        spans.record(title, spans.GUI, span_start, kind=kind)
+        if warmup is not None:
+            warmup.report(title)
+
+def _materialize(items):
+    if isinstance(items, list):
+        return items
+    return [item for page in items for item in page]
+
+def _spawn_one_shot(kind):
+    return subprocess.Popen(
+        [sys.executable, ONE_SHOT_SCRIPTS[kind]],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8'
+    )
+
+def _run_one_shot(kind, title, items, headers=None, warmup=None):
+    """
+    Abre o diálogo em um processo próprio, enviando os dados pelo stdin.
+    Com warmup, usa o processo pré-iniciado (o Qt já carregou ou está carregando).
+    """
+    payload = {'title': title, 'items': items, 'headers': headers or []}
+    line, block = gui_transport.encode_payload(payload, kind=kind)
+    process = warmup.process if warmup is not None else _spawn_one_shot(kind)
+    try:
+        stdout, stderr = process.communicate(input=line)
+    finally:
+        gui_transport.release(block)
+        if warmup is not None:
+            warmup.process = None
+
+    if warmup is not None:
+        warmup.ready_at = _one_shot_ready_at(stderr, warmup.started_at)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args, stdout, stderr)
+
+    output = stdout.strip()
+    if kind == 'multi':
+        return json.loads(output) if output else []
+    return output or None
+
+def _one_shot_ready_at(stderr, started_at):
+    """Lê o aviso de pronto que o processo avulso escreve no stderr."""
+    for line in (stderr or '').splitlines():
+        if '"ready"' not in line:
+            continue
+        try:
+            return started_at + json.loads(line)['startup']
+        except (ValueError, KeyError):
+            return None
+    return None
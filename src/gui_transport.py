@@ -0,0 +1,48 @@
+# src/gui_transport.py
+# Transporte dos dados dos diálogos de seleção entre o runner e os processos Qt.
+# Payloads pequenos vão inline na mensagem JSON (stdin); catálogos grandes vão
+# por memória compartilhada e a mensagem leva só o nome e o tamanho do bloco.
+import json
+from multiprocessing import shared_memory
+
+# A partir deste tamanho (bytes) o payload é enviado por memória compartilhada
+SHARED_MEMORY_THRESHOLD = 4 * 1024 * 1024
+
+def encode_payload(payload, **envelope):
+    """
+    Prepara a mensagem de um pedido. Retorna (linha JSON pronta para o stdin,
+    bloco_de_memória ou None). O payload é serializado uma única vez: o mesmo texto
+    mede o tamanho e vai inline na linha.
+    Quem envia deve chamar release() no bloco depois de receber a resposta.
+    """
+    text = json.dumps(payload, default=str)
+    data = text.encode('utf-8')
+    if len(data) < SHARED_MEMORY_THRESHOLD:
+        head = json.dumps(envelope, default=str)[:-1]
+        separator = ', ' if envelope else ''
+        return f'{head}{separator}"payload": {text}}}', None
+
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    return json.dumps(dict(envelope, shm=block.name, size=len(data)), default=str), block
+
+def decode_payload(message):
+    """Extrai o payload de uma mensagem, lendo da memória compartilhada quando necessário."""
+    if 'shm' not in message:
+        return message.get('payload', {})
+    block = shared_memory.SharedMemory(name=message['shm'])
+    try:
+        data = bytes(block.buf[:message['size']])
+    finally:
+        block.close()
+    return json.loads(data.decode('utf-8'))
+
+def release(block):
+    """Libera um bloco de memória compartilhada criado por encode_payload."""
+    if block is None:
+        return
+    block.close()
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
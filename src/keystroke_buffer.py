@@ -0,0 +1,226 @@
+# src/keystroke_buffer.py
+# Agrupamento de teclas enviadas à interface do Guardian.
+# Os fluxos enviam muitas sequências curtas seguidas para a mesma janela
+# ('^a{DELETE}', o código, '{ENTER}'); cada type_keys do pywinauto traz a janela
+# para frente e paga as pausas entre teclas. Aqui os envios consecutivos para o
+# mesmo elemento são juntados em uma única chamada, feita só quando o fluxo
+# precisa observar a interface: antes de qualquer leitura, espera ou busca de
+# diálogo (qualquer outra operação do driver), ao trocar de janela ou de passo.
+# Um envio que pode abrir um diálogo (ENTER, F2) não é juntado com os seguintes:
+# antes de cada chamada os diálogos já abertos são dispensados (ver _send).
+# Cada passo acumula o tempo gasto enviando teclas, com e sem agrupamento
+# ([Keystrokes] coalesce), para comparar as duas formas.
+import logging
+import time
+
+import dialog_watcher
+import ui_driver
+
+# Teclas depois das quais o Guardian pode abrir um diálogo
+DIALOG_TRIGGER_KEYS = ('{ENTER', '~', '{F2}')
+
+def to_plain_keys(keys, with_spaces):
+    """
+    Reescreve a sequência para ser enviada com with_spaces=False, o que permite
+    juntar trechos com e sem with_spaces: espaços fora de chaves viram '{SPACE}'
+    (with_spaces=True) ou são descartados, como o pywinauto faria (with_spaces=False).
+    """
+    result = []
+    i = 0
+    while i < len(keys):
+        char = keys[i]
+        if char == '{':
+            # '{ENTER 3}' mantém o espaço; o nome tem ao menos um caractere ('{}}' é a chave)
+            end = keys.find('}', i + 2)
+            end = len(keys) - 1 if end == -1 else end
+            result.append(keys[i:end + 1])
+            i = end + 1
+            continue
+        if char == ' ':
+            if with_spaces:
+                result.append('{SPACE}')
+        else:
+            result.append(char)
+        i += 1
+    return ''.join(result)
+
+class StepInputStats:
+    """Envio de teclas acumulado em um passo do fluxo."""
+    def __init__(self):
+        self.sends = 0
+        self.calls = 0
+        self.keys = 0
+        self.send_time = 0.0
+
+class KeystrokeBuffer(ui_driver.UIDriver):
+    """
+    Envolve o driver da sessão: type_keys acumula as teclas e as demais operações
+    enviam o que estiver pendente antes de consultar a interface.
+    coalesce=False envia cada type_keys na hora (medição do comportamento anterior).
+    pause: pausa entre as teclas repassada ao driver (None usa a padrão dele).
+    max_keys: envia o acumulado ao passar desse tamanho.
+    """
+    def __init__(self, driver, coalesce=True, pause=None, max_keys=200):
+        super().__init__(driver.selectors)
+        self.driver = driver
+        self.name = driver.name
+        self.synchronous = driver.synchronous
+        self.max_wait = driver.max_wait
+        self.coalesce = coalesce
+        self.pause = pause
+        self.max_keys = max_keys
+        self.current_step = None
+        self.steps = {}
+        self._target = None
+        self._pending = []
+
+    # -------------------------------------------------------------------------
+    # Teclas
+    # -------------------------------------------------------------------------
+    def type_keys(self, element, keys, with_spaces=False, pause=None):
+        if not keys:
+            return
+        self._stats().sends += 1
+        if not self.coalesce:
+            self._send(element, keys, with_spaces, pause)
+            return
+        if self._target is not None and self._target is not element:
+            self.flush()
+        self._target = element
+        segment = to_plain_keys(keys, with_spaces)
+        self._pending.append(segment)
+        may_open_dialog = any(key in segment.upper() for key in DIALOG_TRIGGER_KEYS)
+        if may_open_dialog or sum(len(segment) for segment in self._pending) >= self.max_keys:
+            self.flush()
+
+    def flush(self):
+        """Envia as teclas acumuladas em uma única chamada."""
+        if not self._pending:
+            return
+        target, keys = self._target, ''.join(self._pending)
+        self._target = None
+        self._pending = []
+        self._send(target, keys, False, None)
+
+    def begin_run(self, test_name):
+        self.flush()
+        self.current_step = None
+        self.steps = {}
+        self.driver.begin_run(test_name)
+
+    def step(self, name):
+        """Passo atual do fluxo: as teclas pendentes do passo anterior são enviadas antes."""
+        self.flush()
+        self.current_step = name
+        self.driver.step(name)
+
+    def _send(self, element, keys, with_spaces, pause):
+        stats = self._stats()
+        start = time.perf_counter()
+        with dialog_watcher.input_lock():
+            # Um diálogo que apareceu depois das últimas teclas receberia estas
+            dialog_watcher.dismiss_pending()
+            self.driver.type_keys(element, keys, with_spaces=with_spaces, pause=pause if pause is not None else self.pause)
+        stats.send_time += time.perf_counter() - start
+        stats.calls += 1
+        stats.keys += len(keys)
+
+    def _stats(self):
+        return self.steps.setdefault(self.current_step or 'sem passo', StepInputStats())
+
+    # -------------------------------------------------------------------------
+    # Demais operações: enviam o pendente e repassam ao driver
+    # -------------------------------------------------------------------------
+    def main_window(self, backend='win32', timeout=None):
+        self.flush()
+        return self.driver.main_window(backend, timeout)
+
+    def find(self, parent, name, timeout=None, criteria=None, wait_for='exists visible'):
+        self.flush()
+        return self.driver.find(parent, name, timeout, criteria, wait_for)
+
+    def find_window(self, criteria, timeout=None):
+        self.flush()
+        return self.driver.find_window(criteria, timeout)
+
+    def exists(self, parent, name, criteria=None):
+        self.flush()
+        return self.driver.exists(parent, name, criteria)
+
+    def set_focus(self, element):
+        self.flush()
+        self.driver.set_focus(element)
+
+    def invoke(self, parent, name, timeout=None):
+        self.flush()
+        self.driver.invoke(parent, name, timeout)
+
+    def window_text(self, element):
+        self.flush()
+        return self.driver.window_text(element)
+
+    def process_id(self, element):
+        return self.driver.process_id(element)
+
+    def is_active(self, element):
+        self.flush()
+        return self.driver.is_active(element)
+
+    def has_focus(self, element):
+        self.flush()
+        return self.driver.has_focus(element)
+
+    def focused_control(self, element):
+        self.flush()
+        return self.driver.focused_control(element)
+
+    def focused_text(self, element):
+        self.flush()
+        return self.driver.focused_text(element)
+
+    def visible_dialogs(self, class_name, process=None):
+        # Chamado pelo vigia de diálogos em outra thread: não envia as teclas do fluxo
+        return self.driver.visible_dialogs(class_name, process)
+
+    def dialog_keys(self, handle, keys):
+        # Idem: as teclas pendentes do fluxo vão depois do diálogo ser dispensado
+        self.driver.dialog_keys(handle, keys)
+
+    def run_problems(self):
+        self.flush()
+        return self.driver.run_problems()
+
+    def log_summary(self):
+        self.flush()
+        if self.steps:
+            mode = 'agrupadas' if self.coalesce else 'sem agrupamento'
+            logging.info(f"Envio de teclas por passo, {mode} (passo | type_keys pedidos | chamadas | tempo | por pedido):")
+            for name, stats in sorted(self.steps.items(), key=lambda item: item[1].send_time, reverse=True):
+                logging.info(
+                    f"  {name} | {stats.sends} | {stats.calls} | {stats.send_time:.3f}s | "
+                    f"{stats.send_time / stats.sends * 1000:.1f}ms"
+                )
+            sends = sum(stats.sends for stats in self.steps.values())
+            calls = sum(stats.calls for stats in self.steps.values())
+            total = sum(stats.send_time for stats in self.steps.values())
+            logging.info(f"Teclas: {sends} envio(s) em {calls} chamada(s), {total:.3f}s no total.")
+        self.driver.log_summary()
+
+    def close(self):
+        self.flush()
+        self.driver.close()
+
+# =============================================================================
+# CONFIGURAÇÃO
+# =============================================================================
+def wrap(driver, keystroke_config=None):
+    """Envolve o driver conforme a seção [Keystrokes] do config.ini."""
+    if keystroke_config is None:
+        return KeystrokeBuffer(driver)
+    pause = keystroke_config.get('pause', '').strip()
+    return KeystrokeBuffer(
+        driver,
+        coalesce=keystroke_config.getboolean('coalesce', True),
+        pause=float(pause) if pause else None,
+        max_keys=keystroke_config.getint('max_keys', 200),
+    )
@@ -1,4 +1,5 @@
 # src/main.py
+import argparse
 import logging
 import configparser
 import json
@@ -7,16 +8,22 @@ import sys
 # Módulos da automação
 from logger_config import setup_logger
 from db_handler import DBHandler
+import gui_client
+import selection_policy
+import session_trace
+import spans
+import ui_driver
+import wait_engine
 
 # Módulos de Teste
-from tests import test_dav_creation_new
+from tests import test_dav_creation
 from tests import test_load_assembly
 
 # Mapeamento dos testes disponíveis
 AVAILABLE_TESTS = {
     "1": {
         "name": "Criação de Documento Auxiliar de Venda (DAV)",
-        "function": test_dav_creation_new.run
+        "function": test_dav_creation.run
     },
     "2": {
         "name": "Montagem de carga",
@@ -38,7 +45,36 @@ def display_menu():
     print("-"*50)
     return input("Escolha o teste que deseja executar: ").strip().upper()
 
+def parse_args():
+    """Argumentos para execução em lote, sem o menu interativo."""
+    parser = argparse.ArgumentParser(description="Test runner da automação Guardian.")
+    parser.add_argument('--test', help="Código do teste a executar sem exibir o menu (ex.: 1).")
+    parser.add_argument('--runs', type=int, default=1, help="Quantas vezes executar o teste (padrão: 1).")
+    parser.add_argument('--record', action='store_true', help="Grava as execuções bem-sucedidas para reprodução.")
+    parser.add_argument('--replay', help="Reproduz uma sessão gravada (arquivo JSON) e encerra.")
+    return parser.parse_args()
+
+def run_test(selected_test, db_handler, selectors, config, record=False):
+    """
+    Executa um teste; com record, grava a sessão se o teste terminar sem erros
+    (e sem esperas esgotadas nem diálogos fora do previsto, ver session_trace.stop_recording).
+    """
+    if not record:
+        return selected_test["function"](db_handler, selectors, config)
+    test_name = selected_test["function"].__module__.split('.')[-1]
+    session_trace.start_recording(test_name)
+    succeeded = False
+    try:
+        succeeded = bool(selected_test["function"](db_handler, selectors, config))
+    finally:
+        trace_dir = config.get('Replay', 'trace_dir', fallback='logs/traces')
+        session_trace.stop_recording(save=succeeded, trace_dir=trace_dir)
+    if not succeeded:
+        logging.warning("Teste não terminou com sucesso: sessão não gravada.")
+    return succeeded
+
 def main():
+    args = parse_args()
     setup_logger()
     logging.info("================ INICIANDO TEST RUNNER ================")
     db_handler = None
@@ -50,8 +86,40 @@ def main():
         with open('config/selectors.json', 'r', encoding='utf-8') as f:
             selectors = json.load(f)
 
+        # Esperas por condição entre as teclas (intervalos e prazo padrão)
+        wait_engine.configure(config['Waits'] if config.has_section('Waits') else None)
+
+        # Intervalos por passo, consulta e diálogo de cada execução (relatório e trace em logs/)
+        spans.configure(config['Spans'] if config.has_section('Spans') else None)
+
+        # Driver da interface: pywinauto (Guardian real) ou o simulador em memória
+        ui_driver.configure(config, selectors)
+
+        # Reprodução de uma sessão gravada: não usa o banco nem as GUIs de seleção
+        if args.replay:
+            session_trace.replay(args.replay, selectors, config)
+            return
+
         # Instanciar DBHandler
-        db_handler = DBHandler(config['Database'])
+        cache_config = config['Cache'] if config.has_section('Cache') else None
+        db_handler = DBHandler(config['Database'], cache_config)
+
+        # Política de seleção: 'gui' abre os diálogos; as demais escolhem sozinhas
+        policy = selection_policy.configure(config['Selection'] if config.has_section('Selection') else None)
+
+        # Servidor dos diálogos de seleção: um único processo Qt para toda a sessão
+        if not policy.headless:
+            gui_client.start_gui_server()
+
+        # Execução em lote: roda o teste pedido N vezes e encerra
+        if args.test:
+            selected_test = AVAILABLE_TESTS.get(args.test)
+            if not selected_test:
+                raise ValueError(f"Teste desconhecido: {args.test}")
+            for run_number in range(1, args.runs + 1):
+                logging.info(f"Execução {run_number}/{args.runs}: {selected_test['name']}")
+                run_test(selected_test, db_handler, selectors, config, args.record)
+            return
         
         # Loop do Menu
         while True:
@@ -62,13 +130,15 @@ def main():
             selected_test = AVAILABLE_TESTS.get(choice)
             if selected_test:
                 # Executa a função do teste selecionado
-                selected_test["function"](db_handler, selectors, config)
+                run_test(selected_test, db_handler, selectors, config, args.record)
             else:
                 print("Opção inválida. Tente novamente.")
 
     except Exception as e:
         logging.critical(f"Falha crítica na execução: {e}", exc_info=True)
     finally:
+        gui_client.shutdown_gui_server()
+        ui_driver.close()
         if db_handler:
             db_handler.close_pool()
         logging.info("================ FINALIZANDO EXECUÇÃO ================\n")
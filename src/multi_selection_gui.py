@@ -1,9 +1,87 @@
 # src/multi_selection_gui.py
 import sys
 import json
-from PySide6.QtWidgets import (QApplication, QDialog, QTableWidget, QTableWidgetItem, 
-                               QVBoxLayout, QPushButton, QHeaderView, QCheckBox, QWidget, QHBoxLayout)
-from PySide6.QtCore import Qt
+import time
+
+_start_time = time.perf_counter()
+
+from PySide6.QtWidgets import (QApplication, QDialog, QTableView, QVBoxLayout, QPushButton,
+                               QHeaderView, QAbstractItemView, QLabel)
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+from gui_transport import decode_payload
+
+class ItemsTableModel(QAbstractTableModel):
+    """
+    Modelo da tabela de seleção múltipla. A view só pede os dados das linhas
+    visíveis; o estado das caixas fica em um bytearray (1 byte por linha) e as
+    linhas marcadas em um conjunto, para coletar a seleção em O(selecionados).
+    """
+    def __init__(self, items, headers):
+        super().__init__()
+        self.items = items
+        self.headers = headers
+        # O nome da chave no dicionário é o header em minúsculas (coluna 0 é o checkbox)
+        self.keys = [header.lower() for header in headers[1:]]
+        self.checked = bytearray(len(items))
+        self.checked_rows = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        if col == 0:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if self.checked[row] else Qt.Unchecked
+            return None
+        if role == Qt.DisplayRole:
+            return str(self.items[row].get(self.keys[col - 1], ''))
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or index.column() != 0 or role != Qt.CheckStateRole:
+            return False
+        row = index.row()
+        is_checked = Qt.CheckState(value) == Qt.Checked
+        self.checked[row] = 1 if is_checked else 0
+        if is_checked:
+            self.checked_rows.add(row)
+        else:
+            self.checked_rows.discard(row)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if index.column() == 0:
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def append_items(self, new_items):
+        """Acrescenta linhas no fim da tabela (carregamento progressivo)."""
+        if not new_items:
+            return
+        first = len(self.items)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_items) - 1)
+        self.items.extend(new_items)
+        self.checked.extend(bytes(len(new_items)))
+        self.endInsertRows()
+
+    def selected_codes(self):
+        """Códigos das linhas marcadas, na ordem da tabela."""
+        return [self.items[row].get('codigo_produto') for row in sorted(self.checked_rows)]
 
 class MultiSelectionDialog(QDialog):
     def __init__(self, title, items, headers):
@@ -14,57 +92,58 @@ class MultiSelectionDialog(QDialog):
         self.headers = headers
         self.resize(800, 600)
         self.layout = QVBoxLayout()
-        self.table_widget = QTableWidget()
-        self.table_widget.setColumnCount(len(self.headers))
-        self.table_widget.setHorizontalHeaderLabels(self.headers)
-        self.table_widget.setRowCount(len(self.items))
-
-        for row, item_data in enumerate(self.items):
-            # Coluna 0: Checkbox
-            checkbox_widget = QWidget()
-            checkbox_layout = QHBoxLayout(checkbox_widget)
-            checkbox = QCheckBox()
-            checkbox_layout.addWidget(checkbox)
-            checkbox_layout.setAlignment(Qt.AlignCenter)
-            checkbox_widget.setLayout(checkbox_layout)
-            self.table_widget.setCellWidget(row, 0, checkbox_widget)
-
-            # Outras colunas
-            for col, header in enumerate(self.headers[1:], 1):
-                # O nome da chave no dicionário é o header em minúsculas
-                key = header.lower()
-                table_item = QTableWidgetItem(str(item_data.get(key, '')))
-                table_item.setData(Qt.UserRole, item_data.get('codigo_produto')) # Armazena o código no item
-                self.table_widget.setItem(row, col, table_item)
-
-        self.table_widget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+
+        self.model = ItemsTableModel(self.items, self.headers)
+        self.table_view = QTableView()
+        self.table_view.setModel(self.model)
+        self.table_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # Altura fixa das linhas: a view não precisa medir cada linha do catálogo
+        self.table_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table_view.verticalHeader().setDefaultSectionSize(self.table_view.fontMetrics().height() + 8)
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # Indicador do carregamento progressivo (oculto quando os dados chegam de uma vez)
+        self.status_label = QLabel()
+        self.status_label.hide()
         self.ok_button = QPushButton("OK")
 
-        self.layout.addWidget(self.table_widget)
+        self.layout.addWidget(self.table_view)
+        self.layout.addWidget(self.status_label)
         self.layout.addWidget(self.ok_button)
         self.setLayout(self.layout)
         self.ok_button.clicked.connect(self.on_ok)
 
+    def append_items(self, new_items):
+        """Recebe mais uma página de itens enquanto o diálogo está aberto."""
+        self.model.append_items(new_items)
+
+    def set_progress(self, loaded, total, done):
+        if done:
+            self.status_label.setText(f"{loaded} itens carregados.")
+        else:
+            self.status_label.setText(f"Carregando {loaded}/{total if total is not None else '?'}...")
+        self.status_label.show()
+
     def on_ok(self):
-        for row in range(self.table_widget.rowCount()):
-            if self.table_widget.cellWidget(row, 0).findChild(QCheckBox).isChecked():
-                # Pega o código do produto armazenado no item da segunda coluna
-                product_code = self.table_widget.item(row, 1).data(Qt.UserRole)
-                self.selected_codes.append(product_code)
+        self.selected_codes = self.model.selected_codes()
         self.accept()
 
 def main():
-    data_file = 'temp_gui_data.json'
+    # O runner pode iniciar este processo antes de ter os dados: o Qt carrega enquanto
+    # a consulta roda e o aviso de pronto vai pelo stderr (o stdout é a resposta)
+    app = QApplication(sys.argv)
+    sys.stderr.write(json.dumps({'event': 'ready', 'startup': time.perf_counter() - _start_time}) + '\n')
+    sys.stderr.flush()
+
+    # Os dados chegam pelo stdin (ou por memória compartilhada, para catálogos grandes)
     try:
-        with open(data_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        sys.stdin.reconfigure(encoding='utf-8')
+        data = decode_payload(json.loads(sys.stdin.read()))
         title = data.get('title', 'Selecione os Itens')
         items = data.get('items', [])
         headers = data.get('headers', [])
     except Exception:
         sys.exit(1)
 
-    app = QApplication(sys.argv)
     dialog = MultiSelectionDialog(title, items, headers)
     dialog.exec()
 
@@ -73,4 +152,4 @@ def main():
     sys.exit(0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
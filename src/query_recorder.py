@@ -0,0 +1,86 @@
+# src/query_recorder.py
+import difflib
+import gzip
+import logging
+import os
+import pickle
+import threading
+from collections import defaultdict, deque
+
+class ReplayMismatchError(Exception):
+    """Query executada em modo replay que não existe na fixture gravada."""
+
+def _normalize(query):
+    return ' '.join(query.split())
+
+def _params_key(params):
+    return repr(tuple(params)) if params else ''
+
+class QueryRecorder:
+    """Grava cada query executada (SQL, parâmetros e resultado) em uma fixture local."""
+    def __init__(self, path):
+        self.path = path
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def record(self, query, params, df):
+        with self._lock:
+            self._entries.append({
+                'query': _normalize(query),
+                'params': _params_key(params),
+                'result': df.copy(),
+            })
+
+    def save(self):
+        """Grava a fixture compactada (pickle + gzip)."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            entries = list(self._entries)
+        with gzip.open(self.path, 'wb') as f:
+            pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        logging.info(f"Fixture com {len(entries)} query(s) gravada em '{self.path}'.")
+
+class QueryReplayer:
+    """
+    Responde às queries a partir de uma fixture gravada, sem acessar o banco.
+    Execuções repetidas da mesma query são servidas na ordem gravada; depois
+    de esgotadas, o último resultado continua sendo reutilizado.
+    """
+    def __init__(self, path):
+        self.path = path
+        with gzip.open(path, 'rb') as f:
+            entries = pickle.load(f)
+        self._results = defaultdict(deque)
+        for entry in entries:
+            self._results[(entry['query'], entry['params'])].append(entry['result'])
+        self._lock = threading.Lock()
+        logging.info(f"Modo replay: {len(entries)} query(s) carregadas de '{path}'.")
+
+    def replay(self, query, params=None):
+        key = (_normalize(query), _params_key(params))
+        with self._lock:
+            results = self._results.get(key)
+            if not results:
+                raise ReplayMismatchError(self._describe_mismatch(*key))
+            result = results.popleft() if len(results) > 1 else results[0]
+        # Cópia: os fluxos alteram os DataFrames (ex.: renomeiam colunas)
+        return result.copy()
+
+    def _describe_mismatch(self, query, params):
+        """Monta a mensagem de erro com o diff para a query gravada mais parecida."""
+        recorded = list(self._results)
+        if not recorded:
+            return f"Fixture '{self.path}' está vazia. Query não gravada: {query} {params}"
+        same_query = [item for item in recorded if item[0] == query]
+        if same_query:
+            known = ', '.join(item[1] or '()' for item in same_query)
+            return f"Query gravada com outros parâmetros.\nParâmetros pedidos: {params or '()'}\nGravados: {known}\nQuery: {query}"
+
+        closest = max(recorded, key=lambda item: difflib.SequenceMatcher(None, item[0], query).quick_ratio())
+        diff = difflib.unified_diff(
+            closest[0].split(), query.split(), fromfile='gravada', tofile='executada', lineterm='', n=3
+        )
+        return (f"Query não encontrada na fixture '{self.path}'. Diferença para a mais parecida:\n"
+                + '\n'.join(diff) + f"\nParâmetros: gravados {closest[1] or '()'} / pedidos {params or '()'}")
@@ -0,0 +1,119 @@
+# src/reference_cache.py
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+class ReferenceDataCache:
+    """
+    Cache em disco (SQLite) para dados de referência que mudam pouco, como
+    naturezas, vendedores, filiais, formas de pagamento e clientes.
+    As entradas expiram por TTL, são despejadas por tamanho (LRU) e o cache
+    inteiro é invalidado quando a versão do banco do Guardian muda.
+    environment ('host:porta/banco') separa um arquivo por banco: dois ambientes
+    com a mesma versão do Guardian não compartilham clientes nem a versão gravada.
+    """
+    def __init__(self, cache_dir='cache', ttl_seconds=86400, max_size_mb=256, environment=None):
+        os.makedirs(cache_dir, exist_ok=True)
+        filename = 'reference_data.sqlite3'
+        if environment:
+            suffix = hashlib.sha256(environment.encode('utf-8')).hexdigest()[:16]
+            filename = f'reference_data_{suffix}.sqlite3'
+        self.path = os.path.join(cache_dir, filename)
+        self.environment = environment
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL,
+                payload BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        if environment:
+            # Só informativo: identifica o banco dono do arquivo
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('environment', ?)", (environment,))
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(query, params=None):
+        """Gera a chave da entrada a partir do texto da query e dos parâmetros."""
+        normalized = ' '.join(query.split())
+        return hashlib.sha256(f"{normalized}|{params!r}".encode('utf-8')).hexdigest()
+
+    def ensure_version(self, version):
+        """Limpa o cache se a versão do banco for diferente da gravada."""
+        version = str(version)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'db_version'").fetchone()
+            if row is not None and row[0] == version:
+                return
+            if row is not None:
+                logging.info(f"Versão do banco mudou ({row[0]} -> {version}). Invalidando cache de referência.")
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('db_version', ?)", (version,))
+            self._conn.commit()
+
+    def get(self, key):
+        """Retorna o DataFrame guardado ou None se não existir ou estiver expirado."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT created_at, payload FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            created_at, payload = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return pickle.loads(payload)
+
+    def put(self, key, df):
+        """Grava o DataFrame e despeja as entradas menos usadas se o limite de tamanho for excedido."""
+        payload = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_size_bytes:
+            logging.info(f"Resultado de {len(payload)} bytes excede o limite do cache; não será armazenado.")
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, created_at, last_access, size, payload) VALUES (?, ?, ?, ?, ?)",
+                (key, now, now, len(payload), payload)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def clear(self):
+        """Remove todas as entradas."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if total <= self.max_size_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            logging.info(f"Entrada do cache de referência despejada por tamanho ({size} bytes).")
@@ -1,8 +1,110 @@
 # src/selection_gui.py
 import sys
 import json
-from PySide6.QtWidgets import QApplication, QDialog, QListWidget, QVBoxLayout, QPushButton
-from PySide6.QtCore import Qt
+import time
+import unicodedata
+from array import array
+
+_start_time = time.perf_counter()
+
+from PySide6.QtWidgets import QApplication, QDialog, QListView, QLineEdit, QLabel, QVBoxLayout, QPushButton
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex
+
+from gui_transport import decode_payload
+
+def _normalize(text):
+    """Minúsculas e sem acentos, para a busca ignorar 'ç', 'ã', etc."""
+    decomposed = unicodedata.normalize('NFKD', str(text).casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+class SearchIndex:
+    """
+    Índice de busca por substring sobre código e descrição dos itens.
+    Mantém listas de ocorrência por bigrama: a busca parte da lista mais curta
+    entre os bigramas do termo e só confirma a substring nesses candidatos.
+    Quando o termo apenas cresce (digitação), filtra o resultado anterior.
+    """
+    def __init__(self, items):
+        self.codes = []
+        self.keys = []
+        self.postings = {}
+        self._last_query = ''
+        self._last_rows = []
+        self.add_items(items)
+
+    def add_items(self, items):
+        """
+        Indexa novos itens (carregamento progressivo) e retorna os índices
+        dos que atendem ao termo de busca atual.
+        """
+        start = len(self.keys)
+        for row, item in enumerate(items, start):
+            key = _normalize(f"{item['code']} {item['display']}")
+            self.codes.append(_normalize(item['code']))
+            self.keys.append(key)
+            for gram in {key[i:i + 2] for i in range(len(key) - 1)}:
+                self.postings.setdefault(gram, array('I')).append(row)
+        new_rows = range(start, len(self.keys))
+        matches = [row for row in new_rows if self._last_query in self.keys[row]]
+        self._last_rows.extend(matches)
+        return matches
+
+    def search(self, text):
+        """Retorna os índices dos itens que contêm o termo; prefixos de código vêm primeiro."""
+        query = _normalize(text).strip()
+        if not query:
+            rows = list(range(len(self.keys)))
+        elif self._last_query and query.startswith(self._last_query):
+            rows = [row for row in self._last_rows if query in self.keys[row]]
+        elif len(query) == 1:
+            rows = [row for row, key in enumerate(self.keys) if query in key]
+        else:
+            grams = {query[i:i + 2] for i in range(len(query) - 1)}
+            candidates = min((self.postings.get(gram, array('I')) for gram in grams), key=len)
+            rows = [row for row in candidates if query in self.keys[row]]
+
+        self._last_query = query
+        self._last_rows = rows
+        # Cópias: o modelo da lista não pode compartilhar a lista interna do índice
+        if not query:
+            return list(rows)
+        code_matches = [row for row in rows if self.codes[row].startswith(query)]
+        if not code_matches:
+            return list(rows)
+        code_set = set(code_matches)
+        return code_matches + [row for row in rows if row not in code_set]
+
+class FilteredItemsModel(QAbstractListModel):
+    """Modelo da lista: exibe apenas as linhas do filtro atual, por índice no item original."""
+    def __init__(self, items):
+        super().__init__()
+        self.items = items
+        self.rows = list(range(len(items)))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role == Qt.DisplayRole:
+            return self.items[self.rows[index.row()]]['display']
+        return None
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def append_rows(self, rows):
+        """Acrescenta linhas ao fim do filtro atual sem perder a seleção do usuário."""
+        if not rows:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+
+    def item_at(self, row):
+        return self.items[self.rows[row]]
 
 class SelectionDialog(QDialog):
     def __init__(self, title, items):
@@ -10,43 +112,86 @@ class SelectionDialog(QDialog):
         self.setWindowTitle(title)
         self.selected_code = None
         self.items = items
+        self.index = SearchIndex(self.items)
 
         self.layout = QVBoxLayout()
-        self.list_widget = QListWidget()
-        for item in self.items:
-            self.list_widget.addItem(item['display'])
-        
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Buscar por código ou descrição...")
+        self.model = FilteredItemsModel(self.items)
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setModel(self.model)
+
+        # Indicador do carregamento progressivo (oculto quando os dados chegam de uma vez)
+        self.status_label = QLabel()
+        self.status_label.hide()
         self.ok_button = QPushButton("OK")
 
-        self.layout.addWidget(self.list_widget)
+        self.layout.addWidget(self.search_box)
+        self.layout.addWidget(self.list_view)
+        self.layout.addWidget(self.status_label)
         self.layout.addWidget(self.ok_button)
         self.setLayout(self.layout)
 
         self.ok_button.clicked.connect(self.on_ok)
-        self.list_widget.itemDoubleClicked.connect(self.on_ok)
-        self.list_widget.setCurrentRow(0)
-        self.list_widget.setFocus()
+        self.list_view.doubleClicked.connect(self.on_ok)
+        self.search_box.textChanged.connect(self.on_search)
+        self.search_box.returnPressed.connect(self.on_ok)
+        self._select_first_row()
+        self.search_box.setFocus()
+
+    def keyPressEvent(self, event):
+        # Seta para baixo na busca passa o foco para a lista
+        if event.key() == Qt.Key_Down and self.search_box.hasFocus():
+            self.list_view.setFocus()
+            return
+        super().keyPressEvent(event)
+
+    def append_items(self, new_items):
+        """Recebe mais uma página de itens enquanto o diálogo está aberto."""
+        matches = self.index.add_items(new_items)
+        self.items.extend(new_items)
+        self.model.append_rows(matches)
+        if not self.list_view.currentIndex().isValid():
+            self._select_first_row()
+
+    def set_progress(self, loaded, total, done):
+        if done:
+            self.status_label.setText(f"{loaded} itens carregados.")
+        else:
+            self.status_label.setText(f"Carregando {loaded}/{total if total is not None else '?'}...")
+        self.status_label.show()
+
+    def on_search(self, text):
+        self.model.set_rows(self.index.search(text))
+        self._select_first_row()
+
+    def _select_first_row(self):
+        if self.model.rowCount() > 0:
+            self.list_view.setCurrentIndex(self.model.index(0, 0))
 
     def on_ok(self):
-        selected_item = self.list_widget.currentItem()
-        if selected_item:
-            for item in self.items:
-                if item['display'] == selected_item.text():
-                    self.selected_code = item['code']
-                    break
+        current = self.list_view.currentIndex()
+        if current.isValid():
+            self.selected_code = self.model.item_at(current.row())['code']
         self.accept()
 
 def main():
-    data_file = 'temp_gui_data.json'
+    # O runner pode iniciar este processo antes de ter os dados: o Qt carrega enquanto
+    # a consulta roda e o aviso de pronto vai pelo stderr (o stdout é a resposta)
+    app = QApplication(sys.argv)
+    sys.stderr.write(json.dumps({'event': 'ready', 'startup': time.perf_counter() - _start_time}) + '\n')
+    sys.stderr.flush()
+
+    # Os dados chegam pelo stdin (ou por memória compartilhada, para catálogos grandes)
     try:
-        with open(data_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        sys.stdin.reconfigure(encoding='utf-8')
+        data = decode_payload(json.loads(sys.stdin.read()))
         title = data.get('title', 'Selecione um Item')
         items = data.get('items', [])
     except Exception:
         sys.exit(1)
 
-    app = QApplication(sys.argv)
     dialog = SelectionDialog(title, items)
     dialog.exec()
 
@@ -54,8 +199,8 @@ def main():
     # Se um código foi selecionado, imprime ele na saída padrão (stdout)
     if dialog.selected_code:
         print(dialog.selected_code)
-    
+
     sys.exit(0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,133 @@
+# src/selection_gui_server.py
+# Servidor de diálogos de seleção: um único processo Python + QApplication atende
+# todos os diálogos da sessão do runner. Protocolo: uma mensagem JSON por linha.
+#   stdin : {"id": 1, "kind": "single"|"multi", "payload": {"title": ..., "items": [...], "headers": [...]}}
+#           {"id": 1, "kind": ..., "shm": nome, "size": bytes}  (payload em memória compartilhada)
+#           {"id": 1, ..., "streaming": true, "total": M}       (abre já com a primeira página)
+#           {"id": 1, "append": true, "payload": {"items": [...]}} (páginas seguintes)
+#           {"id": 1, "end": true}                               (fim das páginas)
+#           {"cmd": "shutdown"}
+#   stdout: {"event": "ready", "startup": segundos}
+#           {"id": 1, "event": "loaded"}                         (recebeu todas as páginas)
+#           {"id": 1, "result": "codigo" | ["cod1", "cod2"] | null}
+import sys
+import json
+import time
+
+_start_time = time.perf_counter()
+
+from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QObject, QThread, Signal
+
+from gui_transport import decode_payload
+from selection_gui import SelectionDialog
+from multi_selection_gui import MultiSelectionDialog
+
+def _send(message):
+    sys.stdout.write(json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+class RequestReader(QThread):
+    """Lê o stdin em segundo plano para que páginas cheguem com o diálogo já aberto."""
+    message_received = Signal(object)
+
+    def run(self):
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            message = json.loads(line)
+            self.message_received.emit(message)
+            if message.get('cmd') == 'shutdown':
+                return
+        # stdin fechado: o runner terminou
+        self.message_received.emit({'cmd': 'shutdown'})
+
+class DialogServer(QObject):
+    """Abre um diálogo por pedido e devolve a seleção quando ele é fechado."""
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self.current = None
+
+    def on_message(self, message):
+        if message.get('cmd') == 'shutdown':
+            if self.current is not None:
+                self.current['dialog'].reject()
+            self.app.quit()
+            return
+
+        if message.get('append') or message.get('end'):
+            # Páginas de um diálogo que o usuário já confirmou são descartadas
+            if self.current is None or self.current['id'] != message.get('id'):
+                return
+            dialog = self.current['dialog']
+            if message.get('append'):
+                dialog.append_items(decode_payload(message).get('items', []))
+            self.current['done'] = bool(message.get('end'))
+            dialog.set_progress(len(dialog.items), self.current['total'], self.current['done'])
+            if message.get('end'):
+                # O runner pode descartar as páginas que guardava para reenviar
+                _send({'id': message.get('id'), 'event': 'loaded'})
+            return
+
+        try:
+            self.open_dialog(message)
+        except Exception as e:
+            _send({'id': message.get('id'), 'error': str(e)})
+
+    def open_dialog(self, request):
+        payload = decode_payload(request)
+        title = payload.get('title', 'Selecione')
+        items = payload.get('items', [])
+        if request.get('kind') == 'multi':
+            dialog = MultiSelectionDialog(title, items, payload.get('headers', []))
+        else:
+            dialog = SelectionDialog(title, items)
+
+        streaming = bool(request.get('streaming'))
+        self.current = {
+            'id': request.get('id'),
+            'kind': request.get('kind'),
+            'dialog': dialog,
+            'total': request.get('total'),
+            'done': not streaming,
+        }
+        if streaming:
+            dialog.set_progress(len(items), request.get('total'), False)
+        dialog.finished.connect(self.on_finished)
+
+        # O processo fica em segundo plano entre um diálogo e outro; traz a janela para frente
+        dialog.show()
+        dialog.raise_()
+        dialog.activateWindow()
+
+    def on_finished(self):
+        current, self.current = self.current, None
+        if current is None:
+            return
+        dialog = current['dialog']
+        result = dialog.selected_codes if current['kind'] == 'multi' else dialog.selected_code
+        _send({'id': current['id'], 'result': result})
+        dialog.deleteLater()
+
+def main():
+    sys.stdin.reconfigure(encoding='utf-8')
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    app = QApplication(sys.argv)
+    # Fechar um diálogo não pode encerrar o servidor
+    app.setQuitOnLastWindowClosed(False)
+
+    server = DialogServer(app)
+    reader = RequestReader()
+    reader.message_received.connect(server.on_message)
+    reader.start()
+    _send({'event': 'ready', 'startup': time.perf_counter() - _start_time})
+
+    app.exec()
+    reader.wait()
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# src/selection_policy.py
+# Políticas de seleção usadas pelos testes nas etapas de escolha (filial, natureza,
+# cliente, produtos, quantidades...). A política 'gui' abre os diálogos PySide6 para o usuário;
+# as demais escolhem sozinhas, sem abrir nenhum processo de GUI, para execuções em
+# lote. Toda escolha é registrada e gravada em um arquivo de cenário por execução,
+# que pode ser reproduzido depois com a política 'scenario'.
+import json
+import logging
+import os
+import random
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import pandas as pd
+
+HEADLESS_POLICIES = ('random', 'first_n', 'stock_weighted', 'scenario')
+
+class ScenarioMismatchError(Exception):
+    """O cenário não tem a etapa pedida ou o código gravado não existe mais nos dados."""
+
+class SelectionPolicy(ABC):
+    """
+    Política base: registro das escolhas e gravação do cenário. Cada política
+    implementa choose_one/choose_many; a 'gui' (GuiPolicy) só registra o que o
+    usuário escolheu nos diálogos.
+    """
+    name = None
+    headless = False
+
+    def __init__(self, scenario_dir=None):
+        self.scenario_dir = scenario_dir
+        self.test_name = None
+        self.run_number = 0
+        self.choices = {}
+
+    def begin_run(self, test_name):
+        """Inicia o registro das escolhas de uma execução de teste."""
+        self.test_name = test_name
+        self.run_number += 1
+        self.choices = {}
+
+    def record(self, step, selection):
+        """Guarda a escolha de uma etapa (código único ou lista de códigos)."""
+        self.choices[step] = selection
+        logging.info(f"Seleção [{self.name}] '{step}': {selection}")
+
+    def end_run(self):
+        """Grava o cenário da execução e retorna o caminho do arquivo (ou None)."""
+        if self.test_name is None or not self.choices or not self.scenario_dir:
+            return None
+        os.makedirs(self.scenario_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(self.scenario_dir, f"{self.test_name}_{timestamp}_{self.run_number:04d}.json")
+        scenario = {
+            'test': self.test_name,
+            'policy': self.name,
+            'run': self.run_number,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'choices': self.choices,
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(scenario, f, ensure_ascii=False, indent=2, default=str)
+        logging.info(f"Cenário da execução gravado em {path}.")
+        self.test_name = None
+        return path
+
+    @abstractmethod
+    def choose_one(self, step, items_df, code_column):
+        """Código escolhido na etapa, entre os de items_df[code_column]."""
+
+    @abstractmethod
+    def choose_many(self, step, items_df, code_column):
+        """Lista de códigos escolhidos na etapa."""
+
+    def choose_quantity(self, step, low, high):
+        """Inteiro entre low e high (inclusive), ex.: a quantidade de um item do DAV."""
+        return random.randint(low, high)
+
+class GuiPolicy(SelectionPolicy):
+    """O usuário escolhe nos diálogos PySide6; a política só registra as escolhas."""
+    name = 'gui'
+    headless = False
+
+    def choose_one(self, step, items_df, code_column):
+        raise RuntimeError(f"Etapa '{step}': com a política 'gui' a escolha é feita no diálogo de seleção, não pela política.")
+
+    def choose_many(self, step, items_df, code_column):
+        raise RuntimeError(f"Etapa '{step}': com a política 'gui' a escolha é feita no diálogo de seleção, não pela política.")
+
+class RandomPolicy(SelectionPolicy):
+    """Escolha aleatória reprodutível: a semente da execução N é seed + N."""
+    name = 'random'
+    headless = True
+
+    def __init__(self, seed=0, max_items=5, scenario_dir=None):
+        super().__init__(scenario_dir)
+        self.seed = seed
+        self.max_items = max_items
+        self.rng = random.Random(seed)
+
+    def begin_run(self, test_name):
+        super().begin_run(test_name)
+        run_seed = self.seed + self.run_number
+        self.rng = random.Random(run_seed)
+        logging.info(f"Semente da execução {self.run_number}: {run_seed}")
+
+    def choose_one(self, step, items_df, code_column):
+        return str(items_df[code_column].iloc[self.rng.randrange(len(items_df))])
+
+    def choose_many(self, step, items_df, code_column):
+        count = self.rng.randint(1, min(self.max_items, len(items_df)))
+        positions = sorted(self.rng.sample(range(len(items_df)), count))
+        return [str(code) for code in items_df[code_column].iloc[positions]]
+
+    def choose_quantity(self, step, low, high):
+        return self.rng.randint(low, high)
+
+class FirstNPolicy(SelectionPolicy):
+    """Sempre os primeiros itens da lista: o mesmo DAV a cada execução."""
+    name = 'first_n'
+    headless = True
+
+    def __init__(self, max_items=5, scenario_dir=None):
+        super().__init__(scenario_dir)
+        self.max_items = max_items
+
+    def choose_one(self, step, items_df, code_column):
+        return str(items_df[code_column].iloc[0])
+
+    def choose_many(self, step, items_df, code_column):
+        return [str(code) for code in items_df[code_column].iloc[:self.max_items]]
+
+    def choose_quantity(self, step, low, high):
+        return low
+
+class StockWeightedPolicy(RandomPolicy):
+    """
+    Como a aleatória, mas na seleção múltipla a chance de cada item é proporcional
+    ao estoque (itens sem estoque positivo não são escolhidos quando há alternativa).
+    """
+    name = 'stock_weighted'
+
+    def __init__(self, seed=0, max_items=5, stock_column='estoquedisponivel', scenario_dir=None):
+        super().__init__(seed, max_items, scenario_dir)
+        self.stock_column = stock_column
+
+    def choose_many(self, step, items_df, code_column):
+        if self.stock_column not in items_df.columns:
+            return super().choose_many(step, items_df, code_column)
+        stock = pd.to_numeric(items_df[self.stock_column], errors='coerce').fillna(0).clip(lower=0)
+        in_stock = stock[stock > 0]
+        if in_stock.empty:
+            return super().choose_many(step, items_df, code_column)
+
+        count = self.rng.randint(1, min(self.max_items, len(in_stock)))
+        positions = list(in_stock.index)
+        weights = list(in_stock.values)
+        chosen = []
+        # Sorteio ponderado sem reposição
+        for _ in range(count):
+            pick = self.rng.choices(range(len(positions)), weights=weights)[0]
+            chosen.append(positions.pop(pick))
+            weights.pop(pick)
+        return [str(code) for code in items_df.loc[sorted(chosen), code_column]]
+
+class ScenarioPolicy(SelectionPolicy):
+    """Repete as escolhas gravadas em um arquivo de cenário."""
+    name = 'scenario'
+    headless = True
+
+    def __init__(self, scenario_file, scenario_dir=None):
+        super().__init__(scenario_dir)
+        self.scenario_file = scenario_file
+        with open(scenario_file, 'r', encoding='utf-8') as f:
+            self.scenario = json.load(f)
+        logging.info(f"Cenário carregado de {scenario_file} (teste: {self.scenario.get('test')}).")
+
+    def _recorded(self, step):
+        choices = self.scenario.get('choices', {})
+        if step not in choices:
+            raise ScenarioMismatchError(f"O cenário {self.scenario_file} não tem a etapa '{step}'.")
+        return choices[step]
+
+    def choose_one(self, step, items_df, code_column):
+        code = self._recorded(step)
+        if code is not None and code not in set(items_df[code_column].astype(str)):
+            raise ScenarioMismatchError(f"Código '{code}' da etapa '{step}' não existe mais nos dados.")
+        return code
+
+    def choose_many(self, step, items_df, code_column):
+        codes = self._recorded(step) or []
+        missing = set(codes) - set(items_df[code_column].astype(str))
+        if missing:
+            raise ScenarioMismatchError(f"Códigos da etapa '{step}' não existem mais nos dados: {sorted(missing)}")
+        return codes
+
+    def choose_quantity(self, step, low, high):
+        quantity = int(self._recorded(step))
+        if not low <= quantity <= high:
+            raise ScenarioMismatchError(f"Quantidade {quantity} da etapa '{step}' fora do intervalo atual ({low} a {high}).")
+        return quantity
+
+def from_config(selection_config=None):
+    """Cria a política a partir da seção [Selection] do config.ini (padrão: 'gui')."""
+    if selection_config is None:
+        return GuiPolicy()
+    name = selection_config.get('policy', 'gui').strip().lower()
+    scenario_dir = selection_config.get('scenario_dir', 'logs/scenarios')
+    seed = selection_config.getint('seed', 0)
+    max_items = selection_config.getint('max_items', 5)
+
+    if name == 'gui':
+        return GuiPolicy(scenario_dir)
+    if name == 'random':
+        return RandomPolicy(seed, max_items, scenario_dir)
+    if name == 'first_n':
+        return FirstNPolicy(max_items, scenario_dir)
+    if name == 'stock_weighted':
+        return StockWeightedPolicy(seed, max_items, scenario_dir=scenario_dir)
+    if name == 'scenario':
+        return ScenarioPolicy(selection_config.get('scenario_file'), scenario_dir)
+    raise ValueError(f"Política de seleção desconhecida: '{name}'. Use gui, {', '.join(HEADLESS_POLICIES)}.")
+
+_policy = None
+
+def configure(selection_config=None):
+    """Define a política da sessão do runner."""
+    global _policy
+    _policy = from_config(selection_config)
+    logging.info(f"Política de seleção: {_policy.name}.")
+    return _policy
+
+def get_policy():
+    """Retorna a política da sessão (a GUI, se nenhuma foi configurada)."""
+    global _policy
+    if _policy is None:
+        _policy = GuiPolicy()
+    return _policy
@@ -0,0 +1,455 @@
+# src/session_trace.py
+# Gravação e reprodução de sessões da automação.
+# A gravação envolve o driver da sessão e registra tudo o que o fluxo faz na
+# interface (teclas, buscas, botões, esperas, passos) com os tempos observados,
+# além dos diálogos dispensados pelo vigia. Uma execução bem-sucedida vira um
+# arquivo JSON em [Replay] trace_dir.
+# A reprodução refaz as ações do arquivo sem consultar o banco nem abrir as GUIs
+# de seleção: cada busca ou espera tem como prazo o tempo observado na gravação
+# (vezes factor, mais margin) e o que não apareceu na gravação é verificado só
+# por margin segundos. O tempo gravado de uma espera é o tempo até a condição ser
+# observada; as pausas fixas (wait_engine.pause), que não têm condição, são
+# reproduzidas com a duração da gravação. Os pontos de verificação (elementos encontrados ou não,
+# textos de janela, valores dos campos após digitar, esperas atendidas) precisam
+# bater com a gravação; na primeira divergência a reprodução para.
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import dialog_watcher
+import ui_driver
+import wait_engine
+
+class ReplayMismatchError(Exception):
+    """A interface não se comportou como na gravação."""
+
+def _json_safe(value):
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+class Recorder(ui_driver.UIDriver):
+    """Envolve o driver da sessão e registra as operações do fluxo como eventos."""
+    def __init__(self, driver, test_name):
+        super().__init__(driver.selectors)
+        self.driver = driver
+        self.name = driver.name
+        self.synchronous = driver.synchronous
+        self.max_wait = driver.max_wait
+        self.test_name = test_name
+        self.events = []
+        self.current_step = None
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._labels = {}
+        self._elements = []
+        self._dialog_titles = {}
+
+    def record(self, op, **data):
+        event = {'op': op, 't': round(time.perf_counter() - self._start, 4)}
+        event.update(data)
+        self.events.append(event)
+        return event
+
+    def _bind(self, element, label):
+        # Guarda a referência para que o id() não seja reaproveitado por outro objeto
+        self._labels[id(element)] = label
+        self._elements.append(element)
+        return element
+
+    def _label(self, element):
+        return self._labels.get(id(element))
+
+    def mark_focus(self, element):
+        self.record('focus_mark', target=self._label(element))
+
+    def _timed_lookup(self, op, lookup, **data):
+        start = time.perf_counter()
+        try:
+            element = lookup()
+        except (ui_driver.ElementNotFound, ui_driver.WaitTimeout) as e:
+            self.record(op, found=False, error=type(e).__name__, elapsed=round(time.perf_counter() - start, 4), **data)
+            raise
+        self.record(op, found=True, elapsed=round(time.perf_counter() - start, 4), **data)
+        return element
+
+    # -------------------------------------------------------------------------
+    # Operações registradas
+    # -------------------------------------------------------------------------
+    def main_window(self, backend='win32', timeout=None):
+        element = self._timed_lookup(
+            'main_window', lambda: self.driver.main_window(backend, timeout), backend=backend, timeout=timeout
+        )
+        return self._bind(element, f'main_window:{backend}')
+
+    def find(self, parent, name, timeout=None, criteria=None, wait_for='exists visible'):
+        element = self._timed_lookup(
+            'find', lambda: self.driver.find(parent, name, timeout, criteria, wait_for),
+            parent=self._label(parent), name=name, criteria=criteria, timeout=timeout, wait_for=wait_for
+        )
+        return self._bind(element, name)
+
+    def find_window(self, criteria, timeout=None):
+        element = self._timed_lookup(
+            'find_window', lambda: self.driver.find_window(criteria, timeout), criteria=criteria, timeout=timeout
+        )
+        return self._bind(element, f"window:{criteria.get('title') or criteria.get('title_re')}")
+
+    def type_keys(self, element, keys, with_spaces=False, pause=None):
+        self.record('type_keys', target=self._label(element), keys=keys, with_spaces=with_spaces, pause=pause)
+        self.driver.type_keys(element, keys, with_spaces=with_spaces, pause=pause)
+
+    def set_focus(self, element):
+        self.record('set_focus', target=self._label(element))
+        self.driver.set_focus(element)
+
+    def invoke(self, parent, name, timeout=None):
+        start = time.perf_counter()
+        self.driver.invoke(parent, name, timeout)
+        self.record('invoke', parent=self._label(parent), name=name, timeout=timeout,
+                    elapsed=round(time.perf_counter() - start, 4))
+
+    def window_text(self, element):
+        text = self.driver.window_text(element)
+        self.record('window_text', target=self._label(element), value=text)
+        return text
+
+    def step(self, name):
+        self.current_step = name
+        self.record('step', name=name)
+        self.driver.step(name)
+
+    def on_wait(self, site, condition, elapsed, met):
+        """Observador do wait_engine: registra a espera e, se possível, como refazê-la."""
+        kind = getattr(condition, 'kind', None)
+        args = list(getattr(condition, 'args', ()))
+        target = self._label(getattr(condition, 'element', None))
+        # focus_moved é refeita a partir da marca de foco anterior (ver mark_focus), não dos args
+        replayable = (kind in wait_engine.CONDITIONS or kind == 'focus_moved') and target is not None and _json_safe(args)
+        if kind == 'focus_moved':
+            args = []
+        event = self.record(
+            'wait', site=site, kind=kind, target=target, args=args if replayable else None,
+            replayable=replayable, elapsed=round(elapsed, 4), met=met
+        )
+        if met and kind == 'field_value_changed':
+            # Ponto de verificação: o valor que ficou no campo
+            event['value'] = self.driver.focused_text(condition.element)
+
+    # -------------------------------------------------------------------------
+    # Diálogos dispensados pelo vigia (thread do vigia)
+    # -------------------------------------------------------------------------
+    def visible_dialogs(self, class_name, process=None):
+        dialogs = self.driver.visible_dialogs(class_name, process)
+        self._dialog_titles.update(dialogs)
+        return dialogs
+
+    def dialog_keys(self, handle, keys):
+        last_action = next((event['t'] for event in reversed(self.events) if event['op'] != 'dialog'), 0.0)
+        event = self.record('dialog', title=self._dialog_titles.get(handle), keys=keys, step=self.current_step)
+        event['latency'] = round(event['t'] - last_action, 4)
+        self.driver.dialog_keys(handle, keys)
+
+    # -------------------------------------------------------------------------
+    # Repassadas sem registro (consultas feitas dentro das esperas)
+    # -------------------------------------------------------------------------
+    def exists(self, parent, name, criteria=None):
+        return self.driver.exists(parent, name, criteria)
+
+    def process_id(self, element):
+        return self.driver.process_id(element)
+
+    def is_active(self, element):
+        return self.driver.is_active(element)
+
+    def has_focus(self, element):
+        return self.driver.has_focus(element)
+
+    def focused_control(self, element):
+        return self.driver.focused_control(element)
+
+    def focused_text(self, element):
+        return self.driver.focused_text(element)
+
+    def flush(self):
+        self.driver.flush()
+
+    def begin_run(self, test_name):
+        self.driver.begin_run(test_name)
+
+    def run_problems(self):
+        return self.driver.run_problems()
+
+    def log_summary(self):
+        self.driver.log_summary()
+
+    def close(self):
+        self.driver.close()
+
+    def problems(self):
+        """Motivos para a sessão não servir de referência: esperas sem sucesso, falhas do vigia, problemas do driver."""
+        problems = [f"espera '{event['site']}' não atendida" for event in self.events if event['op'] == 'wait' and not event['met']]
+        problems += [f"vigia de diálogos: {event['message']}" for event in self.events if event['op'] == 'dialog_fallback']
+        return problems + self.driver.run_problems()
+
+    def trace(self):
+        return {
+            'test': self.test_name,
+            'recorded_at': self.started_at.isoformat(timespec='seconds'),
+            'driver': self.name,
+            'duration': round(time.perf_counter() - self._start, 4),
+            'events': self.events,
+        }
+
+class Replayer:
+    """
+    Refaz um arquivo gravado pelo Recorder no driver da sessão.
+    margin/factor: prazo de cada busca ou espera = tempo observado * factor + margin.
+    verify: compara os pontos de verificação com a gravação.
+    """
+    def __init__(self, trace, selectors, config, margin=0.2, factor=1.5, verify=True):
+        self.trace = trace
+        self.selectors = selectors
+        self.config = config
+        self.margin = margin
+        self.factor = factor
+        self.verify = verify
+        self.driver = ui_driver.get_driver()
+        self.elements = {}
+        self.current_step = None
+        self.checkpoints = 0
+        self.expected_dialogs = []
+        # Controle com foco no último focus_mark de cada elemento (ponto de partida de focus_moved)
+        self.focus_marks = {}
+
+    def run(self):
+        """Reproduz a sessão. Retorna True se terminou sem divergências."""
+        events = self.trace['events']
+        logging.info(
+            f"Reproduzindo '{self.trace['test']}' gravado em {self.trace['recorded_at']} "
+            f"({len(events)} eventos, {self.trace['duration']:.1f}s na gravação)."
+        )
+        start = time.perf_counter()
+        index = 0
+        try:
+            for index, event in enumerate(events):
+                handler = getattr(self, f"_replay_{event['op']}", None)
+                if handler is not None:
+                    handler(event)
+            self.driver.flush()
+            self._check_dialogs()
+        except ReplayMismatchError as e:
+            logging.error(f"Reprodução divergiu no evento {index} (passo: {self.current_step or 'n/d'}): {e}")
+            return False
+        except Exception as e:
+            logging.error(f"Erro na reprodução, evento {index} (passo: {self.current_step or 'n/d'}): {e}", exc_info=True)
+            return False
+        finally:
+            dialog_watcher.stop()
+
+        elapsed = time.perf_counter() - start
+        logging.info(
+            f"Reprodução concluída em {elapsed:.2f}s (gravação: {self.trace['duration']:.2f}s), "
+            f"{self.checkpoints} ponto(s) de verificação conferido(s)."
+        )
+        return True
+
+    def _timeout(self, event):
+        """Prazo da reprodução: o tempo observado na gravação, com folga, nunca acima do prazo original."""
+        if event.get('timeout') is None:
+            return None
+        if not event.get('found', True):
+            return min(event['timeout'], self.margin)
+        return min(event['timeout'], event['elapsed'] * self.factor + self.margin)
+
+    def _element(self, label):
+        if label not in self.elements:
+            raise ReplayMismatchError(f"Elemento '{label}' não foi encontrado antes de ser usado.")
+        return self.elements[label]
+
+    def _check(self, description, expected, actual):
+        if not self.verify:
+            return
+        self.checkpoints += 1
+        if expected != actual:
+            raise ReplayMismatchError(f"{description}: esperado {expected!r}, obtido {actual!r}.")
+
+    def _check_dialogs(self):
+        """Ponto de verificação: o vigia dispensou os mesmos diálogos, na mesma ordem e com as mesmas teclas."""
+        watcher = dialog_watcher.get_watcher()
+        dismissed = []
+        deadline = time.perf_counter() + self.margin
+        while True:
+            dismissed = [(dismissal['title'], dismissal['keystroke']) for dismissal in (watcher.dismissals if watcher else [])]
+            if len(dismissed) >= len(self.expected_dialogs) or time.perf_counter() >= deadline:
+                break
+            time.sleep(0.02)
+        self._check("diálogos dispensados pelo vigia", self.expected_dialogs, dismissed)
+
+    def _lookup(self, event, label, lookup):
+        try:
+            element = lookup(self._timeout(event))
+        except (ui_driver.ElementNotFound, ui_driver.WaitTimeout):
+            self._check(f"'{label}' encontrado", event['found'], False)
+            return
+        self._check(f"'{label}' encontrado", event['found'], True)
+        self.elements[label] = element
+
+    # -------------------------------------------------------------------------
+    # Eventos
+    # -------------------------------------------------------------------------
+    def _replay_step(self, event):
+        self.current_step = event['name']
+        logging.info(f"[reprodução] {event['name']}")
+        self.driver.step(event['name'])
+        dialog_watcher.step(event['name'])
+
+    def _replay_main_window(self, event):
+        label = f"main_window:{event['backend']}"
+        self.elements[label] = self.driver.main_window(event['backend'], timeout=event.get('timeout'))
+
+    def _replay_find(self, event):
+        parent = self._element(event['parent'])
+        self._lookup(event, event['name'], lambda timeout: self.driver.find(
+            parent, event['name'], timeout, event.get('criteria'), event.get('wait_for', 'exists visible')
+        ))
+
+    def _replay_find_window(self, event):
+        criteria = event['criteria']
+        label = f"window:{criteria.get('title') or criteria.get('title_re')}"
+        self._lookup(event, label, lambda timeout: self.driver.find_window(criteria, timeout))
+
+    def _replay_type_keys(self, event):
+        with dialog_watcher.input_lock():
+            self.driver.type_keys(
+                self._element(event['target']), event['keys'],
+                with_spaces=event.get('with_spaces', False), pause=event.get('pause')
+            )
+
+    def _replay_set_focus(self, event):
+        self.driver.set_focus(self._element(event['target']))
+
+    def _replay_invoke(self, event):
+        timeout = event.get('timeout')
+        if timeout is not None:
+            timeout = min(timeout, event['elapsed'] * self.factor + self.margin)
+        self.driver.invoke(self._element(event['parent']), event['name'], timeout)
+
+    def _replay_window_text(self, event):
+        self._check(f"texto de '{event['target']}'", event['value'], self.driver.window_text(self._element(event['target'])))
+
+    def _replay_focus_mark(self, event):
+        self.focus_marks[event['target']] = self.driver.focused_control(self._element(event['target']))
+
+    def _replay_wait(self, event):
+        kind = event.get('kind')
+        if not event.get('replayable') or (kind not in wait_engine.CONDITIONS and kind != 'focus_moved'):
+            # Pausa fixa ou condição que não sabemos refazer: espera o tempo da gravação
+            time.sleep(event['elapsed'])
+            return
+        element = self._element(event['target'])
+        if kind == 'focus_moved':
+            condition = wait_engine.focus_moved(element, self.focus_marks.get(event['target']))
+        else:
+            condition = wait_engine.CONDITIONS[kind](element, *event['args'])
+        timeout = event['elapsed'] * self.factor + self.margin if event['met'] else self.margin
+        met = wait_engine.wait_until(condition, timeout=timeout, site=f"reproducao.{event['site'] or 'sem nome'}")
+        if event['met']:
+            self._check(f"espera '{event['site']}' atendida", True, met)
+        if 'value' in event:
+            self._check(f"valor do campo após '{event['site']}'", event['value'], self.driver.focused_text(element))
+
+    def _replay_dialog_watcher(self, event):
+        main_window = self._element('main_window:win32')
+        dialog_watcher.start(self.selectors, self.config, process=self.driver.process_id(main_window))
+
+    def _replay_expect_dialog(self, event):
+        # Diálogo opcional tratado pelo vigia: mesma tecla que na gravação
+        self.driver.flush()
+        watcher = dialog_watcher.get_watcher()
+        if watcher is not None and watcher.watches(event['selector']):
+            # Mesmo prazo das esperas: o tempo até o diálogo ser dispensado na gravação, com folga
+            if event.get('dismissed'):
+                timeout = min(event['timeout'], event['elapsed'] * self.factor + self.margin)
+            else:
+                timeout = min(event.get('timeout', self.margin), self.margin)
+            watcher.handle(event['selector'], event['keystroke'], timeout)
+
+    def _replay_dialog(self, event):
+        # O diálogo aparece (ou não) por conta própria: conferido no fim, em _check_dialogs
+        self.expected_dialogs.append((event['title'], event['keys']))
+
+    def _replay_manual(self, event):
+        self.driver.flush()
+        input(event['message'])
+
+# =============================================================================
+# INSTÂNCIA DA SESSÃO
+# =============================================================================
+_recorder = None
+
+def start_recording(test_name):
+    """Passa a registrar as operações do driver da sessão."""
+    global _recorder
+    stop_recording()
+    _recorder = Recorder(ui_driver.get_driver(), test_name)
+    ui_driver.set_driver(_recorder)
+    wait_engine.get_engine().observers.append(_recorder.on_wait)
+    return _recorder
+
+def stop_recording(save=False, trace_dir='logs/traces'):
+    """Para o registro. Com save, grava o arquivo em trace_dir e retorna o caminho."""
+    global _recorder
+    if _recorder is None:
+        return None
+    recorder, _recorder = _recorder, None
+    ui_driver.set_driver(recorder.driver)
+    observers = wait_engine.get_engine().observers
+    if recorder.on_wait in observers:
+        observers.remove(recorder.on_wait)
+    if not save:
+        return None
+    problems = recorder.problems()
+    if problems:
+        logging.warning(f"Sessão não gravada: a execução não serve de referência ({len(problems)} problema(s)).")
+        for problem in problems:
+            logging.warning(f"  {problem}")
+        return None
+
+    os.makedirs(trace_dir, exist_ok=True)
+    timestamp = recorder.started_at.strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(trace_dir, f"{recorder.test_name}_{timestamp}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recorder.trace(), f, ensure_ascii=False, indent=1)
+    logging.info(f"Sessão gravada em {path} ({len(recorder.events)} eventos).")
+    return path
+
+def record(op, **data):
+    """Registra um evento do fluxo que não passa pelo driver (ex.: diálogo esperado), se houver gravação."""
+    if _recorder is not None:
+        _recorder.record(op, **data)
+
+def mark_focus(element):
+    """Registra que o fluxo leu o controle com foco de element (ponto de partida de uma espera focus_moved)."""
+    if _recorder is not None:
+        _recorder.mark_focus(element)
+
+def replay(path, selectors, config):
+    """Reproduz a sessão gravada em path conforme a seção [Replay] do config.ini."""
+    with open(path, 'r', encoding='utf-8') as f:
+        trace = json.load(f)
+    replay_config = config['Replay'] if config.has_section('Replay') else None
+    if replay_config is None:
+        replayer = Replayer(trace, selectors, config)
+    else:
+        replayer = Replayer(
+            trace, selectors, config,
+            margin=replay_config.getfloat('margin', 0.2),
+            factor=replay_config.getfloat('factor', 1.5),
+            verify=replay_config.getboolean('verify', True),
+        )
+    return replayer.run()
@@ -0,0 +1,227 @@
+# src/spans.py
+# Intervalos de tempo (spans) de cada execução de teste: passos do fluxo,
+# consultas ao banco, diálogos de seleção, diálogos opcionais e esperas.
+# Ao fim da execução o log recebe o ranking dos intervalos mais demorados e
+# um arquivo no formato Trace Event do Chrome é gravado em [Spans] trace_dir
+# (abre em chrome://tracing ou em https://ui.perfetto.dev).
+#
+# Uso:
+#   spans.begin_run('dav_creation')
+#   spans.step("Passo 3: ...")            # fecha o passo anterior e abre este
+#   with spans.span("Seleção de Cliente", spans.GUI):
+#       ...
+#   spans.end_run()
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import wait_engine
+
+STEP = 'passo'
+DB = 'banco'
+GUI = 'gui'
+DIALOG = 'dialogo'
+WAIT = 'espera'
+
+class Span:
+    def __init__(self, name, category, start, end, thread, args=None):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = end
+        self.thread = thread
+        self.args = args or {}
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+class SpanRecorder:
+    """Intervalos de uma execução. Pode ser usado de várias threads (pré-buscas, vigia)."""
+    def __init__(self, test_name):
+        self.test_name = test_name
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self._threads = {}
+        self._step = None
+        self._lock = threading.Lock()
+
+    def add(self, name, category, start, end, **args):
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+            self.spans.append(Span(name, category, start, end, thread.ident, args))
+
+    @contextmanager
+    def span(self, name, category, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.perf_counter(), **args)
+
+    def step(self, name):
+        """Fecha o passo atual (se houver) e abre o próximo."""
+        now = time.perf_counter()
+        self._close_step(now)
+        self._step = (name, now)
+
+    def finish(self):
+        self.end = time.perf_counter()
+        self._close_step(self.end)
+
+    def _close_step(self, now):
+        if self._step is not None:
+            name, start = self._step
+            self.add(name, STEP, start, now)
+            self._step = None
+
+    def on_wait(self, site, condition, elapsed, met):
+        """Observador do wait_engine: cada espera vira um intervalo."""
+        end = time.perf_counter()
+        self.add(site or 'sem nome', WAIT, end - elapsed, end, met=met)
+
+    # -------------------------------------------------------------------------
+    # Relatórios
+    # -------------------------------------------------------------------------
+    def log_report(self, top=20):
+        """Registra no log os intervalos agrupados por (categoria, nome), dos mais demorados aos menos."""
+        total = (self.end or time.perf_counter()) - self.start
+        groups = {}
+        for span in self.spans:
+            group = groups.setdefault((span.category, span.name), [0, 0.0, 0.0])
+            group[0] += 1
+            group[1] += span.duration
+            group[2] = max(group[2], span.duration)
+
+        logging.info(f"=== Tempos da execução '{self.test_name}': {total:.2f}s ===")
+        by_category = {}
+        for (category, _), (_, category_total, _) in groups.items():
+            by_category[category] = by_category.get(category, 0.0) + category_total
+        logging.info("Por categoria (os passos contêm as demais): " + ", ".join(
+            f"{category} {seconds:.2f}s" for category, seconds in sorted(by_category.items(), key=lambda item: item[1], reverse=True)
+        ))
+        logging.info("Mais demorados (categoria | nome | vezes | total | média | máx | % da execução):")
+        ranked = sorted(groups.items(), key=lambda item: item[1][1], reverse=True)
+        for (category, name), (count, group_total, group_max) in ranked[:top]:
+            share = group_total / total if total > 0 else 0.0
+            logging.info(
+                f"  {category} | {name[:80]} | {count} | {group_total:.3f}s | "
+                f"{group_total / count:.3f}s | {group_max:.3f}s | {share:.0%}"
+            )
+
+    def chrome_trace(self):
+        """Intervalos no formato Trace Event (eventos completos 'X', tempos em microssegundos)."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            threads = dict(self._threads)
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in threads.items()
+        ]
+        for span in sorted(spans, key=lambda span: span.start):
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': round((span.start - self.start) * 1e6),
+                'dur': round(span.duration * 1e6),
+                'pid': pid,
+                'tid': span.thread,
+                'args': {key: str(value) for key, value in span.args.items()},
+            })
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'test': self.test_name, 'started_at': self.started_at.isoformat(timespec='seconds')},
+        }
+
+    def write(self, trace_dir):
+        os.makedirs(trace_dir, exist_ok=True)
+        path = os.path.join(trace_dir, f"{self.test_name}_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+        return path
+
+# =============================================================================
+# INSTÂNCIA DA SESSÃO
+# =============================================================================
+_settings = {'enabled': True, 'trace_dir': 'logs/spans', 'top': 20}
+_recorder = None
+
+def configure(spans_config=None):
+    """Lê a seção [Spans] do config.ini."""
+    if spans_config is not None:
+        _settings['enabled'] = spans_config.getboolean('enabled', True)
+        _settings['trace_dir'] = spans_config.get('trace_dir', 'logs/spans')
+        _settings['top'] = spans_config.getint('top', 20)
+
+def begin_run(test_name):
+    """Inicia a coleta de intervalos de uma execução (se ativada)."""
+    global _recorder
+    end_run(write=False)
+    if not _settings['enabled']:
+        return None
+    _recorder = SpanRecorder(test_name)
+    wait_engine.get_engine().observers.append(_recorder.on_wait)
+    return _recorder
+
+def end_run(write=True):
+    """Fecha a execução: ranking no log e arquivo de trace. Retorna o caminho do arquivo."""
+    global _recorder
+    if _recorder is None:
+        return None
+    recorder, _recorder = _recorder, None
+    recorder.finish()
+    observers = wait_engine.get_engine().observers
+    if recorder.on_wait in observers:
+        observers.remove(recorder.on_wait)
+    if not write:
+        return None
+    recorder.log_report(_settings['top'])
+    try:
+        path = recorder.write(_settings['trace_dir'])
+    except OSError as e:
+        logging.error(f"Não foi possível gravar o trace da execução: {e}")
+        return None
+    logging.info(f"Trace da execução gravado em {path} ({len(recorder.spans)} intervalos).")
+    return path
+
+def span(name, category, **args):
+    """Context manager que mede o bloco; sem execução ativa, não faz nada."""
+    recorder = _recorder
+    if recorder is None:
+        return nullcontext()
+    return recorder.span(name, category, **args)
+
+def record(name, category, start, end=None, **args):
+    """Registra um intervalo já medido (start/end de time.perf_counter); end padrão: agora."""
+    if _recorder is not None:
+        _recorder.add(name, category, start, time.perf_counter() if end is None else end, **args)
+
+def traced(category, name):
+    """
+    Decorador: cada chamada da função vira um intervalo. name é um texto ou uma
+    função que recebe os mesmos argumentos da chamada e devolve o nome.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            label = name(*args, **kwargs) if callable(name) else name
+            with span(label, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def step(name):
+    """Fecha o passo atual e abre o próximo."""
+    if _recorder is not None:
+        _recorder.step(name)
@@ -0,0 +1,88 @@
+# src/statement_cache.py
+import logging
+import threading
+from collections import OrderedDict
+
+class PreparedStatementCache:
+    """
+    Cache LRU de cursores preparados (server-side prepared statements), separado
+    por conexão física e indexado pelo texto SQL.
+    """
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reprepares = 0
+        self._lock = threading.Lock()
+        # id(conexão) -> {'connection_id': id da sessão no servidor, 'statements': OrderedDict}
+        self._connections = {}
+
+    def acquire(self, cnx, query):
+        """
+        Retorna (cursor, sql) preparado para a conexão. O sql devolvido é o mesmo
+        objeto usado na primeira execução: o cursor preparado só reaproveita o
+        statement quando recebe exatamente esse objeto.
+        """
+        with self._lock:
+            statements = self._statements_for(cnx)
+            cached = statements.get(query)
+            if cached is not None:
+                statements.move_to_end(query)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        cached = (cnx.cursor(prepared=True), query)
+        with self._lock:
+            statements = self._statements_for(cnx)
+            statements[query] = cached
+            if len(statements) > self.max_size:
+                _, (old_cursor, _) = statements.popitem(last=False)
+                self.evictions += 1
+                self._close_cursor(old_cursor)
+        return cached
+
+    def discard(self, cnx, query):
+        """Remove um statement do cache (ex.: após erro na execução)."""
+        with self._lock:
+            entry = self._connections.get(id(cnx))
+            if entry is None:
+                return
+            cached = entry['statements'].pop(query, None)
+        if cached is not None:
+            self._close_cursor(cached[0])
+
+    def stats(self):
+        """Retorna os contadores do cache."""
+        with self._lock:
+            cached = sum(len(entry['statements']) for entry in self._connections.values())
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'reprepares': self.reprepares,
+                'cached_statements': cached,
+            }
+
+    def _statements_for(self, cnx):
+        """Retorna o OrderedDict da conexão, descartando-o se ela foi reconectada."""
+        entry = self._connections.get(id(cnx))
+        if entry is not None and entry['connection_id'] != cnx.connection_id:
+            # Reconexão: os statements preparados morreram junto com a sessão antiga
+            self.reprepares += len(entry['statements'])
+            logging.info(f"Conexão {entry['connection_id']} foi refeita; {len(entry['statements'])} statement(s) serão preparados novamente.")
+            entry = None
+        if entry is None:
+            entry = {'connection_id': cnx.connection_id, 'statements': OrderedDict()}
+            self._connections[id(cnx)] = entry
+        return entry['statements']
+
+    @staticmethod
+    def _close_cursor(cursor):
+        try:
+            cursor.close()
+        except Exception as e:
+            logging.debug(f"Falha ao fechar cursor preparado: {e}")
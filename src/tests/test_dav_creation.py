@@ -1,50 +1,72 @@
 # src/tests/test_dav_creation.py
+import itertools
 import logging
 import time
 import pandas as pd
-import pyautogui
-import sys
-import subprocess
-import json
-import os
-import random
-from pywinauto import Application, Desktop, timings
-from pywinauto.findwindows import ElementNotFoundError
-
-def _select_from_grid(items_df, title, text_column, code_column):
+
+import dialog_watcher
+import gui_client
+import selection_policy
+import session_trace
+import spans
+import ui_driver
+import wait_engine
+from wait_engine import control_focused, field_equals, field_value_changed, focus_moved, focused_control, focused_text
+
+def _load_items(items_source, warmup=None):
+    """
+    Resolve os dados de um diálogo: items_source é um DataFrame ou uma função que
+    o retorna (consulta ao banco ou espera de uma pré-busca). Com warmup, marca o
+    intervalo da consulta para medir a sobreposição com a inicialização da GUI.
+    """
+    if not callable(items_source):
+        return items_source
+    if warmup is not None:
+        warmup.data_started()
+    items_df = items_source()
+    if warmup is not None:
+        warmup.data_ready()
+    return items_df
+
+def _select_from_grid(items_source, title, text_column, code_column):
     """
-    Chama um subprocesso PySide6 e captura a seleção do usuário via stdout.
+    Exibe a GUI de seleção simples (servidor PySide6 da sessão) e retorna o código escolhido.
+    items_source pode ser o DataFrame ou a função que o consulta; nesse caso a GUI
+    é iniciada antes e sobe enquanto a consulta roda.
+    Listas grandes são enviadas em páginas: o diálogo abre com a primeira e recebe o resto aberto.
+    Com uma política de seleção headless, o código é escolhido sem abrir a GUI.
     """
+    policy = selection_policy.get_policy()
+    warmup = None if policy.headless else gui_client.prewarm('single')
+    items_df = _load_items(items_source, warmup)
     if items_df.empty:
         logging.warning(f"Nenhum item encontrado para a seleção: {title}")
+        if warmup is not None:
+            warmup.cancel()
         return None
 
-    items_for_gui = [
-        {'code': str(row[code_column]), 'display': f"{row[code_column]} - {row[text_column]}"}
-        for _, row in items_df.iterrows()
-    ]
-    data_to_pass = {'title': title, 'items': items_for_gui}
-    data_file = 'temp_gui_data.json'
+    if policy.headless:
+        selected_code = policy.choose_one(title, items_df, code_column)
+        policy.record(title, selected_code)
+        return selected_code
+
+    def to_items(frame):
+        codes = frame[code_column].astype(str)
+        displays = codes + " - " + frame[text_column].astype(str)
+        return [{'code': code, 'display': display} for code, display in zip(codes, displays)]
 
+    if len(items_df) <= gui_client.PAGE_SIZE:
+        items_for_gui = to_items(items_df)
+    else:
+        items_for_gui = gui_client.paginate(items_df, to_items)
     try:
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(data_to_pass, f)
-
-        # --- MUDANÇA PRINCIPAL ---
-        # Usa o mesmo executável python e captura a saída
-        python_executable = sys.executable
-        process = subprocess.run(
-            [python_executable, 'src/selection_gui.py'],
-            check=True,
-            capture_output=True, # Captura a saída do terminal
-            text=True            # Decodifica a saída como texto
+        selected_code = gui_client.show_selection_dialog(
+            'single', title, items_for_gui, total=len(items_df), warmup=warmup
         )
-        
-        # O resultado é a saída padrão do script, com espaços/quebras de linha removidos
-        selected_code = process.stdout.strip()
 
         if selected_code:
             logging.info(f"Usuário selecionou o código: {selected_code}")
+            policy.record(title, selected_code)
         else:
             logging.error("Nenhum item foi selecionado ou a janela foi fechada.")
         
@@ -53,49 +75,72 @@ def _select_from_grid(items_df, title, text_column, code_column):
     except Exception as e:
         logging.error(f"Ocorreu um erro ao exibir a GUI de seleção: {e}")
         return None
-    finally:
-        if os.path.exists(data_file):
-            os.remove(data_file)
+
+def _await_prefetch(futures, name):
+    """Aguarda o resultado de uma consulta pré-buscada e registra quanto a thread principal esperou."""
+    start = time.perf_counter()
+    result = futures[name].result()
+    logging.info(f"Pré-busca '{name}' pronta (espera de {time.perf_counter() - start:.3f}s).")
+    return result
 
 # =============================================================================
 # FUNÇÃO PARA SELEÇÃO MÚLTIPLA
 # =============================================================================
-def _select_multiple_items_from_grid(items_df, title, headers):
+def _select_multiple_items_from_grid(items, title, headers):
     """
-    Chama um subprocesso PySide6 para exibir uma GUI de seleção múltipla.
+    Exibe a GUI de seleção múltipla (servidor PySide6 da sessão) e retorna os códigos escolhidos.
+    items pode ser um DataFrame ou um iterável de DataFrames (blocos de uma consulta
+    em streaming); nesse caso o diálogo abre com o primeiro bloco e recebe os demais aberto.
+    Com uma política de seleção headless, os códigos são escolhidos sem abrir a GUI.
     """
-    if items_df.empty:
+    if isinstance(items, pd.DataFrame) and items.empty:
         logging.warning(f"Nenhum item encontrado para a seleção: {title}")
         return []
 
+    policy = selection_policy.get_policy()
+    if policy.headless:
+        # A política precisa da lista inteira para escolher
+        chunks = [items] if isinstance(items, pd.DataFrame) else list(items)
+        items_df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        items_df = items_df.rename(columns=str.lower)
+        if items_df.empty:
+            logging.warning(f"Nenhum item encontrado para a seleção: {title}")
+            return []
+        selected_codes = policy.choose_many(title, items_df, 'codigo_produto')
+        policy.record(title, selected_codes)
+        return selected_codes
+
     # Prepara os dados para a GUI, garantindo que as chaves corretas existam
     # O dicionário de cada item terá as chaves que a GUI espera
-    items_for_gui = []
-    for _, row in items_df.iterrows():
-        items_for_gui.append({
-            'codigo_produto': str(row['codigo_produto']),
-            'código': str(row['codigo_produto']),
-            'produto': str(row['nome_produto']),
-            'estoque': str(row['estoquedisponivel'])
-        })
+    def to_items(frame):
+        frame = frame.rename(columns=str.lower)
+        codes = frame['codigo_produto'].astype(str)
+        return [
+            {'codigo_produto': code, 'código': code, 'produto': name, 'estoque': stock}
+            for code, name, stock in zip(codes, frame['nome_produto'].astype(str), frame['estoquedisponivel'].astype(str))
+        ]
+
+    # A GUI sobe enquanto o primeiro bloco do catálogo é lido
+    warmup = gui_client.prewarm('multi')
+    total = len(items) if isinstance(items, pd.DataFrame) else None
+    pages = gui_client.paginate(items, to_items)
+    warmup.data_started()
+    first_page = next(pages, None)
+    warmup.data_ready()
+    if not first_page:
+        logging.warning(f"Nenhum item encontrado para a seleção: {title}")
+        warmup.cancel()
+        return []
+    items_for_gui = itertools.chain([first_page], pages)
     
-    data_to_pass = {'title': title, 'items': items_for_gui, 'headers': headers}
-    data_file = 'temp_gui_data.json'
-
     try:
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(data_to_pass, f, default=str)
-
-        python_executable = sys.executable
-        process = subprocess.run(
-            [python_executable, 'src/multi_selection_gui.py'],
-            check=True, capture_output=True, text=True
+        selected_codes = gui_client.show_selection_dialog(
+            'multi', title, items_for_gui, headers, total=total, warmup=warmup
         )
-        
-        selected_codes = json.loads(process.stdout.strip())
 
         if selected_codes:
             logging.info(f"Usuário selecionou {len(selected_codes)} itens: {selected_codes}")
+            policy.record(title, selected_codes)
         else:
             logging.warning("Nenhum item foi selecionado.")
         
@@ -104,29 +149,59 @@ def _select_multiple_items_from_grid(items_df, title, headers):
     except Exception as e:
         logging.error(f"Ocorreu um erro ao exibir a GUI de seleção múltipla: {e}")
         return []
-    finally:
-        if os.path.exists(data_file):
-            os.remove(data_file)
+
+def _type_keys(window, keys, **kwargs):
+    """
+    Envia teclas à janela sem intercalar com as teclas do vigia de diálogos.
+    Envios seguidos para a mesma janela são agrupados pelo driver (ver keystroke_buffer.py),
+    que dispensa os diálogos já abertos antes de enviar.
+    """
+    with dialog_watcher.input_lock():
+        ui_driver.get_driver().type_keys(window, keys, **kwargs)
+
+def _step(message):
+    """Registra o passo no log e informa o vigia de diálogos (que anota o passo interrompido)."""
+    logging.info(message)
+    spans.step(message)
+    ui_driver.step(message)
+    dialog_watcher.step(message)
 
 # =============================================================================
 # FUNÇÃO PARA TRATAR DIÁLOGOS COM ALT+N
 # =============================================================================
-def _handle_optional_dialog(dialog_selector, keystroke, timeout=1):
+@spans.traced(spans.DIALOG, lambda dialog_selector, *args, **kwargs: f"Diálogo opcional '{dialog_selector.get('title')}'")
+def _handle_optional_dialog(dialog_selector, keystroke, timeout=1, settled=None):
     """
     Verifica se um diálogo opcional aparece e envia uma combinação de teclas.
+    Com o vigia de diálogos ativo, a tecla vale só nesta chamada (ver DialogWatcher.handle):
+    espera até timeout segundos, ou até a condição settled (ex.: o foco saiu do campo)
+    mostrar que o Guardian seguiu sem o diálogo. Se a tecla é a padrão do vigia, não espera.
     """
+    # O diálogo é provocado pelas teclas anteriores: elas precisam ter sido enviadas
+    ui_driver.flush()
+    watcher = dialog_watcher.get_watcher()
+    if watcher is not None and watcher.watches(dialog_selector):
+        start = time.perf_counter()
+        dismissed = watcher.handle(dialog_selector, keystroke, timeout, settled)
+        session_trace.record(
+            'expect_dialog', selector=dialog_selector, keystroke=keystroke, timeout=timeout,
+            dismissed=dismissed, elapsed=round(time.perf_counter() - start, 4)
+        )
+        if dismissed:
+            logging.info(f"Diálogo '{dialog_selector.get('title')}' dispensado com '{keystroke}'.")
+        return
+
     try:
-        desktop = Desktop(backend="win32")
-        dialog = desktop.window(**dialog_selector)
-        dialog.wait('visible', timeout=timeout)
+        driver = ui_driver.get_driver()
+        dialog = driver.find_window(dialog_selector, timeout=timeout)
         logging.info(f"Diálogo '{dialog_selector.get('title')}' encontrado.")
         
-        dialog.set_focus()
-        dialog.type_keys(keystroke)
+        driver.set_focus(dialog)
+        driver.type_keys(dialog, keystroke)
         logging.info(f"--> Combinação de teclas '{keystroke}' enviada com sucesso.")
         #time.sleep(1)
         
-    except (ElementNotFoundError, timings.TimeoutError):
+    except (ui_driver.ElementNotFound, ui_driver.WaitTimeout):
         logging.info(f"Diálogo opcional '{dialog_selector.get('title')}' não apareceu. Prosseguindo...")
     except Exception as e:
         logging.warning(f"Não foi possível interagir com o diálogo opcional: {e}")
@@ -134,6 +209,7 @@ def _handle_optional_dialog(dialog_selector, keystroke, timeout=1):
 # =============================================================================
 # FUNÇÃO PARA VERIFICAR SE A TELA AUTORIZAÇÕES APARECEU
 # =============================================================================
+@spans.traced(spans.DIALOG, "Autorização: verificação (win32)")
 def _check_for_authorization_win32(main_window, selectors, timeout=2):
     """
     Verifica de forma robusta com 'win32' se a janela de autorização existe.
@@ -144,11 +220,10 @@ def _check_for_authorization_win32(main_window, selectors, timeout=2):
         # IMPORTANTE: Usando o seletor que provou funcionar, sem class_name.
         selector = {"title_re": selectors['authorization_dialog']['title_re']}
         
-        auth_dialog = main_window.child_window(**selector)
-        auth_dialog.wait('visible', timeout=timeout)
+        ui_driver.get_driver().find(main_window, 'authorization_dialog_win32', timeout=timeout, criteria=selector)
         logging.info("Pré-verificação (win32): Janela de autorização detectada.")
         return True
-    except timings.TimeoutError:
+    except (ui_driver.ElementNotFound, ui_driver.WaitTimeout):
         logging.info("Pré-verificação (win32): Janela de autorização não apareceu no tempo esperado.")
         return False
     except Exception as e:
@@ -157,41 +232,35 @@ def _check_for_authorization_win32(main_window, selectors, timeout=2):
 # =============================================================================
 # FUNÇÃO PARA TRATAR AUTORIZAÇÕES COM button.invoke
 # =============================================================================
+@spans.traced(spans.DIALOG, "Autorização: autorizar e confirmar")
 def _handle_authorization_dialog(selectors, timeout=0.3):
     """
     Verifica se a janela de autorização aparece e aciona os botões de autorização
     e confirmação usando o backend 'uia' e o método '.invoke()'.
-    A conexão UIA é criada aqui dentro para garantir a detecção correta.
+    A conexão UIA é a da sessão de UI: feita uma vez e refeita só se a janela do Guardian mudar.
     """
     try:
-        # Conexão específica com backend UIA feita no momento do uso para máxima confiabilidade
-        logging.info("Conectando com backend 'uia' para tratar a janela de autorização...")
-        app_uia = Application(backend="uia").connect(**selectors['main_window'])
-        main_window_uia = app_uia.window(**selectors['main_window'])
+        driver = ui_driver.get_driver()
+        main_window_uia = driver.main_window('uia')
 
         # 1. Encontrar a janela de diálogo de autorização
-        auth_dialog = main_window_uia.child_window(**selectors['authorization_dialog'])
-        auth_dialog.wait('visible', timeout=timeout)
-        logging.info(f"Janela de autorização encontrada: '{auth_dialog.window_text()}'")
-        auth_dialog.set_focus()
+        auth_dialog = driver.find(main_window_uia, 'authorization_dialog', timeout=timeout)
+        logging.info(f"Janela de autorização encontrada: '{driver.window_text(auth_dialog)}'")
+        driver.set_focus(auth_dialog)
 
         # 2. Encontrar e acionar o primeiro botão: "<< Autorizar"
-        authorize_button = auth_dialog.child_window(**selectors['authorization_authorize_button'])
-        authorize_button.wait('ready', timeout=0.3)
-        logging.info("Botão '<< Autorizar' encontrado. Acionando com .invoke()...")
-        authorize_button.invoke()
+        logging.info("Acionando o botão '<< Autorizar' com .invoke()...")
+        driver.invoke(auth_dialog, 'authorization_authorize_button', timeout=0.3)
         logging.info("--> Ação 'invoke' no botão '<< Autorizar' enviada.")
         #time.sleep(0.5)
 
         # 3. Encontrar e acionar o segundo botão: "Confirma Autorização"
-        confirm_button = auth_dialog.child_window(**selectors['authorization_confirm_button'])
-        confirm_button.wait('ready', timeout=0.3)
-        logging.info("Botão 'Confirma Autorização' encontrado. Acionando com .invoke()...")
-        confirm_button.invoke()
+        logging.info("Acionando o botão 'Confirma Autorização' com .invoke()...")
+        driver.invoke(auth_dialog, 'authorization_confirm_button', timeout=0.3)
         logging.info("--> Ação 'invoke' no botão 'Confirma Autorização' enviada.")
         #time.sleep(0.5)
 
-    except (ElementNotFoundError, timings.TimeoutError):
+    except (ui_driver.ElementNotFound, ui_driver.WaitTimeout):
         logging.info("Janela de autorização não apareceu. Prosseguindo...")
     except Exception as e:
         logging.warning(f"Não foi possível interagir com a janela de autorização: {e}", exc_info=True)
@@ -202,22 +271,35 @@ def _handle_authorization_dialog(selectors, timeout=0.3):
 def run(db_handler, selectors, config):
     """
     Executa o fluxo de teste de criação de DAV com coleta de dados antecipada.
+    Retorna True se o fluxo chegou ao fim sem erros.
     """
     logging.info("### INICIANDO TESTE: Criação de Documento Auxiliar de Venda (DAV) ###")
+    policy = selection_policy.get_policy()
+    policy.begin_run('dav_creation')
+    wait_engine.get_engine().reset()
+    ui_driver.begin_run('dav_creation')
+    spans.begin_run('dav_creation')
     
     try:
         # =============================================================================
         # FASE 1: COLETA DE DADOS (SELEÇÕES DO USUÁRIO)
         # =============================================================================
-        logging.info("--- FASE 1: Coletando todas as informações necessárias ---")
+        _step("--- FASE 1: Coletando todas as informações necessárias ---")
+
+        # Consultas independentes rodam em paralelo enquanto o usuário escolhe a filial
+        prefetched = db_handler.prefetch(
+            naturezas=db_handler.get_naturezas_operacao,
+            clientes=db_handler.get_clientes,
+            vendedores=db_handler.get_vendedores,
+            formas_pg=db_handler.get_all_formas_pagamento,
+        )
 
         # --- NOVA LÓGICA DE SELEÇÃO DE FILIAL ---
         selected_filial_code = None
         filial_count = db_handler.get_active_filiais_count()
         if filial_count > 1:
             logging.info("Múltiplas filiais ativas encontradas. Solicitando seleção do usuário.")
-            filiais_df = db_handler.get_active_filiais()
-            selected_filial_code = _select_from_grid(filiais_df, "Seleção de Filial", "nome_filial", "codigo_filial")
+            selected_filial_code = _select_from_grid(db_handler.get_active_filiais, "Seleção de Filial", "nome_filial", "codigo_filial")
             if not selected_filial_code: raise ValueError("Seleção de Filial foi cancelada.")
             logging.info(f"Trabalhando com a filial: {selected_filial_code}")
         elif filial_count == 1:
@@ -226,122 +308,135 @@ def run(db_handler, selectors, config):
         else:
             logging.info("Nenhuma filial ativa encontrada. O filtro de filial não será aplicado.")
 
+        # O catálogo de produtos só depende da filial; chega em blocos enquanto as demais
+        # seleções acontecem e alimenta o diálogo de produtos conforme é lido.
+        # Depois de exibido, de cada bloco só ficam o código e o estoque (passo 7)
+        product_chunks = db_handler.prefetch_chunks(
+            lambda: db_handler.iter_available_products(selected_filial_code),
+            keep_columns=('codigo_produto', 'estoquedisponivel'),
+        )
+
         # 1. Selecionar natureza de operação
-        naturezas_df = db_handler.get_naturezas_operacao()
-        cod_natureza = _select_from_grid(naturezas_df, "Seleção de Natureza", "descricao", "codigo_natureza")
+        cod_natureza = _select_from_grid(lambda: _await_prefetch(prefetched, 'naturezas'), "Seleção de Natureza", "descricao", "codigo_natureza")
         if not cod_natureza: raise ValueError("Seleção de Natureza foi cancelada.")
 
+        # Carrega os parâmetros da filial e da natureza uma única vez para toda a execução
+        db_handler.load_parameter_snapshot(selected_filial_code, cod_natureza)
+        natureza_cfg = db_handler.get_field_values(
+            'natoper',
+            ['Nat_cfgvendedor', 'Nat_DatEmisPed', 'nat_vultpreco', 'Nat_LcLtPeds'],
+            'Nat_Codigo',
+            cod_natureza
+        )
+
         # 2. Selecionar cliente
-        clientes_df = db_handler.get_clientes()
-        selected_cliente_code = _select_from_grid(clientes_df, "Seleção de Cliente", "nome_cliente", "codigo_cliente")
+        selected_cliente_code = _select_from_grid(lambda: _await_prefetch(prefetched, 'clientes'), "Seleção de Cliente", "nome_cliente", "codigo_cliente")
         if not selected_cliente_code: raise ValueError("Seleção de Cliente foi cancelada.")
 
         # 3. Lógica do vendedor (se necessário)
         cod_vendedor = None
-        cfg_vendedor = db_handler.check_field_value('natoper', 'Nat_cfgvendedor', 'Nat_Codigo', cod_natureza)
+        cfg_vendedor = natureza_cfg['Nat_cfgvendedor']
         if cfg_vendedor == 3:
-            vendedores_df = db_handler.get_vendedores()
-            cod_vendedor = _select_from_grid(vendedores_df, "Seleção de Vendedor", "nome_vendedor", "codigo_colaborador")
+            cod_vendedor = _select_from_grid(lambda: _await_prefetch(prefetched, 'vendedores'), "Seleção de Vendedor", "nome_vendedor", "codigo_colaborador")
             if not cod_vendedor: raise ValueError("Seleção de Vendedor foi cancelada.")
 
-        # 4. Selecionar forma de pagamento
-        formas_pg_df = db_handler.get_formas_pagamento(selected_cliente_code)
-        if formas_pg_df.empty:
-            formas_pg_df = db_handler.get_all_formas_pagamento()
-        selected_forma_pg_code = _select_from_grid(formas_pg_df, "Seleção de Forma de Pagamento", "descricao", "codigo_forma")
+        # 4. Selecionar forma de pagamento (a GUI sobe enquanto as consultas rodam)
+        def load_formas_pg():
+            formas_pg_df = db_handler.get_formas_pagamento(selected_cliente_code)
+            if formas_pg_df.empty:
+                formas_pg_df = _await_prefetch(prefetched, 'formas_pg')
+            return formas_pg_df
+        selected_forma_pg_code = _select_from_grid(load_formas_pg, "Seleção de Forma de Pagamento", "descricao", "codigo_forma")
         if not selected_forma_pg_code: raise ValueError("Seleção de Forma de Pagamento foi cancelada.")
 
         # 5. Selecionar condição de pagamento
-        condicoes_pg_df = db_handler.get_condicoes_pagamento(selected_cliente_code, selected_forma_pg_code)
-        if condicoes_pg_df.empty:
-            condicoes_pg_df = db_handler.get_all_condicoes_pagamento(selected_forma_pg_code)
-        cod_condicao = _select_from_grid(condicoes_pg_df, "Seleção de Condição de Pagamento", "descricao", "codigo_condicao")
+        def load_condicoes_pg():
+            condicoes_pg_df = db_handler.get_condicoes_pagamento(selected_cliente_code, selected_forma_pg_code)
+            if condicoes_pg_df.empty:
+                condicoes_pg_df = db_handler.get_all_condicoes_pagamento(selected_forma_pg_code)
+            return condicoes_pg_df
+        cod_condicao = _select_from_grid(load_condicoes_pg, "Seleção de Condição de Pagamento", "descricao", "codigo_condicao")
         if not cod_condicao: raise ValueError("Seleção de Condição de Pagamento foi cancelada.")
         
         # 6. Selecionar produtos para lançamento
-        products_df = db_handler.get_available_products(selected_filial_code)
-        if not products_df.empty:
-            products_df.columns = products_df.columns.str.lower()
-        
-        stock_map = dict(zip(products_df['codigo_produto'].astype(str).str.strip(), products_df['estoquedisponivel']))
         headers = ["Selecionar", "Código", "Produto", "Estoque"]
-        selected_products = _select_multiple_items_from_grid(products_df, "Seleção de Produtos para Lançamento", headers)
+        selected_products = _select_multiple_items_from_grid(product_chunks, "Seleção de Produtos para Lançamento", headers)
         if not selected_products: raise ValueError("Nenhum produto foi selecionado.")
 
-        # 7. Buscar dados auxiliares para os produtos selecionados
-        unit_counts_df = db_handler.get_product_unit_counts(selected_products)
-        unit_counts_map = {}
-        if not unit_counts_df.empty:
-            unit_counts_map = dict(zip(unit_counts_df.iloc[:, 0].astype(str).str.strip(), unit_counts_df.iloc[:, 1]))
-            
-        # ▼▼▼ NOVA LÓGICA: BUSCAR A FRAÇÃO MÍNIMA ▼▼▼   
-        logging.info("Buscando dados de fração mínima para os produtos selecionados...")
-        frac_minima_df = db_handler.get_product_frac_minima(selected_products)
-        frac_minima_map = {}
-        if not frac_minima_df.empty:
-            # Converte para um dicionário: {'codigo': frac_minima}
-            frac_minima_map = dict(zip(
-                frac_minima_df['codigo_produto'].astype(str).str.strip(),
-                frac_minima_df['frac_minima'].astype(float)
-            ))
+        products_df = product_chunks.to_frame()
+        if not products_df.empty:
+            products_df.columns = products_df.columns.str.lower()
+
+        # 7. Buscar dados auxiliares (unidades, fração mínima e estoque) em lote
+        logging.info("Buscando unidades e fração mínima para os produtos selecionados...")
+        product_attributes = db_handler.get_product_attributes(selected_products, catalog_df=products_df)
             
         logging.info("--- FASE 1 CONCLUÍDA: Todos os dados foram coletados. ---")
-        logging.info("A automação da interface começará em 3 segundos...")
-        time.sleep(3)
+        if not policy.headless:
+            # Pausa proposital para o usuário tirar as mãos do teclado e do mouse
+            logging.info("A automação da interface começará em 3 segundos...")
+            time.sleep(3)
 
         # =============================================================================
         # FASE 2: AUTOMAÇÃO DA INTERFACE (USANDO SUA LÓGICA EXISTENTE)
         # =============================================================================
         
-        logging.info("--- FASE 2: Iniciando automação da interface do Guardian ---")
+        _step("--- FASE 2: Iniciando automação da interface do Guardian ---")
         
-        desktop = Desktop(backend="win32")
-        main_window = desktop.window(**selectors['main_window'])
-        main_window.wait('visible', timeout=5)
+        driver = ui_driver.get_driver()
+        main_window = driver.main_window('win32', timeout=5)
         logging.info("Janela principal do Guardian encontrada e pronta para automação.")
-        main_window.set_focus()
+        driver.set_focus(main_window)
+
+        # Diálogos opcionais passam a ser dispensados em segundo plano
+        dialog_watcher.start(selectors, config, process=driver.process_id(main_window))
+        session_trace.record('dialog_watcher')
 
         # 3. Navegar para "Vendas" (ALT+V)
-        main_window.type_keys('%V')
-        logging.info("Passo 3: Navegado para a seção 'Vendas'.")
+        _type_keys(main_window, '%V')
+        _step("Passo 3: Navegado para a seção 'Vendas'.")
 
         # 4. Abrir tela de inclusão de Documento (ENTER)
-        main_window.type_keys('{ENTER}')
-        logging.info("Passo 4: Tela de inclusão de DAV aberta.")
+        _type_keys(main_window, '{ENTER}')
+        _step("Passo 4: Tela de inclusão de DAV aberta.")
 
         # 5. Abrir a inclusão do DAV (F2)
-        logging.info("Passo 5: Procurando pela janela filha de Inclusão de DAV...")
-        dav_window = main_window.child_window(**selectors['dav_inclusion_window'])
-        dav_window.wait('visible', timeout=1)
-        dav_window.set_focus()
+        _step("Passo 5: Procurando pela janela filha de Inclusão de DAV...")
+        # Resolvida uma vez: as teclas vão direto para o elemento, sem refazer a busca na árvore
+        dav_window = driver.find(main_window, 'dav_inclusion_window', timeout=1)
+        driver.set_focus(dav_window)
         logging.info("   -> Janela de Inclusão de DAV encontrada. Pressionando F2...")
-        dav_window.type_keys('{F2}')
+        previous_field = focused_control(dav_window)
+        _type_keys(dav_window, '{F2}')
         
         # 5.1. Verificar diálogo de créditos
-        _handle_optional_dialog(selectors['confirmation_dialog'], "%n")
+        _handle_optional_dialog(selectors['confirmation_dialog'], "%n", settled=focus_moved(dav_window, previous_field))
 
         # 6. Selecionar natureza de operação
-        logging.info("Passo 6: Inserindo Natureza de Operação pré-selecionada...")
-        dav_window.type_keys('^a{DELETE}')
-        dav_window.type_keys(cod_natureza, with_spaces=True)
+        _step("Passo 6: Inserindo Natureza de Operação pré-selecionada...")
+        _type_keys(dav_window, '^a{DELETE}')
+        _type_keys(dav_window, cod_natureza, with_spaces=True)
         logging.info(f"   -> Natureza '{cod_natureza}' inserida.")
 
         # 7. Verificar Nat_DatEmisPed
-        logging.info("Passo 7: Verificando Nat_DatEmisPed...")
-        dat_emis_ped = db_handler.check_field_value('natoper', 'Nat_DatEmisPed', 'Nat_Codigo', cod_natureza)
+        _step("Passo 7: Verificando Nat_DatEmisPed...")
+        dat_emis_ped = natureza_cfg['Nat_DatEmisPed']
         if dat_emis_ped == 1:
             logging.info("   -> Nat_DatEmisPed = 1. Pressionando ENTER 3x.")
-            dav_window.type_keys('{ENTER 3}')
+            # O ENTER que grava a natureza vai sozinho: um diálogo aberto por ele é
+            # dispensado antes dos demais ENTERs (ver keystroke_buffer.py)
+            _type_keys(dav_window, '{ENTER}')
+            _type_keys(dav_window, '{ENTER 2}')
         else:
             logging.info("   -> Nat_DatEmisPed != 1. Pressionando ENTER 2x.")
-            dav_window.type_keys('{ENTER 1}')
+            _type_keys(dav_window, '{ENTER 1}')
         
         # 8. Selecionar cliente
-        logging.info("Passo 8: Inserindo Cliente pré-selecionado...")
-        dav_window.type_keys('^a{DELETE}')
-        dav_window.type_keys(selected_cliente_code)
+        _step("Passo 8: Inserindo Cliente pré-selecionado...")
+        _type_keys(dav_window, '^a{DELETE}')
+        _type_keys(dav_window, selected_cliente_code)
         logging.info(f"   -> Cliente '{selected_cliente_code}' inserido.")
-        dav_window.type_keys('{ENTER}')
+        _type_keys(dav_window, '{ENTER}')
         #time.sleep(1)  
             
         # 8.1. Verifica se apareceu algum alerta
@@ -356,34 +451,32 @@ def run(db_handler, selectors, config):
         #time.sleep(1)
         #if pa4_buscendpad == 0 :
         try :
-            adress_window = main_window.child_window(**selectors['adress_dialog'])
-            adress_window.wait('visible', timeout=1)
-            adress_window.set_focus()
+            adress_window = driver.find(main_window, 'adress_dialog', timeout=1)
+            driver.set_focus(adress_window)
             logging.info(f"Tela de endereços encontrada enviando 3x TAB + 1x ENTER")
-            adress_window.type_keys('{TAB}{TAB}{TAB}{ENTER}')
+            _type_keys(adress_window, '{TAB}{TAB}{TAB}{ENTER}')
         except :
             logging.info(f"Tela de endereços não foi encontrada script continua")
 
         # 9. Lógica do vendedor
-        logging.info("Passo 9: Verificando configuração do vendedor...")
+        _step("Passo 9: Verificando configuração do vendedor...")
         logging.info(f"   -> Valor de Nat_cfgvendedor: {cfg_vendedor}")
         if cfg_vendedor == 1:
             logging.info("   -> CfgVendedor = 1. Pressionando ENTER para selecionar vendedor padrão e ENTER 2X para chegar ao lançamento da forma de pagamento.")
-            dav_window.type_keys('{ENTER 2}')
+            _type_keys(dav_window, '{ENTER}')
         elif cfg_vendedor == 2:
             logging.info("   -> CfgVendedor = 2. Pulando campo de vendedor com ENTER.")
-            dav_window.type_keys('{ENTER}')
         elif cfg_vendedor == 3:
             logging.info("   -> CfgVendedor = 3. Inserindo Vendedor pré-selecionado...")
-            dav_window.type_keys('^a{DELETE}')
-            dav_window.type_keys(cod_vendedor)
-            dav_window.type_keys('{ENTER}')
+            _type_keys(dav_window, '^a{DELETE}')
+            _type_keys(dav_window, cod_vendedor)
             logging.info(f"   -> Vendedor '{cod_vendedor}' inserido.")
-        else:
-            dav_window.type_keys('{ENTER}')
+        # Todos os casos terminam com o ENTER que sai do campo do vendedor (esperado no passo 12)
+        vendor_field = focused_control(dav_window)
+        _type_keys(dav_window, '{ENTER}')
 
         # 10. Verificar diálogo de créditos novamente
-        _handle_optional_dialog(selectors['confirmation_dialog'],"%n")
+        _handle_optional_dialog(selectors['confirmation_dialog'], "%n", settled=focus_moved(dav_window, vendor_field))
 
         # 11. Verificar campo "ID STUFF" por imagem
      #   logging.info("Passo 11: Verificando se campo 'ID STUFF' existe na tela...")
@@ -400,18 +493,24 @@ def run(db_handler, selectors, config):
         
 
         # 12. Selecionar forma de pagamento
-        logging.info("Passo 12: Inserindo Forma de Pagamento pré-selecionada...")
-        time.sleep(0.5)
-        dav_window.type_keys('{ENTER}')
-        time.sleep(0.5)
-        dav_window.type_keys('^a{DELETE}')
-        time.sleep(0.5)
-        dav_window.type_keys(selected_forma_pg_code)
-        time.sleep(0.5)
-        dav_window.type_keys('{ENTER}')  
-        time.sleep(0.5)
+        _step("Passo 12: Inserindo Forma de Pagamento pré-selecionada...")
+        wait_engine.wait_until(focus_moved(dav_window, vendor_field), site='forma_pg.antes_enter', baseline=0.5)
+        previous_field = focused_control(dav_window)
+        _type_keys(dav_window, '{ENTER}')
+        wait_engine.wait_until(focus_moved(dav_window, previous_field), site='forma_pg.campo', baseline=0.5)
+        forma_pg_field = focused_control(dav_window)
+        previous_value = focused_text(dav_window)
+        _type_keys(dav_window, '^a{DELETE}')
+        if previous_value:
+            wait_engine.wait_until(field_value_changed(dav_window, previous_value, expected=''), timeout=1, site='forma_pg.limpar', baseline=0.5)
+        cleared_value = focused_text(dav_window)
+        _type_keys(dav_window, selected_forma_pg_code)
+        wait_engine.wait_until(field_value_changed(dav_window, cleared_value, expected=selected_forma_pg_code), timeout=1, site='forma_pg.digitar', baseline=0.5)
+        _type_keys(dav_window, '{ENTER}')  
+        # O foco sai do campo quando a forma é aceita (ou vai para o diálogo de atenção)
+        wait_engine.wait_until(focus_moved(dav_window, forma_pg_field), site='forma_pg.confirmar', baseline=0.5)
         #12.1. Verifica se apareceu DIALOG DE ATENÇÃO
-        _handle_optional_dialog(selectors['atention'], "{ENTER 2}")
+        _handle_optional_dialog(selectors['atention_dialog'], "{ENTER 2}", settled=focus_moved(dav_window, forma_pg_field))
         
         logging.info(f"   -> Forma de pagamento '{selected_forma_pg_code}' inserida.")
         
@@ -422,9 +521,10 @@ def run(db_handler, selectors, config):
 
 
         # 14. Selecionar condição de pagamento
-        logging.info("Passo 14: Inserindo Condição de Pagamento pré-selecionada...")
-        dav_window.type_keys('^a{DELETE}')
-        dav_window.type_keys(cod_condicao)
+        _step("Passo 14: Inserindo Condição de Pagamento pré-selecionada...")
+        _type_keys(dav_window, '^a{DELETE}')
+        _type_keys(dav_window, cod_condicao)
+        wait_engine.wait_until(field_equals(dav_window, cod_condicao), timeout=1, site='condicao_pg.digitar', baseline=1)
         
         #14.1. Verifica se apareceu algum alerta
         _handle_optional_dialog(selectors['warning_dialog'], "{ENTER}") 
@@ -435,13 +535,15 @@ def run(db_handler, selectors, config):
         logging.info(f"   -> Condição de pagamento '{cod_condicao}' inserida.")
 
         # 15. Finaliza etapa de lançamento de condições
-        logging.info("Passo 15: Pressionando ENTER 5x para lançar os itens.")
-        time.sleep(1)
-        dav_window.type_keys('{ENTER 5}')
+        _step("Passo 15: Pressionando ENTER 5x para lançar os itens.")
+        # O ENTER que grava a condição vai sozinho, como no passo 7
+        condicao_field = focused_control(dav_window)
+        _type_keys(dav_window, '{ENTER}')
+        _type_keys(dav_window, '{ENTER 4}')
         logging.info("Processo de preenchimento inicial do DAV finalizado com sucesso!")
-        time.sleep(0.5)
+        wait_engine.wait_until(focus_moved(dav_window, condicao_field), site='condicao_pg.lancar', baseline=0.5)
         # 16. Verificar existencia da caixa de diálogo Aliquota de Comissão
-        logging.info("Passo 16: Verificando a existencia da caixa de diálogo Aliquota de Comissão ")
+        _step("Passo 16: Verificando a existencia da caixa de diálogo Aliquota de Comissão ")
 
         Pa5_DigComisDav = db_handler.check_field_value(
             table='parametro5', 
@@ -450,114 +552,117 @@ def run(db_handler, selectors, config):
         )
 
         if Pa5_DigComisDav == 1 :
-            _handle_optional_dialog(selectors['confirmation_dialog'],"%(s)")
+            # Sem condição de saída: o diálogo pode vir depois de qualquer um dos ENTERs do passo 15
+            _handle_optional_dialog(selectors['confirmation_dialog'], "%(s)")
         else :
             logging.info("Sistema não permite lançar comissão no DAV pulando para o proximo passo")
  
         # 17. INICIAR O LANÇAMENTO DOS ITENS
-        logging.info("Passo 17: Iniciando lançamento de itens...")
+        _step("Passo 17: Iniciando lançamento de itens...")
+        # Parâmetros usados por item, buscados uma única vez antes do loop
+        parametro2_cfg = db_handler.get_field_values(
+            'parametro2',
+            ['pa2_vultpreco', 'pa2_infacreped', 'pa2_infdescped'],
+            filial_code=selected_filial_code
+        )
+        nat_vultpreco = natureza_cfg['nat_vultpreco']
+        lanc_lotloc_ped = natureza_cfg['Nat_LcLtPeds']
+        pa4_tipoentit = db_handler.check_field_value(
+            table='parametro4',
+            field='pa4_tipoentit',
+            filial_code=selected_filial_code
+        )
+
         logging.info("Iniciando loop para lançar os produtos na tela de DAV...")
         for product_code_raw in selected_products:
             product_code = product_code_raw.strip()
             logging.info(f"   -> Lançando produto: {product_code}")
+            dialog_watcher.step(f"Passo 17: produto {product_code}")
             
-            dav_window.type_keys(product_code, with_spaces=True)
-
-            pa2_vultpreco = db_handler.check_field_value(
-                table='parametro2', 
-                field='pa2_vultpreco', 
-                filial_code=selected_filial_code
-            )
-            nat_vultpreco = db_handler.check_field_value(
-            'natoper',
-            'nat_vultpreco',
-            'Nat_Codigo',
-            cod_natureza   
-            )
+            _type_keys(dav_window, product_code, with_spaces=True)
+
+            pa2_vultpreco = parametro2_cfg['pa2_vultpreco']
             if pa2_vultpreco == 1 or nat_vultpreco == 1 :
                 #dav_window.type_keys('{ENTER}')
                 _handle_optional_dialog(selectors['last_price_pratice'],"{ENTER}")
 
             # Verifica quantas unidades o produto tem para definir quantos ENTERS são necessários
             # para selecionar a unidade
-            unit_count = unit_counts_map.get(product_code)
+            attributes = product_attributes[product_code]
+            unit_count = attributes.unidades_ativas
             logging.info(f"Produto tem {unit_count} unidade(s) mapeada(s).")
             if unit_count > 1:
-                dav_window.set_focus()
-                time.sleep(0.2)
-                dav_window.type_keys('{ENTER}')
-                time.sleep(0.2)
-                dav_window.type_keys('{ENTER}')
+                driver.set_focus(dav_window)
+                wait_engine.wait_until(control_focused(dav_window), site='item.foco_unidade', baseline=0.2)
+                _type_keys(dav_window, '{ENTER}')
+                # O primeiro ENTER abre a escolha da unidade: nada observável indica que ela está pronta
+                ui_driver.flush()
+                wait_engine.pause(0.2, site='item.unidade')
+                _type_keys(dav_window, '{ENTER}')
             else:
-                dav_window.set_focus()
-                time.sleep(0.2)
-                dav_window.type_keys('{ENTER}')
+                driver.set_focus(dav_window)
+                wait_engine.wait_until(control_focused(dav_window), site='item.foco_unidade', baseline=0.2)
+                _type_keys(dav_window, '{ENTER}')
 
             # Verifica se há lançamento de lote ou local de estoque na natureza
-            lanc_lotloc_ped = db_handler.check_field_value('natoper', 'Nat_LcLtPeds', 'Nat_Codigo', cod_natureza) 
             if lanc_lotloc_ped == 1 : 
-                dav_window.set_focus()
-                time.sleep(0.2)
-                dav_window.type_keys('{ENTER}')
+                driver.set_focus(dav_window)
+                wait_engine.wait_until(control_focused(dav_window), site='item.foco_lote', baseline=0.2)
+                _type_keys(dav_window, '{ENTER}')
 
             # 1. Inicializar as variáveis com valores padrão DENTRO do loop
             random_quantity = 1.0
-            frac_minima = frac_minima_map.get(product_code, 0.0)
+            frac_minima = attributes.frac_minima
 
             # 2. Obter o estoque disponível
-            available_stock = int(float(stock_map.get(product_code, 1)))
+            available_stock = int(attributes.estoque_disponivel if attributes.estoque_disponivel is not None else 1)
             
             if available_stock < 1:
                 available_stock = 1
             
-            # 3. Lógica condicional para calcular a quantidade
+            # 3. Lógica condicional para calcular a quantidade. O sorteio é da política de
+            # seleção (semente da execução) e fica no cenário, para a execução ser reproduzível
+            quantity_step = f"Quantidade do produto {product_code}"
             if frac_minima > 0:
                 max_multiples = int(available_stock // frac_minima)
                 if max_multiples > 0:
-                    chosen_multiple = random.randint(1, max_multiples)
+                    chosen_multiple = policy.choose_quantity(quantity_step, 1, max_multiples)
+                    policy.record(quantity_step, chosen_multiple)
                     random_quantity = chosen_multiple * frac_minima
                 else:
                     random_quantity = frac_minima
             else:
                 # Lógica antiga para produtos sem fração mínima
-                if available_stock >= 20:
-                    random_quantity = random.randint(1, 20)
-                else:
-                    random_quantity = random.randint(1, available_stock)
+                random_quantity = policy.choose_quantity(quantity_step, 1, min(available_stock, 20))
+                policy.record(quantity_step, random_quantity)
             
             # 4. Log e lançamento (agora seguro)
             logging.info(f"Estoque: {available_stock}. Fração Mínima: {frac_minima}. Quantidade final lançada: {random_quantity}")
             
-            dav_window.set_focus()
+            driver.set_focus(dav_window)
             quantity_str = str(random_quantity).replace('.', ',')
-            dav_window.type_keys(quantity_str)
-            time.sleep(0.2)
+            previous_value = focused_text(dav_window)
+            _type_keys(dav_window, quantity_str)
+            wait_engine.wait_until(field_value_changed(dav_window, previous_value, expected=quantity_str), timeout=0.4, site='item.quantidade', baseline=0.2)
   
             # Verifica se os campos de desconto e acréscimo estarão disponíveis 
-            pa2_infacreped = db_handler.check_field_value(
-                table='parametro2', 
-                field='pa2_infacreped', 
-                filial_code=selected_filial_code
-            )
-
-            pa2_infdescped = db_handler.check_field_value(
-                table='parametro2', 
-                field='pa2_infdescped', 
-                filial_code=selected_filial_code
-            )
+            pa2_infacreped = parametro2_cfg['pa2_infacreped']
+            pa2_infdescped = parametro2_cfg['pa2_infdescped']
 
             if pa2_infacreped == 1 and pa2_infdescped == 1 :
-                dav_window.set_focus()
-                time.sleep(0.5)
-                dav_window.type_keys("{ENTER}")
+                driver.set_focus(dav_window)
+                wait_engine.wait_until(control_focused(dav_window), site='item.foco_acrescimo', baseline=0.5)
+                quantity_field = focused_control(dav_window)
+                _type_keys(dav_window, "{ENTER}")
                 # Verificação autorização estoque
                 logging.info("Verificando se a janela de autorização apareceu...")
                 # 1. Faz a verificação rápida com 'win32'
                 if _check_for_authorization_win32(main_window, selectors):
                     # 2. Só se a verificação rápida for positiva, chama a função 'uia' para interagir
                     _handle_authorization_dialog(selectors) 
-                time.sleep(0.5)
-                dav_window.type_keys("{ENTER 5}")
+                wait_engine.wait_until(focus_moved(dav_window, quantity_field), site='item.apos_autorizacao_estoque', baseline=0.5)
+                price_field = focused_control(dav_window)
+                _type_keys(dav_window, "{ENTER 5}")
                 # Verificação autorização preço
                 logging.info("Verificando se a janela de autorização apareceu...")
                 # 1. Faz a verificação rápida com 'win32'
@@ -567,33 +672,47 @@ def run(db_handler, selectors, config):
                 
 
                 #Se exister o campo tipo de entrega que aparece quando o pa4_tipoentit = 1
-                pa4_tipoentit = db_handler.check_field_value(
-                    table='parametro4', 
-                    field='pa4_tipoentit', 
-                    filial_code=selected_filial_code
-                )  
-
                 if pa4_tipoentit == 1 :
-                   time.sleep(0.5) 
-                   dav_window.type_keys("{F1}")
-                   input("Deixe o cursor em um tipo de entrega e pressione ENTER e continuar o fluxo")
-                   dav_window.set_focus()
+                   wait_engine.wait_until(focus_moved(dav_window, price_field), site='item.tipo_entrega', baseline=0.5)
+                   delivery_field = focused_control(dav_window)
+                   _type_keys(dav_window, "{F1}")
+                   if policy.headless:
+                       # Execução sem operador: fica o tipo de entrega em que o cursor abre (o primeiro da lista)
+                       logging.info(f"Política '{policy.name}': tipo de entrega escolhido automaticamente (primeiro da lista).")
+                       wait_engine.wait_until(focus_moved(dav_window, delivery_field), site='item.lista_tipo_entrega', baseline=0.5)
+                   else:
+                       ui_driver.flush()
+                       prompt = "Deixe o cursor em um tipo de entrega e pressione ENTER e continuar o fluxo"
+                       session_trace.record('manual', message=prompt)
+                       input(prompt)
+                   driver.set_focus(dav_window)
                    logging.info("Pressionando ENTER 2x para gravar o item.")
-                   dav_window.type_keys('{ENTER 2}')
+                   _type_keys(dav_window, '{ENTER 2}')
                     # Atenção : Pedido possui item(s) para entrega, o tipo de entrega será alterado
                    _handle_optional_dialog(selectors['atention_dialog'], "{ENTER}")  
                 else :
                     logging.info("Pressionando ENTER 3x para gravar o item.")
-                    dav_window.set_focus()
-                    dav_window.type_keys('{ENTER 3}')
+                    driver.set_focus(dav_window)
+                    _type_keys(dav_window, '{ENTER 3}')
                     
             elif pa2_infacreped == 0 and pa2_infdescped == 0 : 
                     logging.info("Pressionando ENTER 3x para gravar o item.")
-                    dav_window.set_focus()
-                    dav_window.type_keys('{ENTER 3}')
+                    driver.set_focus(dav_window)
+                    _type_keys(dav_window, '{ENTER 3}')
                     
         logging.info("Todos os itens selecionados foram lançados com sucesso.")
+        # Problemas que o fluxo não percebe (ex.: teclas que o simulador viu irem para um diálogo)
+        if not ui_driver.verify_run():
+            raise RuntimeError("O driver de interface registrou problemas na execução.")
         logging.info("### TESTE CONCLUÍDO: Criação de DAV ###")
+        return True
 
     except Exception as e:
-        logging.error(f"Ocorreu um erro durante o teste de criação de DAV: {e}", exc_info=True)
\ No newline at end of file
+        logging.error(f"Ocorreu um erro durante o teste de criação de DAV: {e}", exc_info=True)
+    finally:
+        ui_driver.flush()
+        dialog_watcher.stop()
+        policy.end_run()
+        wait_engine.get_engine().log_summary()
+        ui_driver.get_driver().log_summary()
+        spans.end_run()
\ No newline at end of file
@@ -1,44 +1,49 @@
 # src/tests/test_load_assembly.py
 import logging
-import time
 import pandas as pd
-import sys
-import subprocess
-import json
-import os
-from pywinauto import Desktop
-from pywinauto.findwindows import ElementNotFoundError
+
+import gui_client
+import selection_policy
+import spans
+import ui_driver
+import wait_engine
+from wait_engine import field_equals, focus_moved, focused_control, window_visible
 
 # Para este teste, vamos precisar da função de seleção múltipla.
-# A melhor prática a longo prazo seria mover esta função para um arquivo 'utils.py',
-# mas por enquanto, podemos simplesmente copiá-la para cá para manter o teste autônomo.
+# A comunicação com a GUI fica em gui_client.py; aqui só preparamos os dados
+# e convertemos a seleção de volta para linhas do DataFrame.
+
+def _step(message):
+    """Registra o passo no log, nos intervalos da execução e no agrupador de teclas."""
+    logging.info(message)
+    spans.step(message)
+    ui_driver.step(message)
 
-def _select_multiple_items_from_grid(items_df, title, headers):
+def _select_multiple_items_from_grid(items_df, title, headers, warmup=None):
     if items_df.empty:
         logging.warning(f"Nenhum item encontrado para a seleção: {title}")
+        if warmup is not None:
+            warmup.cancel()
         return pd.DataFrame() # Retorna um DataFrame vazio
 
-    items_for_gui = items_df.to_dict('records')
-    data_to_pass = {'title': title, 'items': items_for_gui, 'headers': headers}
-    data_file = 'temp_gui_data.json'
+    policy = selection_policy.get_policy()
+    if policy.headless:
+        # Política de seleção em lote: escolhe os pedidos sem abrir a GUI
+        code_column = 'ped_numero' if 'ped_numero' in items_df.columns else 'pedido'
+        selected_codes = policy.choose_many(title, items_df, code_column)
+        policy.record(title, selected_codes)
+        return items_df[items_df[code_column].astype(str).isin(selected_codes)]
 
+    items_for_gui = items_df.to_dict('records')
     try:
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(data_to_pass, f, default=str)
-
-        python_executable = sys.executable
-        process = subprocess.run(
-            [python_executable, 'src/multi_selection_gui.py'],
-            check=True, capture_output=True, text=True
-        )
-        
-        selected_codes_str = json.loads(process.stdout.strip())
+        selected_codes_str = gui_client.show_selection_dialog('multi', title, items_for_gui, headers, warmup=warmup)
         # Converte os códigos de volta para o tipo original do DataFrame para o filtro funcionar
         original_dtype = items_df['ped_numero'].dtype
         selected_codes = [pd.Series(selected_codes_str, dtype=original_dtype)]
         
         if selected_codes:
             logging.info(f"Usuário selecionou {len(selected_codes_str)} itens.")
+            policy.record(title, selected_codes_str)
             # Retorna as linhas completas do DataFrame que foram selecionadas
             return items_df[items_df['ped_numero'].isin(selected_codes[0])]
         else:
@@ -48,9 +53,6 @@ def _select_multiple_items_from_grid(items_df, title, headers):
     except Exception as e:
         logging.error(f"Ocorreu um erro ao exibir a GUI de seleção múltipla: {e}")
         return pd.DataFrame()
-    finally:
-        if os.path.exists(data_file):
-            os.remove(data_file)
 
 
 def run(db_handler, selectors, config):
@@ -58,46 +60,58 @@ def run(db_handler, selectors, config):
     Executa o fluxo de teste de montagem de carga.
     """
     logging.info("### INICIANDO TESTE: Montagem de Carga ###")
+    policy = selection_policy.get_policy()
+    policy.begin_run('load_assembly')
+    wait_engine.get_engine().reset()
+    ui_driver.begin_run('load_assembly')
+    spans.begin_run('load_assembly')
     
     try:
-        # --- FASE 1: COLETA DE DADOS ---
+        _step("--- FASE 1: COLETA DE DADOS ---")
+        # A GUI de seleção sobe enquanto a consulta dos pedidos roda
+        warmup = None if policy.headless else gui_client.prewarm('multi')
         logging.info("Buscando pedidos de venda do dia...")
+        if warmup is not None:
+            warmup.data_started()
         orders_df = db_handler.get_sales_orders_for_today()
+        if warmup is not None:
+            warmup.data_ready()
         
         if orders_df.empty:
             logging.warning("Nenhum pedido de venda encontrado para a data de hoje. Teste encerrado.")
+            if warmup is not None:
+                warmup.cancel()
             return
 
         headers = ["Selecionar", "Pedido", "Série"]
         orders_df.rename(columns={'ped_numero': 'pedido', 'ped_spvcodigo': 'série'}, inplace=True)
         
-        selected_orders_df = _select_multiple_items_from_grid(orders_df, "Seleção de Pedidos para Carga", headers)
+        selected_orders_df = _select_multiple_items_from_grid(orders_df, "Seleção de Pedidos para Carga", headers, warmup)
 
         if selected_orders_df.empty:
             raise ValueError("Nenhum pedido foi selecionado. Teste interrompido.")
 
-        logging.info("--- FASE 2: AUTOMAÇÃO DA INTERFACE ---")
+        _step("--- FASE 2: AUTOMAÇÃO DA INTERFACE ---")
 
-        desktop = Desktop(backend="win32")
-        main_window = desktop.window(**selectors['main_window'])
-        main_window.set_focus()
+        driver = ui_driver.get_driver()
+        main_window = driver.main_window('win32')
+        driver.set_focus(main_window)
         logging.info("Janela principal do Guardian encontrada.")
         
         # 1. Abrir tela de logística
-        main_window.type_keys('%l') # ALT+L, depois ENTER
-        main_window.type_keys('{ENTER}')
-        logging.info("Passo 1: Navegado para a tela de Logística.")
-        time.sleep(2)
+        driver.type_keys(main_window, '%l') # ALT+L, depois ENTER
+        driver.type_keys(main_window, '{ENTER}')
+        _step("Passo 1: Navegado para a tela de Logística.")
 
         # Encontra a janela de logística (pode ser a mesma principal ou uma nova)
-        # Se for uma janela filha, use main_window.child_window(...)
-        logistics_window = main_window.child_window(**selectors['logistics_window'])
-        logistics_window.wait('visible', timeout=3)
+        wait_engine.wait_until(window_visible(main_window, 'logistics_window'), timeout=5, site='carga.abrir_logistica', baseline=2)
+        logistics_window = driver.find(main_window, 'logistics_window', timeout=3)
         
         # 2. F2 para incluir a carga
-        logistics_window.type_keys('{F2}')
-        logging.info("Passo 2: Inclusão de nova carga iniciada.")
-        time.sleep(1)
+        previous_field = focused_control(logistics_window)
+        driver.type_keys(logistics_window, '{F2}')
+        _step("Passo 2: Inclusão de nova carga iniciada.")
+        wait_engine.wait_until(focus_moved(logistics_window, previous_field), site='carga.incluir', baseline=1)
 
         # Encontra a janela de montagem de carga
         # load_window = desktop.window(**selectors['load_assembly_window'])
@@ -105,12 +119,13 @@ def run(db_handler, selectors, config):
         # load_window.set_focus()
 
         # 3. Pressionar ENTER 2x
-        logistics_window.type_keys('{ENTER 2}')
-        logging.info("Passo 3: Pressionado ENTER 2x.")
-        time.sleep(1)
+        previous_field = focused_control(logistics_window)
+        driver.type_keys(logistics_window, '{ENTER 2}')
+        _step("Passo 3: Pressionado ENTER 2x.")
+        wait_engine.wait_until(focus_moved(logistics_window, previous_field), site='carga.cabecalho', baseline=1)
 
         # 4. Loop para incluir os pedidos
-        logging.info("Passo 4: Iniciando inclusão dos pedidos selecionados...")
+        _step("Passo 4: Iniciando inclusão dos pedidos selecionados...")
         num_pedidos = len(selected_orders_df)
         for i, row in enumerate(selected_orders_df.itertuples()):
             pedido = str(row.pedido)
@@ -119,22 +134,36 @@ def run(db_handler, selectors, config):
 
             if i == 0:
                 # Primeira inclusão: Pedido -> ENTER -> Série
-                logistics_window.type_keys(pedido + "{ENTER}" + serie)
+                driver.type_keys(logistics_window, pedido + "{ENTER}" + serie)
+                last_value = serie
             else:
                 # Demais inclusões: Série -> ENTER -> Pedido
-                logistics_window.type_keys(serie + "{ENTER}" + pedido)
+                driver.type_keys(logistics_window, serie + "{ENTER}" + pedido)
+                last_value = pedido
             
             # 4.1. Pressionar ENTER 4x para ir para a próxima linha
             # Não pressiona após o último item
             if i < num_pedidos - 1:
                 logging.info("     Pressionando ENTER 4x para próximo item.")
-                logistics_window.type_keys('{ENTER 4}')
-                time.sleep(0.5)
+                previous_field = focused_control(logistics_window)
+                driver.type_keys(logistics_window, '{ENTER 4}')
+                wait_engine.wait_until(focus_moved(logistics_window, previous_field), site='carga.proximo_pedido', baseline=0.5)
         
         logging.info("Todos os pedidos foram incluídos na carga com sucesso!")
-        time.sleep(5)
+        # O último valor digitado (sem ENTER depois) chegou ao campo
+        wait_engine.wait_until(field_equals(logistics_window, last_value), timeout=5, site='carga.finalizar', baseline=5)
+        # Problemas que o fluxo não percebe (ex.: teclas que o simulador viu irem para um diálogo)
+        if not ui_driver.verify_run():
+            raise RuntimeError("O driver de interface registrou problemas na execução.")
         
         logging.info("### TESTE CONCLUÍDO: Montagem de Carga ###")
+        return True
 
     except Exception as e:
-        logging.error(f"Ocorreu um erro durante o teste de montagem de carga: {e}", exc_info=True)
\ No newline at end of file
+        logging.error(f"Ocorreu um erro durante o teste de montagem de carga: {e}", exc_info=True)
+    finally:
+        ui_driver.flush()
+        policy.end_run()
+        wait_engine.get_engine().log_summary()
+        ui_driver.get_driver().log_summary()
+        spans.end_run()
\ No newline at end of file
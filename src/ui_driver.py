@@ -0,0 +1,285 @@
+# src/ui_driver.py
+# Interface entre os fluxos de teste e a interface do Guardian.
+# Os fluxos só usam as operações de UIDriver; a implementação padrão usa o
+# pywinauto (Windows, com o Guardian aberto) e a alternativa é o simulador em
+# memória de guardian_simulator.py, que roda em qualquer sistema.
+# Configuração: seção [UI] do config.ini (driver = pywinauto | simulator).
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+class ElementNotFound(Exception):
+    """O elemento procurado não existe."""
+
+class WaitTimeout(Exception):
+    """O elemento não chegou ao estado esperado dentro do prazo."""
+
+class UIDriver(ABC):
+    """
+    Operações de interface usadas pelos fluxos. Os elementos devolvidos são
+    opacos: só devem ser passados de volta para os métodos do próprio driver.
+    Os elementos são identificados pelo nome no selectors.json.
+    Um driver que não implementa todas as operações abstratas não pode ser criado.
+    """
+    name = 'base'
+    # True se as teclas são processadas dentro de type_keys (simulador): não há fila
+    # de entrada a esperar, então as pausas fixas (wait_engine.pause) são dispensadas
+    synchronous = False
+    # Prazo máximo das esperas por condição (None: o prazo pedido por cada espera)
+    max_wait = None
+
+    def __init__(self, selectors):
+        self.selectors = selectors
+
+    @abstractmethod
+    def main_window(self, backend='win32', timeout=None):
+        """Janela principal do Guardian (esperando ficar visível por até timeout segundos)."""
+
+    @abstractmethod
+    def find(self, parent, name, timeout=None, criteria=None, wait_for='exists visible'):
+        """Elemento selectors[name] (ou criteria) dentro de parent, esperando até timeout segundos."""
+
+    @abstractmethod
+    def find_window(self, criteria, timeout=None):
+        """Janela de nível superior (ex.: um diálogo) que atende aos critérios."""
+
+    @abstractmethod
+    def exists(self, parent, name, criteria=None):
+        """O elemento existe e está visível agora (sem esperar)."""
+
+    @abstractmethod
+    def type_keys(self, element, keys, with_spaces=False, pause=None):
+        """Envia teclas ao elemento; pause é o intervalo entre as teclas (None: o padrão do driver)."""
+
+    @abstractmethod
+    def set_focus(self, element):
+        """Dá o foco do teclado ao elemento (traz a janela para frente)."""
+
+    @abstractmethod
+    def invoke(self, parent, name, timeout=None):
+        """Aciona o botão selectors[name] de parent (ex.: botões da autorização)."""
+
+    @abstractmethod
+    def window_text(self, element):
+        """Texto (título) da janela ou do controle."""
+
+    @abstractmethod
+    def process_id(self, element):
+        """Processo dono da janela (o vigia de diálogos só olha os diálogos dele)."""
+
+    @abstractmethod
+    def is_active(self, element):
+        """A janela está em primeiro plano, recebendo as teclas."""
+
+    @abstractmethod
+    def has_focus(self, element):
+        """O controle tem o foco do teclado."""
+
+    @abstractmethod
+    def focused_control(self, element):
+        """
+        Identificador do controle com foco na janela (None se não houver). Só serve para
+        comparar com outra leitura: muda quando o Guardian passa ao próximo campo.
+        """
+
+    @abstractmethod
+    def focused_text(self, element):
+        """Texto do controle com foco na janela (None se não houver)."""
+
+    @abstractmethod
+    def visible_dialogs(self, class_name, process=None):
+        """Diálogos de nível superior visíveis: lista de (handle, título)."""
+
+    @abstractmethod
+    def dialog_keys(self, handle, keys):
+        """Envia teclas ao diálogo com o handle informado."""
+
+    def begin_run(self, test_name):
+        """Início de uma execução de teste: as estatísticas do driver passam a ser só dela."""
+
+    def step(self, name):
+        """Passo atual do fluxo, para as camadas sobre o driver (agrupamento de teclas, registro)."""
+
+    def flush(self):
+        """Envia as teclas ainda pendentes (ver keystroke_buffer)."""
+
+    def run_problems(self):
+        """Problemas da execução que o fluxo não percebe (ex.: teclas desviadas no simulador)."""
+        return []
+
+    def log_summary(self):
+        pass
+
+    def close(self):
+        pass
+
+class _PywinautoElement:
+    """Par (WindowSpecification, wrapper): o wrapper para agir, a especificação para buscar filhos."""
+    def __init__(self, spec, wrapper):
+        self.spec = spec
+        self.wrapper = wrapper
+
+class PywinautoDriver(UIDriver):
+    """Driver real: pywinauto sobre a janela do Guardian (somente Windows)."""
+    name = 'pywinauto'
+
+    def __init__(self, selectors):
+        super().__init__(selectors)
+        # Importados aqui para que os fluxos possam ser carregados fora do Windows
+        from pywinauto import Desktop, findwindows, timings
+        import element_cache
+        import ui_session
+        self._desktop_class = Desktop
+        self._findwindows = findwindows
+        self._timings = timings
+        self._element_cache = element_cache.get_cache()
+        self._session = ui_session.get_session(selectors)
+        self._ui_session = ui_session
+
+    @contextmanager
+    def _translated(self):
+        try:
+            yield
+        except self._findwindows.ElementNotFoundError as e:
+            raise ElementNotFound(str(e)) from e
+        except self._timings.TimeoutError as e:
+            raise WaitTimeout(str(e)) from e
+
+    def main_window(self, backend='win32', timeout=None):
+        with self._translated():
+            spec = self._session.main_window(backend)
+            if timeout is not None:
+                spec.wait('visible', timeout=timeout)
+            return _PywinautoElement(spec, spec.wrapper_object())
+
+    def find(self, parent, name, timeout=None, criteria=None, wait_for='exists visible'):
+        criteria = criteria if criteria is not None else self.selectors[name]
+        with self._translated():
+            wrapper = self._element_cache.resolve(
+                parent.spec, name, self.selectors, timeout, criteria, wait_for
+            )
+        return _PywinautoElement(parent.spec.child_window(**criteria), wrapper)
+
+    def find_window(self, criteria, timeout=None):
+        with self._translated():
+            spec = self._desktop_class(backend='win32').window(**criteria)
+            if timeout is not None:
+                spec.wait('visible', timeout=timeout)
+            return _PywinautoElement(spec, spec.wrapper_object())
+
+    def exists(self, parent, name, criteria=None):
+        spec = parent.spec.child_window(**(criteria if criteria is not None else self.selectors[name]))
+        return spec.exists(timeout=0) and spec.is_visible()
+
+    def type_keys(self, element, keys, with_spaces=False, pause=None):
+        element.wrapper.type_keys(keys, pause=pause, with_spaces=with_spaces)
+
+    def set_focus(self, element):
+        element.wrapper.set_focus()
+
+    def invoke(self, parent, name, timeout=None):
+        with self._translated():
+            self._element_cache.call(
+                parent.spec, name, self.selectors, lambda button: button.invoke(),
+                timeout=timeout, wait_for='ready'
+            )
+
+    def window_text(self, element):
+        return element.wrapper.window_text()
+
+    def process_id(self, element):
+        return element.wrapper.process_id()
+
+    def is_active(self, element):
+        return element.wrapper.is_active()
+
+    def has_focus(self, element):
+        return element.wrapper.has_focus()
+
+    def focused_control(self, element):
+        # Foco do thread da janela: um diálogo aberto por ela também conta como mudança
+        focused = element.wrapper.get_focus()
+        return focused.handle if focused is not None else None
+
+    def focused_text(self, element):
+        focused = element.wrapper.get_focus()
+        return focused.window_text() if focused is not None else None
+
+    def visible_dialogs(self, class_name, process=None):
+        criteria = {'class_name': class_name, 'backend': 'win32', 'visible_only': True}
+        if process is not None:
+            criteria['process'] = process
+        return [(element.handle, element.name) for element in self._findwindows.find_elements(**criteria)]
+
+    def dialog_keys(self, handle, keys):
+        dialog = self._desktop_class(backend='win32').window(handle=handle)
+        dialog.set_focus()
+        dialog.type_keys(keys)
+
+    def begin_run(self, test_name):
+        self._element_cache.reset_stats()
+
+    def log_summary(self):
+        self._element_cache.log_summary()
+
+    def close(self):
+        self._ui_session.close()
+
+# =============================================================================
+# INSTÂNCIA DA SESSÃO
+# =============================================================================
+_driver = None
+
+def configure(config, selectors):
+    """Cria o driver da sessão conforme a seção [UI] do config.ini (padrão: pywinauto)."""
+    global _driver
+    ui_config = config['UI'] if config.has_section('UI') else None
+    name = ui_config.get('driver', 'pywinauto').strip().lower() if ui_config is not None else 'pywinauto'
+    if name == 'pywinauto':
+        _driver = PywinautoDriver(selectors)
+    elif name == 'simulator':
+        from guardian_simulator import SimulatedDriver
+        _driver = SimulatedDriver.from_config(selectors, ui_config)
+    else:
+        raise ValueError(f"Driver de interface desconhecido: '{name}'. Use pywinauto ou simulator.")
+    # Teclas consecutivas para a mesma janela são agrupadas (seção [Keystrokes])
+    import keystroke_buffer
+    _driver = keystroke_buffer.wrap(_driver, config['Keystrokes'] if config.has_section('Keystrokes') else None)
+    logging.info(f"Driver de interface: {_driver.name}.")
+    return _driver
+
+def get_driver():
+    if _driver is None:
+        raise RuntimeError("Driver de interface não configurado (chame ui_driver.configure).")
+    return _driver
+
+def set_driver(driver):
+    """Troca o driver da sessão (ex.: para envolvê-lo com o registro de sessões). Retorna o anterior."""
+    global _driver
+    previous, _driver = _driver, driver
+    return previous
+
+def begin_run(test_name):
+    """Informa o início de uma execução de teste ao driver da sessão."""
+    get_driver().begin_run(test_name)
+
+def step(name):
+    """Informa o passo atual do fluxo ao driver da sessão."""
+    get_driver().step(name)
+
+def flush():
+    """Envia as teclas pendentes do driver da sessão."""
+    get_driver().flush()
+
+def verify_run():
+    """Registra no log os problemas da execução vistos pelo driver. Retorna True se não houve nenhum."""
+    problems = get_driver().run_problems()
+    for problem in problems:
+        logging.error(f"Driver '{get_driver().name}': {problem}")
+    return not problems
+
+def close():
+    global _driver
+    if _driver is not None:
+        _driver.close()
+        _driver = None
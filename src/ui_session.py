@@ -0,0 +1,81 @@
+# src/ui_session.py
+# Conexões com a janela principal do Guardian mantidas durante a sessão do runner.
+# Application(backend="uia").connect(...) percorre a árvore do desktop e é uma das
+# operações mais lentas da automação; aqui cada backend (win32 e uia) é conectado
+# uma vez, pelo processo, e só reconecta se o processo ou o handle da janela mudar.
+import logging
+import time
+
+from pywinauto import Application, findwindows, handleprops
+
+class UISession:
+    def __init__(self, main_window_selector):
+        self.main_window_selector = main_window_selector
+        self.handle = None
+        self.process_id = None
+        self.connects = 0
+        self._apps = {}
+        self._windows = {}
+
+    def main_window(self, backend='win32'):
+        """
+        Retorna a janela principal (WindowSpecification ligada ao handle) no backend
+        pedido, conectando apenas na primeira vez ou se a janela mudou.
+        """
+        if not self._is_valid():
+            self._locate()
+        if backend not in self._windows:
+            self._connect(backend)
+        return self._windows[backend]
+
+    def application(self, backend='win32'):
+        self.main_window(backend)
+        return self._apps[backend]
+
+    def _is_valid(self):
+        # Verificação barata: o handle ainda é uma janela e pertence ao mesmo processo
+        if self.handle is None:
+            return False
+        try:
+            return handleprops.iswindow(self.handle) and handleprops.processid(self.handle) == self.process_id
+        except Exception:
+            return False
+
+    def _locate(self):
+        handle = findwindows.find_window(backend='win32', **self.main_window_selector)
+        process_id = handleprops.processid(handle)
+        if self.handle is not None:
+            logging.info(f"Janela principal do Guardian mudou (handle {self.handle} -> {handle}). Reconectando...")
+        self.handle = handle
+        self.process_id = process_id
+        self._apps = {}
+        self._windows = {}
+
+    def _connect(self, backend):
+        start = time.perf_counter()
+        app = Application(backend=backend).connect(process=self.process_id)
+        self._apps[backend] = app
+        self._windows[backend] = app.window(handle=self.handle)
+        self.connects += 1
+        logging.info(
+            f"Conectado ao Guardian (backend '{backend}', processo {self.process_id}) "
+            f"em {time.perf_counter() - start:.3f}s."
+        )
+
+# =============================================================================
+# INSTÂNCIA DA SESSÃO
+# =============================================================================
+_session = None
+
+def get_session(selectors):
+    """Retorna a sessão de UI do runner, criando-a na primeira chamada."""
+    global _session
+    if _session is None:
+        _session = UISession(selectors['main_window'])
+    return _session
+
+def close():
+    global _session
+    if _session is not None:
+        logging.info(f"Sessão de UI encerrada ({_session.connects} conexão(ões) no total).")
+    _session = None
@@ -0,0 +1,266 @@
+# src/wait_engine.py
+# Esperas por condição para a automação da interface do Guardian.
+# Em vez de pausas fixas (time.sleep) entre as teclas, cada ponto do fluxo espera
+# uma condição observável (controle com foco, foco que passou ao próximo controle,
+# janela visível, valor do campo), consultada com intervalo crescente até um prazo máximo.
+# Cada ponto de espera ("site") acumula estatísticas, incluindo o tempo
+# economizado em relação à pausa fixa que existia antes. Onde nada pode ser
+# observado, pause() mantém uma pausa fixa explícita, sem economia a mostrar.
+import logging
+import time
+
+import ui_driver
+
+class WaitTimeoutError(Exception):
+    """A condição não foi atendida dentro do prazo."""
+
+class SiteStats:
+    """Estatísticas acumuladas de um ponto de espera."""
+    def __init__(self, baseline=None, fixed=False):
+        self.baseline = baseline
+        # Pausa fixa (pause): não há condição, nem economia
+        self.fixed = fixed
+        self.count = 0
+        self.timeouts = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.polls = 0
+
+    def add(self, elapsed, polls, timed_out):
+        self.count += 1
+        self.polls += polls
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        if timed_out:
+            self.timeouts += 1
+
+    @property
+    def saved(self):
+        """Tempo economizado em relação à pausa fixa anterior (negativo se ficou mais lento)."""
+        if self.baseline is None or self.fixed:
+            return 0.0
+        return self.baseline * self.count - self.total_time
+
+class WaitEngine:
+    """
+    Consulta uma condição com backoff: começa em initial_interval e multiplica
+    o intervalo por backoff a cada tentativa, até max_interval, respeitando o prazo.
+    """
+    def __init__(self, initial_interval=0.02, max_interval=0.25, backoff=1.5, default_timeout=5.0):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.default_timeout = default_timeout
+        self.sites = {}
+        # Funções chamadas ao fim de cada espera: observer(site, condition, elapsed, met)
+        self.observers = []
+
+    def wait_until(self, condition, timeout=None, site=None, baseline=None, raise_on_timeout=False):
+        """
+        Espera condition() retornar verdadeiro. Retorna True se a condição foi
+        atendida e False no fim do prazo (ou levanta WaitTimeoutError, se pedido).
+        site identifica o ponto do fluxo nas estatísticas; baseline é a pausa fixa
+        (segundos) que o ponto usava antes, para calcular a economia.
+        Com um driver que limita as esperas (simulador), o prazo fica em driver.max_wait.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        driver = _session_driver()
+        if driver is not None and driver.max_wait is not None:
+            timeout = min(timeout, driver.max_wait)
+        start = time.perf_counter()
+        deadline = start + timeout
+        interval = self.initial_interval
+        polls = 0
+        while True:
+            polls += 1
+            if _safe_check(condition):
+                met = True
+                break
+            now = time.perf_counter()
+            if now >= deadline:
+                met = False
+                break
+            time.sleep(min(interval, deadline - now))
+            interval = min(interval * self.backoff, self.max_interval)
+
+        elapsed = time.perf_counter() - start
+        if site is not None:
+            stats = self.sites.setdefault(site, SiteStats(baseline))
+            stats.add(elapsed, polls, not met)
+        self._notify(site, condition, elapsed, met)
+        if not met:
+            message = f"Espera '{site or 'sem nome'}' não atendida em {timeout:.2f}s."
+            if raise_on_timeout:
+                raise WaitTimeoutError(message)
+            logging.warning(message)
+        return met
+
+    def pause(self, seconds, site):
+        """
+        Pausa fixa, para os pontos em que nada observável indica que a interface
+        terminou de processar as teclas. Aparece no resumo como pausa, sem economia.
+        Com um driver síncrono (simulador) não há o que esperar e a pausa é dispensada.
+        """
+        driver = _session_driver()
+        start = time.perf_counter()
+        if driver is None or not driver.synchronous:
+            time.sleep(seconds)
+        elapsed = time.perf_counter() - start
+        stats = self.sites.setdefault(site, SiteStats(fixed=True))
+        stats.add(elapsed, 0, False)
+        self._notify(site, None, elapsed, True)
+
+    def _notify(self, site, condition, elapsed, met):
+        for observer in self.observers:
+            observer(site, condition, elapsed, met)
+
+    def log_summary(self):
+        """Registra no log as estatísticas por ponto de espera, dos que mais economizaram aos que menos."""
+        if not self.sites:
+            return
+        logging.info("Esperas por condição (ponto | vezes | média | máx | timeouts | economia):")
+        total_saved = 0.0
+        for site, stats in sorted(self.sites.items(), key=lambda item: item[1].saved, reverse=True):
+            total_saved += stats.saved
+            if stats.fixed:
+                saved = 'pausa fixa'
+            else:
+                saved = f"{stats.saved:+.3f}s" if stats.baseline is not None else '-'
+            logging.info(
+                f"  {site} | {stats.count} | {stats.total_time / stats.count:.3f}s | "
+                f"{stats.max_time:.3f}s | {stats.timeouts} | {saved}"
+            )
+        logging.info(f"Economia total em relação às pausas fixas: {total_saved:.3f}s")
+
+    def reset(self):
+        """Zera as estatísticas: chamado no início de cada execução, para o resumo ser da execução."""
+        self.sites = {}
+
+def _session_driver():
+    try:
+        return ui_driver.get_driver()
+    except RuntimeError:
+        return None
+
+def _safe_check(condition):
+    # Janela fechando ou controle ainda não criado contam como "ainda não"
+    try:
+        return bool(condition())
+    except Exception:
+        return False
+
+# =============================================================================
+# CONDIÇÕES
+# Cada função recebe elementos do driver de interface (ui_driver) e devolve a
+# Condition consultada pelo wait_until. kind, element e args descrevem a
+# condição para o registro de sessões (session_trace), que a refaz na reprodução.
+# =============================================================================
+class Condition:
+    def __init__(self, kind, element, args, check):
+        self.kind = kind
+        self.element = element
+        self.args = args
+        self.check = check
+
+    def __call__(self):
+        return self.check()
+
+def window_visible(parent, name, criteria=None):
+    """O elemento selectors[name] (ou criteria) dentro de parent existe e está visível."""
+    return Condition('window_visible', parent, (name, criteria),
+                     lambda: ui_driver.get_driver().exists(parent, name, criteria))
+
+def control_focused(window, control=None):
+    """
+    Sem control: a janela está ativa (em primeiro plano, recebendo as teclas).
+    Com control: o controle indicado tem o foco do teclado.
+    """
+    if control is None:
+        return Condition('control_focused', window, (), lambda: ui_driver.get_driver().is_active(window))
+    return Condition('control_has_focus', control, (), lambda: ui_driver.get_driver().has_focus(control))
+
+def focused_text(window):
+    """Texto do controle que tem o foco na janela (None se não houver ou se a leitura falhar)."""
+    try:
+        return ui_driver.get_driver().focused_text(window)
+    except Exception as e:
+        logging.debug(f"Não foi possível ler o campo com foco: {e}")
+        return None
+
+def field_value_changed(window, initial, expected=None):
+    """
+    O texto do controle com foco mudou em relação a initial (ex.: após digitar ou
+    limpar). Com expected, também é atendida quando o campo já tem esse valor
+    (ex.: o código digitado é o mesmo que estava no campo).
+    """
+    def check():
+        text = ui_driver.get_driver().focused_text(window)
+        return text != initial or (expected is not None and text == expected)
+    return Condition('field_value_changed', window, (initial, expected), check)
+
+def field_equals(window, expected):
+    """O controle com foco mostra expected (ex.: o último valor digitado já chegou ao campo)."""
+    return Condition('field_equals', window, (expected,),
+                     lambda: ui_driver.get_driver().focused_text(window) == expected)
+
+def focused_control(window):
+    """Controle com o foco na janela (identificador opaco do driver; None se a leitura falhar)."""
+    # Importado aqui: session_trace importa este módulo
+    import session_trace
+    session_trace.mark_focus(window)
+    try:
+        return ui_driver.get_driver().focused_control(window)
+    except Exception as e:
+        logging.debug(f"Não foi possível identificar o controle com foco: {e}")
+        return None
+
+def focus_moved(window, initial):
+    """
+    O foco saiu do controle initial (obtido com focused_control antes das teclas):
+    o Guardian processou o ENTER/TAB e passou ao próximo campo, ou abriu um diálogo.
+    Na reprodução de sessões, initial é relido no mesmo ponto do fluxo (session_trace.mark_focus).
+    """
+    return Condition('focus_moved', window, (),
+                     lambda: ui_driver.get_driver().focused_control(window) != initial)
+
+# Condições que a reprodução de sessões sabe refazer a partir de (kind, element, args)
+CONDITIONS = {
+    'window_visible': window_visible,
+    'control_focused': control_focused,
+    'control_has_focus': lambda control: control_focused(None, control),
+    'field_value_changed': field_value_changed,
+    'field_equals': field_equals,
+}
+
+# =============================================================================
+# INSTÂNCIA DA SESSÃO
+# =============================================================================
+_engine = None
+
+def configure(wait_config=None):
+    """Cria o motor de esperas a partir da seção [Waits] do config.ini."""
+    global _engine
+    if wait_config is None:
+        _engine = WaitEngine()
+    else:
+        _engine = WaitEngine(
+            initial_interval=wait_config.getfloat('initial_interval', 0.02),
+            max_interval=wait_config.getfloat('max_interval', 0.25),
+            backoff=wait_config.getfloat('backoff', 1.5),
+            default_timeout=wait_config.getfloat('default_timeout', 5.0),
+        )
+    return _engine
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = WaitEngine()
+    return _engine
+
+def wait_until(condition, timeout=None, site=None, baseline=None, raise_on_timeout=False):
+    """Atalho para get_engine().wait_until(...)."""
+    return get_engine().wait_until(condition, timeout, site, baseline, raise_on_timeout)
+
+def pause(seconds, site):
+    """Atalho para get_engine().pause(...)."""
+    get_engine().pause(seconds, site)